@@ -1,6 +1,22 @@
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
 from enum import Enum, auto
+from functools import partial
+from itertools import islice, repeat
+import gc
+import io
+import json
+import mmap
 import re
-from typing import List
+import sys
+import time
+from collections import Counter, deque
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from ast_nodes import (Assign, Binary, Block, Boolean, CompoundExpr, Declare, For, If, Number, Program, Read,
+                       Unary, Variable, While, Write)
 
 
 # Состояния лексера
@@ -113,17 +129,473 @@ SEPARATORS = {
 }
 
 
+# Целочисленные коды LexType для всех слов и символов языка
+LEXEME_CODES = {
+    lexeme: lex_type.value
+    for table in (KEYWORDS, OPERATORS, SEPARATORS)
+    for lexeme, lex_type in table.items()
+}
+
+# Коды, с которыми парсер сравнивает текущий токен
+CODE_EOF = -1
+CODE_END = LexType.LEX_NULL.value
+CODE_PROGRAM = LexType.LEX_PROGRAM.value
+CODE_DIM = LexType.LEX_DIM.value
+CODE_AS = LexType.LEX_AS.value
+CODE_INTEGER = LexType.LEX_INTEGER.value
+CODE_REAL = LexType.LEX_REAL.value
+CODE_BOOLEAN = LexType.LEX_BOOLEAN.value
+CODE_IF = LexType.LEX_IF.value
+CODE_THEN = LexType.LEX_THEN.value
+CODE_ELSE = LexType.LEX_ELSE.value
+CODE_WHILE = LexType.LEX_WHILE.value
+CODE_DO = LexType.LEX_DO.value
+CODE_READ = LexType.LEX_READ.value
+CODE_WRITE = LexType.LEX_WRITE.value
+CODE_TRUE = LexType.LEX_TRUE.value
+CODE_FALSE = LexType.LEX_FALSE.value
+CODE_ID = LexType.LEX_ID.value
+CODE_NUM = LexType.LEX_NUM.value
+CODE_ASSIGN = LexType.LEX_ASSIGN.value
+CODE_NOT = LexType.LEX_NOT.value
+CODE_LPAREN = LexType.LEX_LPAREN.value
+CODE_RPAREN = LexType.LEX_RPAREN.value
+CODE_LBRACKET = LexType.LEX_LBRACKET.value
+CODE_RBRACKET = LexType.LEX_RBRACKET.value
+CODE_COLON = LexType.LEX_COLON.value
+CODE_COMMA = LexType.LEX_COMMA.value
+CODE_FOR = LexType.LEX_FOR.value
+CODE_TO = LexType.LEX_TO.value
+
+KEYWORD_CODES = frozenset(lex_type.value for lex_type in KEYWORDS.values())
+REL_CODES = frozenset(OPERATORS[op].value for op in ("EQ", "NE", "LT", "LE", "GT", "GE"))
+ADD_CODES = frozenset(OPERATORS[op].value for op in ("plus", "min", "or"))
+MUL_CODES = frozenset(OPERATORS[op].value for op in ("mult", "div", "and"))
+
+# Сила связывания бинарных операций для разбора выражений:
+# отношения < операции сложения < операции умножения, все левоассоциативны
+REL_POWER, ADD_POWER, MUL_POWER = 1, 2, 3
+BINDING_POWERS = {}
+BINDING_POWERS.update(dict.fromkeys(REL_CODES, REL_POWER))
+BINDING_POWERS.update(dict.fromkeys(ADD_CODES, ADD_POWER))
+BINDING_POWERS.update(dict.fromkeys(MUL_CODES, MUL_POWER))
+
+BLOCK_END_CODES = frozenset((CODE_END, CODE_ELSE, LexType.LEX_RBRACKET.value))
+
+# Виды кадров стека разбора операторов: тело без оператора (start_begin),
+# тела then и else условного оператора, тела циклов и составной оператор «[...]»
+FRAME_BODY, FRAME_THEN, FRAME_ELSE, FRAME_WHILE, FRAME_FOR, FRAME_BLOCK = range(6)
+# Кадры стека разбора выражения. Кадр бинарной операции начинается с её силы
+# связывания (больше нуля), остальные — с отрицательного вида: ~, «(» и «[»
+EXPR_NOT, EXPR_PAREN, EXPR_COMPOUND = -1, -2, -3
+
+# Типы переменных в описании dim
+VAR_TYPES = {CODE_INTEGER: "INT", CODE_REAL: "REAL", CODE_BOOLEAN: "BOOL"}
+NUMERIC_TYPES = frozenset(("INT", "REAL"))
+# Тип выражения, ошибка в котором уже записана в режиме восстановления: проверки типов его пропускают
+ERROR_TYPE = "ERROR"
+
+# Лексема операции по её коду (для сообщений об ошибках)
+CODE_LEXEMES = {code: lexeme for lexeme, code in LEXEME_CODES.items()}
+
+ARITHMETIC_CODES = frozenset(OPERATORS[op].value for op in ("plus", "min", "mult", "div"))
+LOGIC_CODES = frozenset(OPERATORS[op].value for op in ("or", "and"))
+EQUALITY_CODES = frozenset(OPERATORS[op].value for op in ("EQ", "NE"))
+
+# Строковая категория токена (поле Token.type) по его коду
+CODE_CATEGORIES = {CODE_ID: "IDENTIFIER", CODE_NUM: "NUMBER"}
+CODE_CATEGORIES.update((lex_type.value, "SEPARATOR") for lex_type in SEPARATORS.values())
+CODE_CATEGORIES.update((lex_type.value, "OPERATOR") for lex_type in OPERATORS.values())
+CODE_CATEGORIES.update((lex_type.value, "KEYWORD") for lex_type in KEYWORDS.values())
+
+# Границы операторов, до которых парсер в режиме восстановления пропускает токены ошибочной строки
+SYNC_CODES = frozenset((CODE_COLON, CODE_END, CODE_ELSE, CODE_DO, CODE_THEN, CODE_RBRACKET))
+
+# Коды диагностик по тексту сообщения (для лексических ошибок — по части до двоеточия)
+DIAGNOSTIC_CODES = {
+    "Invalid character": "L001",
+    "Invalid number": "L002",
+    "Unclosed comment": "L003",
+    "The program must start with the keyword 'program'": "P001",
+    "Expected program name after 'program'": "P002",
+    "Program must end with 'end'": "P003",
+    "Unexpected end of tokens": "P004",
+    "Expected 'as' after variable name": "P005",
+    "Expected variable type": "P006",
+    "Unknown variable type": "P007",
+    "Expected an identifier": "P008",
+    "Duplicate declaration": "P009",
+    "Unexpected keyword": "P010",
+    "Incorrect input": "P011",
+    "Expected assignment '='": "P012",
+    "Type mismatch in assignment": "P013",
+    "Expected closing ']' for compound statement": "P014",
+    "Condition must be boolean": "P015",
+    "Missing 'then' in if statement": "P016",
+    "Missing 'end' in if statement": "P017",
+    "Missing 'do' in while loop": "P018",
+    "Missing 'end' in while loop": "P019",
+    "Expected loop variable after 'for'": "P020",
+    "Loop variable must be integer": "P021",
+    "Missing 'to' in for loop": "P022",
+    "Missing 'do' in for loop": "P023",
+    "Missing 'end' in for loop": "P024",
+    "Expected a numeric expression": "P025",
+    "Expected closing parenthesis": "P026",
+    "Expected identifier after 'read'": "P027",
+    "Operand types do not match the operation": "P028",
+    "Operand of '~' must be boolean": "P029",
+    "Unexpected token": "P030",
+    "Undeclared or incorrect variable": "P031",
+    "Expected a number": "P032",
+    "Expected closing ']' for compound expression": "P033",
+    "Expected '[' to start a compound expression": "P034",
+    # Предупреждения анализа потока данных (dataflow.py)
+    "Variable is used before assignment": "W001",
+    "Variable may be used before assignment": "W002",
+    "Variable is never used": "W003",
+    "Assigned value is never used": "W004",
+}
+
+
+def binary_type(op: int, left: str, right: str) -> Optional[str]:
+    """
+    Тип результата бинарной операции или None, если операнды ей не подходят.
+    Арифметика над integer даёт integer (div — деление нацело), при участии real — real;
+    and/or определены только для boolean; отношения сравнивают числа,
+    а логические значения — только на равенство.
+    """
+    if op in ARITHMETIC_CODES:
+        if left in NUMERIC_TYPES and right in NUMERIC_TYPES:
+            return "INT" if left == right == "INT" else "REAL"
+        return None
+    if op in LOGIC_CODES:
+        return "BOOL" if left == right == "BOOL" else None
+    if left in NUMERIC_TYPES and right in NUMERIC_TYPES:
+        return "BOOL"
+    if left == right == "BOOL" and op in EQUALITY_CODES:
+        return "BOOL"
+    return None
+
+
+# Типы результатов binary_type для всех сочетаний операции и типов операндов;
+# сочетания, которым операция не подходит, в таблицу не входят
+BINARY_TYPES = {
+    (op, left, right): result
+    for op in BINDING_POWERS for left in ("INT", "REAL", "BOOL") for right in ("INT", "REAL", "BOOL")
+    for result in (binary_type(op, left, right),) if result is not None
+}
+
+
+def assignable(target: str, value: str) -> bool:
+    """Числа присваиваются друг другу с преобразованием типа, boolean — только boolean."""
+    return target == value or (target in NUMERIC_TYPES and value in NUMERIC_TYPES)
+
+
+def token_code(type_: str, value: str) -> int:
+    """Определяет код LexType по строковой категории и значению токена."""
+    if type_ == "IDENTIFIER":
+        return CODE_ID
+    if type_ == "NUMBER":
+        return CODE_NUM
+    return LEXEME_CODES.get(value, CODE_EOF)
+
+
+# Шаблон слова: идентификатора, ключевого слова или словесной операции
+WORD_PATTERN = re.compile(r"[^\W\d_]\w*")
+
+# Виды чисел. Лексема целиком подходит не более чем под один вид: «1b» двоичное,
+# «1bh» шестнадцатеричное, «1e5» действительное; знак + или - допускается только
+# в порядке действительного числа. Порядок альтернатив выбран по частоте
+NUMBER_FORMS = (
+    ("decimal", r"[0-9]+[Dd]?"),
+    ("real", r"[0-9]*\.[0-9]+(?:[Ee][+-]?[0-9]+)?|[0-9]+[Ee][+-]?[0-9]+"),
+    ("hexadecimal", r"[0-9][0-9A-Fa-f]*[Hh]"),
+    ("binary", r"[01]+[Bb]"),
+    ("octal", r"[0-7]+[Oo]"),
+)
+NUMBER_KINDS = frozenset(kind for kind, _ in NUMBER_FORMS)
+
+# Классификатор числа: имя сработавшей группы и есть вид числа
+NUMBER_PATTERN = re.compile("|".join(f"(?P<{kind}>{form})" for kind, form in NUMBER_FORMS))
+
+# Числовая лексема в байтовом буфере: те же виды, что в NUMBER_FORMS, или ошибочное число
+BYTE_NUMBER_PATTERN = re.compile(
+    ("(?:" + "|".join(f"(?P<{kind}>{form})" for kind, form in NUMBER_FORMS) + r")(?![A-Za-z0-9_.])"
+     r"|(?P<BADNUM>[0-9.][A-Za-z0-9_.]*)").encode("ascii"))
+BYTE_WORD_TAIL = re.compile(rb"[A-Za-z0-9_]*")
+NEWLINE_PATTERN = re.compile(rb"\n")
+LONE_CR_PATTERN = re.compile(rb"\r(?!\n)")
+NON_ASCII_PATTERN = re.compile(rb"[\x80-\xff]")
+
+# Классы байтов в таблице лексера байтового буфера
+BYTE_OTHER, BYTE_SPACE, BYTE_WORD, BYTE_DIGIT, BYTE_SYMBOL, BYTE_COMMENT, BYTE_WIDE = range(7)
+# Пробельные символы ASCII — те же, что \s в шаблоне лексера по str
+SPACE_BYTES = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+
+# Предел кэша уже разобранных чисел, чтобы память не росла в потоковом режиме
+NUMBER_CACHE_SIZE = 4096
+
+NumberValue = Union[int, float]
+
+# Вид и значение, которые в режиме восстановления получает ошибочное число
+ERROR_NUMBER = ("decimal", 0)
+
+
+def decode_number(kind: str, lexeme: str) -> NumberValue:
+    """Вычисляет значение числа уже известного вида."""
+    if kind == "decimal":
+        return int(lexeme.rstrip("Dd"))
+    if kind == "real":
+        return float(lexeme)
+    if kind == "hexadecimal":
+        return int(lexeme[:-1], 16)
+    if kind == "binary":
+        return int(lexeme[:-1], 2)
+    return int(lexeme[:-1], 8)
+
+
+def classify_number(lexeme: str) -> Optional[Tuple[str, NumberValue]]:
+    """Возвращает вид и значение числа или None, если лексема не является числом."""
+    match = NUMBER_PATTERN.fullmatch(lexeme)
+    if match is None:
+        return None
+    return match.lastgroup, decode_number(match.lastgroup, lexeme)
+
+
 class Token:
-    def __init__(self, type_: str, value: str, x_coord: int, y_coord: int):
+    __slots__ = ("type", "value", "x_coord", "y_coord", "code", "sym", "number")
+
+    def __init__(self, type_: str, value: str, x_coord: int, y_coord: int,
+                 code: Optional[int] = None, sym: Optional[int] = None,
+                 number: Optional[Tuple[str, NumberValue]] = None):
         self.type = type_
         self.value = value
         self.x_coord = x_coord
         self.y_coord = y_coord
+        self.code = token_code(type_, value) if code is None else code
+        self.sym = sym  # Номер идентификатора в таблице имён лексера
+        if number is None and type_ == "NUMBER":
+            number = classify_number(value)
+        self.number = number  # Вид и значение числа
+
+    def __repr__(self):
+        return f"Token(type={self.type}, value={self.value}, x={self.x_coord}, y={self.y_coord})"
+
+
+# Токен конца текста для сообщений об ошибках
+EOF_TOKEN = Token("", "", 0, 0)
+
+
+class TokenView:
+    """Совместимое с Token представление записи TokenStore; значение вычисляется срезом при обращении."""
+    __slots__ = ("store", "index")
+
+    def __init__(self, store: "TokenStore", index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def code(self) -> int:
+        return self.store.codes[self.index]
+
+    @property
+    def type(self) -> str:
+        return CODE_CATEGORIES[self.store.codes[self.index]]
+
+    @property
+    def value(self) -> str:
+        return self.store.value(self.index)
+
+    @property
+    def x_coord(self) -> int:
+        return self.store.column(self.index)
+
+    @property
+    def y_coord(self) -> int:
+        return self.store.lines[self.index]
+
+    @property
+    def sym(self) -> Optional[int]:
+        return self.store.refs[self.index] if self.store.codes[self.index] == CODE_ID else None
+
+    @property
+    def number(self) -> Optional[Tuple[str, NumberValue]]:
+        return self.store.numbers[self.store.refs[self.index]] if self.store.codes[self.index] == CODE_NUM else None
 
     def __repr__(self):
         return f"Token(type={self.type}, value={self.value}, x={self.x_coord}, y={self.y_coord})"
 
 
+class TokenStore:
+    """
+    Колоночное хранилище токенов: параллельные массивы кода LexType,
+    смещений начала и конца лексемы в исходном тексте, номера строки и
+    ссылки (номера идентификатора в таблице имён или номера числа в пуле
+    разобранных чисел). Значения токенов не копируются,
+    а берутся срезом source при обращении; столбец вычисляется по индексу
+    начал строк.
+    """
+
+    def __init__(self, source: str = "", names: Optional[List[str]] = None):
+        self.source = source
+        self.names = [] if names is None else names
+        self.codes = array("B")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.lines = array("I")
+        self.refs = array("I")
+        self.line_starts = array("I")
+        self.numbers = []  # Пул разобранных чисел: (вид, значение)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> TokenView:
+        if index < 0:
+            index += len(self.codes)
+        if not 0 <= index < len(self.codes):
+            raise IndexError("token index out of range")
+        return TokenView(self, index)
+
+    def __iter__(self) -> Iterator[TokenView]:
+        for index in range(len(self.codes)):
+            yield TokenView(self, index)
+
+    def value(self, index: int) -> str:
+        return self.source[self.starts[index]:self.ends[index]]
+
+    def column(self, index: int) -> int:
+        return self.starts[index] - self.line_starts[self.lines[index] - 1] + 1
+
+    def to_tokens(self) -> List[Token]:
+        """Материализует хранилище в список обычных объектов Token."""
+        source = self.source
+        line_starts = self.line_starts
+        numbers = self.numbers
+        return [
+            Token(CODE_CATEGORIES[code], source[start:end], start - line_starts[line - 1] + 1, line, code,
+                  ref if code == CODE_ID else None, numbers[ref] if code == CODE_NUM else None)
+            for code, start, end, line, ref in zip(self.codes, self.starts, self.ends, self.lines, self.refs)
+        ]
+
+    def cursor(self) -> "StoreStream":
+        return StoreStream(self)
+
+    def close(self) -> None:
+        """Текст хранится в str, освобождать нечего; есть для единообразия с ByteTokenStore."""
+
+
+class ByteTokenStore(TokenStore):
+    """
+    TokenStore по байтовому буферу (bytes или mmap), заполняемый Lexer.tokenize_bytes.
+    starts и ends — смещения в байтах. Номера строк токенов при лексическом анализе
+    не записываются: массив lines вычисляется двоичным поиском по line_starts
+    при первом обращении. Столбец считается в байтах, а в строках из wide_lines,
+    где перед токеном может стоять комментарий с не-ASCII символами, — в символах.
+    """
+
+    def __init__(self, source=b"", names: Optional[List[str]] = None):
+        super().__init__(source, names)
+        self._lines = None
+        self.wide_lines = set()  # Строки, в которых заканчивается комментарий с не-ASCII символами
+
+    @property
+    def lines(self) -> array:
+        if self._lines is None:
+            # Смещения starts возрастают: на строку один двоичный поиск её конца, а не на каждый токен
+            lines = array("I")
+            previous = 0
+            bounds = map(partial(bisect_left, self.starts), islice(self.line_starts, 1, None))
+            for line, bound in enumerate(bounds, 1):
+                lines.extend(repeat(line, bound - previous))
+                previous = bound
+            lines.extend(repeat(len(self.line_starts), len(self.starts) - previous))
+            self._lines = lines
+        return self._lines
+
+    @lines.setter
+    def lines(self, value: array) -> None:
+        self._lines = value
+
+    def index_lines(self, start: int = 0, end: Optional[int] = None) -> None:
+        """Строит индекс начал строк байтов [start, end) буфера одним проходом."""
+        source = self.source
+        if end is None:
+            end = len(source)
+        line_starts = array("I", [start] if end > start else [])
+        line_starts.extend(map(re.Match.end, NEWLINE_PATTERN.finditer(source, start, end)))
+        if line_starts and line_starts[-1] == end:
+            line_starts.pop()  # Перевод строки в конце текста не начинает новую строку
+        self.line_starts = line_starts
+
+    def locate(self, offset: int) -> Tuple[int, int]:
+        """Строка и столбец байта со смещением offset."""
+        line = bisect_right(self.line_starts, offset)
+        line_start = self.line_starts[line - 1]
+        if line in self.wide_lines:
+            return line, len(self.source[line_start:offset].decode("utf-8", "replace")) + 1
+        return line, offset - line_start + 1
+
+    def value(self, index: int) -> str:
+        if self.codes[index] == CODE_ID:
+            return self.names[self.refs[index]]
+        return self.source[self.starts[index]:self.ends[index]].decode("ascii")
+
+    def column(self, index: int) -> int:
+        line = self.lines[index]
+        start = self.starts[index]
+        if line in self.wide_lines:
+            return self.locate(start)[1]
+        return start - self.line_starts[line - 1] + 1
+
+    def to_tokens(self) -> List[Token]:
+        lines = self.lines
+        numbers = self.numbers
+        return [
+            Token(CODE_CATEGORIES[code], self.value(index), self.column(index), lines[index], code,
+                  ref if code == CODE_ID else None, numbers[ref] if code == CODE_NUM else None)
+            for index, (code, ref) in enumerate(zip(self.codes, self.refs))
+        ]
+
+    def cursor(self) -> "StoreStream":
+        return ByteStoreStream(self)
+
+    def close(self) -> None:
+        """Закрывает отображение файла в память; имена идентификаторов остаются доступны."""
+        if isinstance(self.source, mmap.mmap):
+            self.source.close()
+
+
+def decode_lines(data) -> List[str]:
+    """Строки байтового текста в UTF-8 так же, как их вернул бы readlines() файла, открытого как текст."""
+    return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8").readlines()
+
+
+class Diagnostic:
+    """
+    Ошибка, собранная в режиме восстановления, или предупреждение анализа потока
+    данных: код, сообщение, позиция и вид (lexical, syntax или dataflow).
+    """
+    __slots__ = ("code", "message", "line", "col", "kind")
+
+    def __init__(self, message: str, line: int, col: int, kind: str):
+        self.code = DIAGNOSTIC_CODES.get(message.partition(":")[0], "E000")
+        self.message = message
+        self.line = line
+        self.col = col
+        self.kind = kind
+
+    def to_dict(self) -> dict:
+        return {"code": self.code, "message": self.message, "line": self.line, "col": self.col, "kind": self.kind}
+
+    def __str__(self):
+        return f"{self.line}:{self.col}: {self.code} {self.message}"
+
+    def __repr__(self):
+        return f"Diagnostic({self.code}, {self.message!r}, line={self.line}, col={self.col})"
+
+
 class Lexer:
     def __init__(self, keywords: List[str], separators: List[str], operators: List[str]):
         self.tokens = []
@@ -133,153 +605,435 @@ class Lexer:
         self.operators = operators
         self.x_coord = 0
         self.y_coord = 0
-        self.lex_buff = ""
         self.state = State.S  # Инициализируем состояние как элемент перечисления State
+        self.comment_start = (0, 0)  # Строка и столбец открывающей скобки последнего незакрытого комментария
+        self.numbers = {}  # Кэш разобранных чисел: лексема -> (вид, значение)
+        self.name_ids = {}  # Таблица имён: идентификатор -> номер
+        self.names = []  # Номер -> идентификатор
+        self.diagnostics = None  # Список для ошибок в режиме восстановления; None — ошибка прерывает анализ
+        self.build_tables()
+
+    def intern(self, name: str) -> int:
+        """Возвращает номер идентификатора, добавляя его в таблицу имён при первой встрече."""
+        sym = self.name_ids.get(name)
+        if sym is None:
+            sym = len(self.names)
+            self.name_ids[name] = sym
+            self.names.append(name)
+        return sym
+
+    def build_tables(self) -> None:
+        """
+        Строит таблицы сканера один раз при создании лексера.
+        Слова (ключевые слова и словесные операции) распознаются общим шаблоном
+        идентификатора и классифицируются по словарю, символьные операции и
+        разделители входят в общий регулярный шаблон как альтернативы.
+        """
+        self.word_types = {}
+        self.byte_words = {}  # Слова как байты -> код LexType, для tokenize_bytes
+        symbol_ops = []
+        for op in self.operators:
+            if WORD_PATTERN.fullmatch(op):
+                self.word_types[op] = ("OPERATOR", LEXEME_CODES.get(op, CODE_ID))
+            else:
+                symbol_ops.append(op)
+        for kw in self.keywords:
+            self.word_types[kw] = ("KEYWORD", LEXEME_CODES.get(kw, CODE_ID))
+        for word, (_, code) in self.word_types.items():
+            if word.isascii():
+                self.byte_words[word.encode("ascii")] = code
+
+        # Более длинные операции проверяются раньше более коротких
+        symbol_ops.sort(key=len, reverse=True)
+        alternatives = [
+            r"(?P<COM>\{[^}]*\}?)",
+            rf"(?P<ID>{WORD_PATTERN.pattern})",
+            # Число должно заканчиваться на границе слова, иначе это ошибочная лексема
+            "(?:" + "|".join(f"(?P<{kind}>{form})" for kind, form in NUMBER_FORMS) + r")(?![\w.])",
+            r"(?P<BADNUM>[0-9.][\w.]*)",
+        ]
+        if symbol_ops:
+            alternatives.append("(?P<OP>" + "|".join(re.escape(op) for op in symbol_ops) + ")")
+        if self.separators:
+            alternatives.append("(?P<SEP>" + "|".join(re.escape(sep) for sep in self.separators) + ")")
+        alternatives.append(r"(?P<ERR>\S)")
+        # Пробельные символы пропускаются целиком перед каждой лексемой
+        self.master_pattern = re.compile(r"\s*(?:" + "|".join(alternatives) + ")")
+        self.build_byte_tables(symbol_ops)
+
+    def build_byte_tables(self, symbol_ops: List[str]) -> None:
+        """
+        Таблицы на 256 элементов для tokenize_bytes: класс каждого байта и код
+        односимвольной операции или разделителя. Если среди них есть
+        многосимвольные, байтовый путь не используется (byte_classes = None).
+        """
+        self.byte_names = {}  # Идентификатор как байты -> номер в таблице имён
+        symbols = list(symbol_ops) + list(self.separators)
+        if any(len(symbol) != 1 or not symbol.isascii() for symbol in symbols):
+            self.byte_classes = None
+            return
+        classes = bytearray(256)  # BYTE_OTHER по умолчанию
+        self.byte_codes = [CODE_EOF] * 256
+        for byte in range(128, 256):
+            classes[byte] = BYTE_WIDE
+        for byte in SPACE_BYTES:
+            classes[byte] = BYTE_SPACE
+        for byte in b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz":
+            classes[byte] = BYTE_WORD
+        for byte in b"0123456789.":
+            classes[byte] = BYTE_DIGIT
+        for symbol in symbols:
+            classes[ord(symbol)] = BYTE_SYMBOL
+            self.byte_codes[ord(symbol)] = LEXEME_CODES[symbol]
+        classes[ord("{")] = BYTE_COMMENT
+        self.byte_classes = bytes(classes)
 
     def read_file(self, filename: str):
         with open(filename, "r") as f:
             self.input_lines = f.readlines()
-        print(f"Содержимое файла '{filename}':")
-        for line in self.input_lines:
-            print(line.rstrip())
 
     def tokenize(self, lines: List[str]) -> List[Token]:
         self.tokens = []
         self.y_coord = 0
+        self.state = State.S
         for line in lines:
             self.process_line(line)
+        if self.state == State.COM:
+            self.unclosed_comment()
         return self.tokens
 
-    def process_line(self, line: str) -> None:
+    def iter_tokens(self, lines: Iterable[str]) -> Iterator[Token]:
+        """
+        Лениво выдаёт токены по мере чтения строк, не накапливая их в self.tokens.
+        Состояние многострочного комментария сохраняется между строками.
+        """
+        self.y_coord = 0
+        self.state = State.S
+        line_tokens = []
+        for line in lines:
+            self.process_line(line, line_tokens)
+            yield from line_tokens
+            line_tokens.clear()
+        if self.state == State.COM:
+            self.unclosed_comment()
+
+    def lex_line(self, line: str, y_coord: int, state: State) -> Tuple[List[Token], State]:
+        """
+        Лексический анализ одной строки с номером y_coord, начиная с состояния state
+        (S или внутри многострочного комментария). Возвращает токены строки
+        и состояние в её конце.
+        """
+        tokens = []
+        self.y_coord = y_coord - 1
+        self.state = state
+        self.process_line(line, tokens)
+        return tokens, self.state
+
+    def stream_file(self, filename: str) -> Iterator[Token]:
+        """Потоковый режим: токены читаются из файла построчно, без readlines()."""
+        with open(filename, "r") as f:
+            yield from self.iter_tokens(f)
+
+    def process_line(self, line: str, tokens: Optional[List[Token]] = None) -> None:
         self.y_coord += 1
-        print(f"Обработка строки {self.y_coord}: {line.strip()}")
-        self.x_coord = 0  # Сбрасываем координату x в начале каждой строки
-        i = 0
-        while i < len(line):
-            c = line[i]
-            self.x_coord = i + 1
-            self.process_char(c)
-            i += 1
-        self.finalize_token()
-        print(f"Текущие токены после строки {self.y_coord}: {self.tokens}")
-
-    def process_char(self, c: str) -> None:
-        print(f"Обработка символа: {c}, Текущее состояние: {self.state}")
-
-        if self.state == State.S:
-            if c.isspace():
+        y_coord = self.y_coord
+        if tokens is None:
+            tokens = self.tokens
+        word_types = self.word_types
+        numbers = self.numbers
+        name_ids = self.name_ids
+        pos = 0
+        if self.state == State.COM:
+            # Продолжение многострочного комментария с предыдущей строки
+            pos = line.find("}") + 1
+            if not pos:
                 return
-            elif c.isalpha():
-                self.start_token(c, State.ID)
-            elif c.isdigit():
-                self.start_token(c, State.NUM)
-            elif c == ".":
-                # Начало дробного числа
-                self.start_token(c, State.NUM)
-            elif c == "{":
-                self.start_token(c, State.COM)
-            elif c in self.operators:
-                if c == "~":  # Если это унарная операция
-                    self.start_token(c, State.OP)
-                    self.finalize_token()
+            self.state = State.S
+
+        for match in self.master_pattern.finditer(line, pos):
+            kind = match.lastgroup
+            start = match.start(kind)
+            lexeme = match.group(kind)
+            if kind == "ID":
+                info = word_types.get(lexeme)
+                if info is None:
+                    sym = name_ids.get(lexeme)
+                    if sym is None:
+                        sym = self.intern(lexeme)
+                    tokens.append(Token("IDENTIFIER", self.names[sym], start + 1, y_coord, CODE_ID, sym))
                 else:
-                    self.start_token(c, State.ID)
-            elif c in self.separators:
-                self.start_token(c, State.SEP)
-                self.finalize_token()
+                    tokens.append(Token(info[0], lexeme, start + 1, y_coord, info[1]))
+            elif kind == "COM":
+                if lexeme[-1] != "}":
+                    self.state = State.COM
+                    self.comment_start = (y_coord, start + 1)
+            elif kind in NUMBER_KINDS:
+                number = numbers.get(lexeme)
+                if number is None:
+                    number = self.decode(kind, lexeme)
+                tokens.append(Token("NUMBER", lexeme, start + 1, y_coord, CODE_NUM, None, number))
+            elif kind == "OP":
+                tokens.append(Token("OPERATOR", lexeme, start + 1, y_coord, LEXEME_CODES[lexeme]))
+            elif kind == "SEP":
+                tokens.append(Token("SEPARATOR", lexeme, start + 1, y_coord, LEXEME_CODES[lexeme]))
+            elif kind == "BADNUM":
+                self.x_coord = start + 1
+                self.error(f"Invalid number: {lexeme}")
+                # Режим восстановления: ошибочное число остаётся токеном с нулевым значением,
+                # чтобы разбор выражения с ним не давал лишних синтаксических ошибок
+                tokens.append(Token("NUMBER", lexeme, start + 1, y_coord, CODE_NUM, None, ERROR_NUMBER))
             else:
-                self.error(f"Invalid character: {c}")
-        elif self.state == State.ID:
-            if c.isalnum() or c == '_':
-                self.lex_buff += c
-            else:
-                self.finalize_token()
-                self.process_char(c)
-        elif self.state == State.NUM:
-            if self.is_number_part(c):
-                self.lex_buff += c
-            else:
-                self.finalize_token()
-                self.process_char(c)
-        elif self.state == State.COM:
-            if c == '}':
-                # Завершение комментария
-                self.finalize_comment()
-            else:
-                self.lex_buff += c
-        elif self.state == State.OP:
-            if self.lex_buff + c in self.operators:
-                self.lex_buff += c
-                self.finalize_token()
-            else:
-                self.finalize_token()
-                self.process_char(c)
-        elif self.state == State.SEP:
-            self.error("Invalid state in separator processing")
-        else:
-            self.error(f"Unknown state: {self.state}")
+                self.x_coord = start + 1
+                self.error(f"Invalid character: {lexeme}")
 
-    def finalize_comment(self) -> None:
-        print(f"Комментарий завершен: {self.lex_buff}")
-        self.lex_buff = ""
+    def tokenize_store(self, lines: List[str]) -> TokenStore:
+        """
+        Лексический анализ в колоночное хранилище TokenStore вместо списка Token.
+        Строки склеиваются в один буфер, токены хранят смещения в нём.
+        """
+        source = "".join(lines)
+        store = TokenStore(source, self.names)
+        add_code = store.codes.append
+        add_start = store.starts.append
+        add_end = store.ends.append
+        add_line = store.lines.append
+        add_ref = store.refs.append
+        add_line_start = store.line_starts.append
+        word_types = self.word_types
+        numbers = self.numbers
+        number_refs = {}  # Лексема -> номер в пуле чисел хранилища
+        name_ids = self.name_ids
+        finditer = self.master_pattern.finditer
+        self.y_coord = 0
         self.state = State.S
-
-    def is_number_part(self, c: str) -> bool:
-        """Проверяет, может ли символ быть частью числа (целого или действительного)."""
-        return c.isdigit() or c in {'B', 'b', 'O', 'o', 'D', 'd', 'H', 'h', '.', 'E', 'e', '+', '-'}
-
-    def start_token(self, c: str, new_state: State) -> None:
-        self.lex_buff = c
-        self.state = new_state
-
-    def finalize_token(self) -> None:
-        if not self.lex_buff:
-            return
-        print(f"Финализация токена: {self.lex_buff} (State: {self.state})")
-        token_type = None
-        if self.state == State.ID:
-            if self.lex_buff in self.keywords:
-                token_type = "KEYWORD"
-            elif self.lex_buff in self.operators:
-                token_type = "OPERATOR"
-            else:
-                token_type = "IDENTIFIER"
-        elif self.state == State.NUM and self.is_valid_number(self.lex_buff):
-            token_type = "NUMBER"
-        elif self.state == State.COM:
-            token_type = "COMMENT"
-        elif self.state == State.OP:
-            if self.lex_buff in self.operators:
-                token_type = "OPERATOR"
-            else:
-                self.error(f"Invalid operator: {self.lex_buff}")
-        elif self.state == State.SEP:
-            if self.lex_buff in self.separators:
-                token_type = "SEPARATOR"
-            else:
-                self.error(f"Invalid separator: {self.lex_buff}")
-        else:
-            self.error(f"Invalid token: {self.lex_buff}")
-
-        self.tokens.append(Token(token_type, self.lex_buff, self.x_coord - len(self.lex_buff) + 1, self.y_coord))
-        self.lex_buff = ""
+        line_start = 0
+        for line in lines:
+            self.y_coord += 1
+            y_coord = self.y_coord
+            add_line_start(line_start)
+            line_end = line_start + len(line)
+            pos = line_start
+            if self.state == State.COM:
+                pos = source.find("}", line_start, line_end) + 1
+                if not pos:
+                    line_start = line_end
+                    continue
+                self.state = State.S
+
+            for match in finditer(source, pos, line_end):
+                kind = match.lastgroup
+                start, end = match.span(kind)
+                ref = 0
+                if kind == "ID":
+                    lexeme = source[start:end]
+                    info = word_types.get(lexeme)
+                    if info is None:
+                        code = CODE_ID
+                        ref = name_ids.get(lexeme)
+                        if ref is None:
+                            ref = self.intern(lexeme)
+                    else:
+                        code = info[1]
+                elif kind == "COM":
+                    if source[end - 1] != "}":
+                        self.state = State.COM
+                        self.comment_start = (y_coord, start - line_start + 1)
+                    continue
+                elif kind in NUMBER_KINDS:
+                    lexeme = source[start:end]
+                    ref = number_refs.get(lexeme)
+                    if ref is None:
+                        number = numbers.get(lexeme)
+                        if number is None:
+                            number = self.decode(kind, lexeme)
+                        ref = number_refs[lexeme] = len(store.numbers)
+                        store.numbers.append(number)
+                    code = CODE_NUM
+                elif kind == "OP" or kind == "SEP":
+                    code = LEXEME_CODES[source[start:end]]
+                elif kind == "BADNUM":
+                    self.x_coord = start - line_start + 1
+                    self.error(f"Invalid number: {source[start:end]}")
+                    code = CODE_NUM  # Режим восстановления: токен числа с нулевым значением
+                    ref = len(store.numbers)
+                    store.numbers.append(ERROR_NUMBER)
+                else:
+                    self.x_coord = start - line_start + 1
+                    self.error(f"Invalid character: {source[start:end]}")
+                    continue  # Режим восстановления: символ пропускается
+                add_code(code)
+                add_start(start)
+                add_end(end)
+                add_line(y_coord)
+                add_ref(ref)
+            line_start = line_end
+        if self.state == State.COM:
+            self.unclosed_comment()
+        return store
+
+    def tokenize_file(self, filename: str) -> TokenStore:
+        """
+        Лексический анализ файла, отображённого в память: текст не читается в str
+        и не копируется. Хранилище ссылается на отображение, пока не вызван close();
+        если файл пришлось декодировать (не-ASCII вне комментариев, одиночный CR),
+        возвращается TokenStore по тексту, и close() у него ничего не делает.
+        """
+        with open(filename, "rb") as file:
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Пустой файл отобразить нельзя
+                data = b""
+        store = self.tokenize_bytes(data)
+        if store.source is not data and isinstance(data, mmap.mmap):
+            data.close()
+        return store
+
+    def tokenize_bytes(self, data, start: int = 0, end: Optional[int] = None) -> TokenStore:
+        """
+        Лексический анализ байтового буфера (bytes или mmap) с текстом в ASCII.
+        Класс байта берётся из таблицы byte_classes, в str декодируются только
+        идентификаторы и числа, причём каждая различная лексема один раз.
+        В комментариях допускаются любые байты; не-ASCII символ вне комментария
+        или одиночный CR (перевод строки в текстовом режиме) переводят анализ
+        на tokenize_store по декодированному тексту, с тем же результатом.
+        start и end ограничивают анализ частью буфера, которая начинается со
+        строки вне комментария: смещения токенов отсчитываются от начала
+        буфера, а строки — от start.
+        """
+        if end is None:
+            end = len(data)
+        if self.byte_classes is None or LONE_CR_PATTERN.search(data, start, end):
+            return self.tokenize_store(decode_lines(data[start:end]))
+        store = ByteTokenStore(data, self.names)
+        store.index_lines(start, end)
+        add_code = store.codes.append
+        add_start = store.starts.append
+        add_end = store.ends.append
+        add_ref = store.refs.append
+        classes = self.byte_classes
+        byte_codes = self.byte_codes
+        byte_words = self.byte_words
+        byte_names = self.byte_names
+        numbers = self.numbers
+        number_refs = {}  # Лексема -> номер в пуле чисел хранилища
+        word_tail = BYTE_WORD_TAIL.match
+        number_match = BYTE_NUMBER_PATTERN.match
+        find = data.find
+        mark = (len(self.names), len(self.diagnostics) if self.diagnostics is not None else 0)
         self.state = State.S
-        print(f"Токен добавлен: {self.tokens[-1]}")
+        pos = start
+        size = end
+        while pos < size:
+            byte_class = classes[data[pos]]
+            if byte_class == BYTE_SPACE:
+                pos += 1
+                continue
+            ref = 0
+            if byte_class == BYTE_WORD:
+                end = word_tail(data, pos + 1, size).end()
+                lexeme = data[pos:end]
+                code = byte_words.get(lexeme)
+                if code is None:
+                    code = CODE_ID
+                    ref = byte_names.get(lexeme)
+                    if ref is None:
+                        ref = byte_names[lexeme] = self.intern(lexeme.decode("ascii"))
+            elif byte_class == BYTE_SYMBOL:
+                end = pos + 1
+                code = byte_codes[data[pos]]
+            elif byte_class == BYTE_DIGIT:
+                match = number_match(data, pos, size)
+                end = match.end()
+                lexeme = data[pos:end]
+                ref = number_refs.get(lexeme)
+                if ref is None:
+                    kind = match.lastgroup
+                    ref = len(store.numbers)
+                    if kind == "BADNUM":
+                        if end < size and data[end] >= 0x80:
+                            return self.restart_decoded(data[start:size], mark)  # Лексема продолжается не-ASCII буквой
+                        self.y_coord, self.x_coord = store.locate(pos)
+                        self.error(f"Invalid number: {lexeme.decode('ascii')}")
+                        store.numbers.append(ERROR_NUMBER)  # Режим восстановления: токен числа с нулевым значением
+                    else:
+                        text = lexeme.decode("ascii")
+                        number = numbers.get(text)
+                        if number is None:
+                            number = self.decode(kind, text)
+                        number_refs[lexeme] = ref
+                        store.numbers.append(number)
+                code = CODE_NUM
+            elif byte_class == BYTE_COMMENT:
+                end = find(b"}", pos, size) + 1
+                if not end:
+                    self.state = State.COM
+                    self.comment_start = store.locate(pos)
+                    break
+                if NON_ASCII_PATTERN.search(data, pos, end):
+                    store.wide_lines.add(bisect_right(store.line_starts, end - 1))
+                pos = end
+                continue
+            elif byte_class == BYTE_WIDE:
+                return self.restart_decoded(data[start:size], mark)
+            else:
+                self.y_coord, self.x_coord = store.locate(pos)
+                self.error(f"Invalid character: {chr(data[pos])}")
+                pos += 1  # Режим восстановления: символ пропускается
+                continue
+            add_code(code)
+            add_start(pos)
+            add_end(end)
+            add_ref(ref)
+            pos = end
+        self.y_coord = len(store.line_starts)
+        if self.state == State.COM:
+            self.unclosed_comment()
+        return store
+
+    def forget_names(self, count: int) -> None:
+        """Удаляет из таблицы имён идентификаторы, добавленные после первых count."""
+        for name in self.names[count:]:
+            del self.name_ids[name]
+        del self.names[count:]
+        self.byte_names = {lexeme: sym for lexeme, sym in self.byte_names.items() if sym < count}
+
+    def restart_decoded(self, data, mark: Tuple[int, int]) -> TokenStore:
+        """
+        Повторяет анализ через tokenize_store по декодированному тексту. Имена и ошибки,
+        добавленные прерванным проходом после mark, удаляются: иначе, например,
+        из «intжeger» в таблице имён осталось бы лишнее «int».
+        """
+        names_count, errors_count = mark
+        self.forget_names(names_count)
+        if self.diagnostics is not None:
+            del self.diagnostics[errors_count:]
+        return self.tokenize_store(decode_lines(data))
+
+    def decode(self, kind: str, lexeme: str) -> Tuple[str, NumberValue]:
+        """Вычисляет значение числа, вид которого определил общий шаблон, и кэширует результат."""
+        number = (kind, decode_number(kind, lexeme))
+        if len(self.numbers) >= NUMBER_CACHE_SIZE:
+            self.numbers.clear()
+        self.numbers[lexeme] = number
+        return number
 
     def is_valid_number(self, lexeme: str) -> bool:
         """Проверяет корректность числа согласно новым правилам."""
-        # Регулярные выражения для разных типов чисел
-        binary_pattern = r"^[01]+[Bb]$"
-        octal_pattern = r"^[0-7]+[Oo]$"
-        decimal_pattern = r"^\d+([Dd]?)$"
-        hex_pattern = r"^[0-9A-Fa-f]+[Hh]$"
-        real_pattern = r"^\d*(\.\d+)?([Ee][+-]?\d+)?$"
-
-        patterns = [binary_pattern, octal_pattern, decimal_pattern, hex_pattern, real_pattern]
-        return any(re.fullmatch(pattern, lexeme) for pattern in patterns)
+        return NUMBER_PATTERN.fullmatch(lexeme) is not None
 
     def error(self, message: str) -> None:
-        raise ValueError(f"{message} at ({self.y_coord}, {self.x_coord})")
+        """Вызывает ValueError; в режиме восстановления только записывает ошибку, и анализ продолжается."""
+        if self.diagnostics is not None:
+            self.diagnostics.append(Diagnostic(message, self.y_coord, self.x_coord, "lexical"))
+            return
+        error = ValueError(f"{message} at ({self.y_coord}, {self.x_coord})")
+        error.position = (self.y_coord, self.x_coord)  # Строка и столбец для пакетной проверки
+        raise error
+
+    def unclosed_comment(self) -> None:
+        """Ошибка незакрытого комментария в позиции его открывающей скобки."""
+        self.y_coord, self.x_coord = self.comment_start
+        self.error("Unclosed comment")
 
     def print_tokens(self):
         for token in self.tokens:
@@ -287,301 +1041,1001 @@ class Lexer:
 
 
 class VarToken:
-    def __init__(self, var_type="", var_name=""):
+    def __init__(self, var_type="", var_name="", sym=None, x_coord=0, y_coord=0, level=0):
         self.var_type = var_type
         self.var_name = var_name
+        self.sym = sym  # Номер имени в таблице имён лексера
+        self.x_coord = x_coord  # Позиция объявления
+        self.y_coord = y_coord
+        self.level = level  # Глубина области видимости
+        self.uses = 0
+
+    def __repr__(self):
+        return f"VarToken(type={self.var_type}, name={self.var_name}, x={self.x_coord}, y={self.y_coord}, uses={self.uses})"
+
+
+class SymbolTable:
+    """
+    Таблица символов с вложенными областями видимости.
+    Для каждого номера имени хранится стек объявлений, поэтому поиск
+    выполняется за O(1), а объявления во вложенном блоке перекрывают внешние.
+    """
+
+    def __init__(self):
+        self.bindings = {}  # Номер имени -> стек объявлений VarToken
+        self.scopes = [[]]  # Номера имён, объявленных в каждой открытой области
+        self.symbols = []  # Все объявления в порядке появления
+
+    @property
+    def level(self) -> int:
+        return len(self.scopes) - 1
+
+    def push_scope(self) -> None:
+        self.scopes.append([])
+
+    def pop_scope(self) -> None:
+        for sym in self.scopes.pop():
+            stack = self.bindings[sym]
+            stack.pop()
+            if not stack:
+                del self.bindings[sym]
+
+    def declare(self, var: VarToken) -> bool:
+        """Добавляет объявление в текущую область; возвращает False при повторном объявлении."""
+        stack = self.bindings.get(var.sym)
+        if stack is None:
+            self.bindings[var.sym] = [var]
+        elif stack[-1].level == self.level:
+            return False
+        else:
+            stack.append(var)
+        var.level = self.level
+        self.scopes[-1].append(var.sym)
+        self.symbols.append(var)
+        return True
+
+    def lookup(self, sym: int) -> Optional[VarToken]:
+        stack = self.bindings.get(sym)
+        return stack[-1] if stack else None
+
+
+class TokenStream:
+    """
+    Источник токенов для парсера с небольшим буфером предпросмотра.
+    Принимает как готовый список, так и генератор (например, Lexer.stream_file),
+    поэтому парсеру не нужен весь список токенов заранее.
+    """
+
+    def __init__(self, tokens: Iterable[Token]):
+        self.source = iter(tokens)
+        self.buffer = deque()
+        self.current = next(self.source, None)
+        self.code = CODE_EOF if self.current is None else self.current.code
+
+    def peek(self, offset: int = 1) -> Optional[Token]:
+        """Возвращает токен на offset позиций после текущего, не сдвигая поток."""
+        if offset == 0:
+            return self.current
+        while len(self.buffer) < offset:
+            token = next(self.source, None)
+            if token is None:
+                return None
+            self.buffer.append(token)
+        return self.buffer[offset - 1]
+
+    def value(self) -> str:
+        return self.current.value
+
+    def sym(self) -> Optional[int]:
+        return self.current.sym
+
+    def number(self) -> Optional[Tuple[str, NumberValue]]:
+        return self.current.number
+
+    def position(self) -> Tuple[int, int]:
+        """Строка и столбец текущего токена."""
+        return self.current.y_coord, self.current.x_coord
+
+    def advance(self) -> None:
+        self.current = self.buffer.popleft() if self.buffer else next(self.source, None)
+        self.code = CODE_EOF if self.current is None else self.current.code
+
+
+class StoreStream:
+    """Поток по TokenStore: код текущего токена читается прямо из массива."""
+
+    def __init__(self, store: TokenStore):
+        self.store = store
+        self.codes = store.codes
+        self.refs = store.refs
+        self.count = len(store.codes)
+        self.pos = 0
+        self.code = self.codes[0] if self.count else CODE_EOF
+
+    @property
+    def current(self) -> Optional[TokenView]:
+        return TokenView(self.store, self.pos) if self.pos < self.count else None
+
+    def peek(self, offset: int = 1) -> Optional[TokenView]:
+        pos = self.pos + offset
+        return TokenView(self.store, pos) if pos < self.count else None
+
+    def value(self) -> str:
+        return self.store.value(self.pos)
+
+    def sym(self) -> Optional[int]:
+        return self.refs[self.pos]
+
+    def number(self) -> Optional[Tuple[str, NumberValue]]:
+        return self.store.numbers[self.refs[self.pos]]
+
+    def position(self) -> Tuple[int, int]:
+        """Строка и столбец текущего токена."""
+        store = self.store
+        line = store.lines[self.pos]
+        return line, store.starts[self.pos] - store.line_starts[line - 1] + 1
+
+    def advance(self) -> None:
+        self.pos += 1
+        self.code = self.codes[self.pos] if self.pos < self.count else CODE_EOF
+
+
+class ByteStoreStream(StoreStream):
+    """Поток по ByteTokenStore: столбец в строке с не-ASCII комментарием считается в символах."""
+
+    def __init__(self, store: ByteTokenStore):
+        super().__init__(store)
+        self.lines = None  # Массив строк store берётся при первом запросе позиции
+        self.wide_lines = store.wide_lines
+
+    def position(self) -> Tuple[int, int]:
+        lines = self.lines
+        if lines is None:
+            lines = self.lines = self.store.lines
+        line = lines[self.pos]
+        if self.wide_lines and line in self.wide_lines:
+            return line, self.store.column(self.pos)
+        store = self.store
+        return line, store.starts[self.pos] - store.line_starts[line - 1] + 1
+
+
+class ParseRecovery(Exception):
+    """
+    Ошибка разбора в режиме восстановления: уже записана в диагностики,
+    line — строка ошибки, остаток которой пропускается до границы оператора.
+    """
+
+    def __init__(self, line: int):
+        super().__init__(line)
+        self.line = line
+
+
+class Frame:
+    """
+    Оператор, тело которого ещё разбирается: вид FRAME_*, уже разобранные
+    операторы тела, заголовок (условие или переменная и границы for),
+    тело then условного оператора с else и позиция начала оператора.
+    """
+    __slots__ = ("kind", "body", "header", "then_body", "line", "col")
+
+    def __init__(self, kind, header=None, line=0, col=0):
+        self.kind = kind
+        self.body = []
+        self.header = header
+        self.then_body = None
+        self.line = line
+        self.col = col
 
 
 class Parser:
-    def __init__(self, tokens):
-        self.idx = 0
-        self.tokens = tokens
-        self.token_count = len(tokens)
-        self.tokens_var = []
-        self.single_token_var = VarToken()
+    def __init__(self, tokens, header=True, symbols=None, diagnostics=None):
+        """
+        header=False — поток начинается сразу с операторов, без program <имя>;
+        symbols — таблица символов с уже объявленными переменными;
+        diagnostics — список, в который в режиме восстановления собираются все
+        ошибки: разбор продолжается со следующей границы оператора.
+        """
+        self.stream = tokens.cursor() if isinstance(tokens, TokenStore) else TokenStream(tokens)
+        self.symbols = SymbolTable() if symbols is None else symbols
+        self.tokens_var = self.symbols.symbols
+        self.name_ids = {}  # Имена токенов, созданных без таблицы имён лексера
         self.if_while_check = 0
         self.if_while_flag = False
+        self.program_name = ""
+        self.diagnostics = diagnostics
+        self.reported = set()  # Позиции уже записанных ошибок: каскад в одной точке сообщается один раз
 
-
-        if not self.tokens:
+        if not header:
+            return
+        if self.stream.current is None and diagnostics is None:
             raise SyntaxError("Token list is empty.")
-        if self.current_token().type != "KEYWORD" or self.current_token().value != "program":
-            self.error("The program must start with the keyword 'program'", self.current_token())
-        self.idx += 1
+        self.expect(CODE_PROGRAM, "The program must start with the keyword 'program'")
         # Ожидаем идентификатор после 'program'
-        if self.current_token().type != "IDENTIFIER":
-            self.error("Expected program name after 'program'", self.current_token())
+        if self.stream.code != CODE_ID:
+            self.report("Expected program name after 'program'", self.current_token())
+            return
         self.program_name = self.current_token().value
-        self.idx += 1
+        self.advance()
 
     def current_token(self):
-        """Возвращает текущий токен или вызывает ошибку, если индекс выходит за пределы."""
-        if self.idx >= self.token_count:
-            self.error("Unexpected end of tokens", Token("", "", 0, 0))
-        return self.tokens[self.idx]
+        """Возвращает текущий токен или вызывает ошибку, если токены закончились."""
+        token = self.stream.current
+        if token is None:
+            if self.diagnostics is not None:
+                return EOF_TOKEN  # Ошибка в конце текста сообщается на позиции (0, 0)
+            self.error("Unexpected end of tokens", EOF_TOKEN)
+        return token
+
+    def advance(self):
+        """Переходит к следующему токену потока."""
+        self.stream.advance()
 
     def error(self, message, token):
-        raise SyntaxError(f"ERROR ({message}) -> {token.value} ({token.x_coord}, {token.y_coord})")
+        if self.diagnostics is not None:
+            self.report(message, token)
+            raise ParseRecovery(token.y_coord)
+        error = SyntaxError(f"ERROR ({message}) -> {token.value} ({token.x_coord}, {token.y_coord})")
+        error.position = (token.y_coord, token.x_coord)  # Строка и столбец для пакетной проверки
+        raise error
+
+    def report(self, message, token):
+        """
+        Ошибка, после которой разбор может продолжиться без пропуска токенов
+        (несовпадение типов, повторное объявление, пропущенное then или end):
+        в режиме восстановления она только записывается.
+        """
+        if self.diagnostics is None:
+            self.error(message, token)
+        position = (token.y_coord, token.x_coord)
+        if position not in self.reported:
+            self.reported.add(position)
+            self.diagnostics.append(Diagnostic(message, token.y_coord, token.x_coord, "syntax"))
+
+    def expect(self, code, message):
+        """Переходит за обязательный токен code; если его нет, разбор в режиме восстановления идёт дальше без него."""
+        if self.stream.code == code:
+            self.advance()
+        else:
+            self.report(message, self.current_token())
+
+    def synchronize(self, line):
+        """Пропускает токены строки line (и предыдущих) до границы оператора из SYNC_CODES."""
+        stream = self.stream
+        while stream.code != CODE_EOF and stream.code not in SYNC_CODES and stream.current.y_coord <= line:
+            stream.advance()
+
+    def recover(self, recovery):
+        """Восстановление после ошибки в операторе: then или do оборванного заголовка тоже пропускается."""
+        self.synchronize(recovery.line)
+        if self.stream.code == CODE_THEN or self.stream.code == CODE_DO:
+            self.advance()
+
+    def parse_header(self, parse, code, message):
+        """
+        Заголовок if, while или for, за которым должен идти code (then или do).
+        После ошибки в заголовке токены пропускаются до code или конца строки,
+        а тело разбирается как обычно; отсутствие code тогда уже не сообщается.
+        """
+        try:
+            result = parse()
+        except ParseRecovery as recovery:
+            self.synchronize(recovery.line)
+            if self.stream.code == code:
+                self.advance()
+            return None
+        self.expect(code, message)
+        return result
 
     def start_prog(self):
-        print(f"Текущий токен: {self.current_token()}")  # Добавьте вывод текущего токена
-        self.start_vars()
-        self.start_begin()
-        if self.current_token().type == "KEYWORD" and self.current_token().value == "end":
-            print("Программа корректна.")
-        else:
-            self.error("Program must end with 'end'", self.current_token())
+        """Разбирает программу и возвращает её дерево Program."""
+        return self.parse_program()
+
+    def parse_program(self):
+        """Разбор программы без отладочного вывода; возвращает дерево Program."""
+        # Дерево разбора не содержит циклических ссылок, поэтому сборщик циклов
+        # на время разбора отключается: иначе он многократно обходит все созданные узлы
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            body = self.start_vars()
+            body.extend(self.start_begin())
+            while self.diagnostics is not None and self.stream.code in BLOCK_END_CODES \
+                    and self.stream.code != CODE_END:
+                # Лишние else или «]» на верхнем уровне: ошибка записывается, разбор продолжается за ними
+                self.report("Program must end with 'end'", self.current_token())
+                self.advance()
+                body.extend(self.start_begin())
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if self.stream.code != CODE_END:
+            self.report("Program must end with 'end'", self.current_token())
+        self.program = Program(self.program_name, body, self.tokens_var, 1, 1)
+        return self.program
 
     def start_vars(self):
-        while self.current_token().type == "KEYWORD" and self.current_token().value == "dim":
-            self.idx += 1
-            self.start_id()
-            if self.current_token().type == "KEYWORD" and self.current_token().value == "as":
-                self.idx += 1
-                if self.current_token().type == "KEYWORD":
-                    token_value = self.current_token().value
-                    if token_value == "integer":
-                        self.single_token_var.var_type = "INT"
-                    elif token_value == "real":
-                        self.single_token_var.var_type = "REAL"
-                    elif token_value == "boolean":
-                        self.single_token_var.var_type = "BOOL"
-                    else:
-                        self.error("Unknown variable type", self.current_token())
-                    self.tokens_var.append(self.single_token_var)
-                    self.idx += 1
-                else:
-                    self.error("Expected variable type", self.current_token())
-            else:
-                self.error("Expected 'as' after variable name", self.current_token())
+        declarations = []
+        while self.stream.code == CODE_DIM:
+            try:
+                declarations.append(self.start_dim())
+            except ParseRecovery as recovery:
+                self.recover(recovery)
+        return declarations
+
+    def start_dim(self):
+        """Описание: dim <идентификатор> {, <идентификатор>} as <тип>."""
+        line, col = self.stream.position()
+        self.advance()
+        names = [self.start_id()]
+        while self.stream.code == CODE_COMMA:
+            self.advance()
+            names.append(self.start_id())
+        if self.stream.code != CODE_AS:
+            self.error("Expected 'as' after variable name", self.current_token())
+        self.advance()
+        code = self.stream.code
+        if code not in KEYWORD_CODES:
+            self.error("Expected variable type", self.current_token())
+        var_type = VAR_TYPES.get(code)
+        if var_type is None:
+            self.error("Unknown variable type", self.current_token())
+        vars_ = [self.declare(token, var_type) for token in names]
+        self.advance()
+        return Declare(vars_, line, col)
 
     def start_id(self, flag_token=True):
-        if self.current_token().type == "IDENTIFIER":
+        """
+        Разбирает идентификатор: при объявлении возвращает его токен,
+        иначе проверяет, что он объявлен, и возвращает объявление VarToken.
+        """
+        if self.stream.code == CODE_ID:
             if flag_token:
-                self.single_token_var = VarToken(self.single_token_var.var_type, self.current_token().value)
+                result = self.current_token()
             else:
-                self.id_check()
-            self.idx += 1
-        else:
-            self.error("Expected an identifier", self.current_token())
-
+                result = self.id_check()
+            self.advance()
+            return result
+        self.error("Expected an identifier", self.current_token())
+
+    def intern(self, name):
+        """Номер имени для токенов без номера из таблицы имён лексера."""
+        return self.name_ids.setdefault(name, len(self.name_ids))
+
+    def declare(self, token, var_type):
+        sym = token.sym
+        if sym is None:
+            sym = self.intern(token.value)
+        var = VarToken(var_type, token.value, sym, token.x_coord, token.y_coord)
+        if not self.symbols.declare(var):
+            self.report("Duplicate declaration", token)
+        return var
 
     def start_begin(self):
-        while self.idx < self.token_count and (self.current_token().type != "KEYWORD" or self.current_token().value not in {"end", "else"}):
-            current_type = self.current_token().type
-            if current_type == "IDENTIFIER":
-                self.id_check()
-                self.idx += 1
-                if self.current_token().type == "OPERATOR" and self.current_token().value == "=":
-                    self.idx += 1
-                    self.start_v()
-                else:
-                    self.error("Expected assignment '='", self.current_token())
-            elif current_type == "KEYWORD":
-                keyword = self.current_token().value
-                if keyword == "if":
-                    self.handle_if_statement()
-                elif keyword == "while":
-                    self.handle_while_loop()
-                elif keyword == "read":
-                    self.handle_read()
-                elif keyword == "write":
-                    self.handle_write()
-                else:
-                    self.error("Unexpected keyword", self.current_token())
-            else:
-                self.error("Incorrect input", self.current_token())
-
-    def handle_if_statement(self):
-        self.idx += 1
-        self.start_v()
-        if self.current_token().type == "KEYWORD" and self.current_token().value == "then":
-            self.idx += 1
-            self.start_begin()
-            if self.current_token().type == "KEYWORD" and self.current_token().value == "else":
-                self.idx += 1
-                self.start_begin()
-            # Здесь не увеличиваем idx, так как 'end' будет обработан в start_begin
-        else:
-            self.error("Missing 'then' in if statement", self.current_token())
-
-    def handle_while_loop(self):
-        self.idx += 1
-        self.start_v()
-        if self.current_token().type == "KEYWORD" and self.current_token().value == "do":
-            self.idx += 1
-            self.start_begin()
-        else:
-            self.error("Missing 'do' in while loop", self.current_token())
+        """Последовательность операторов до end, else или «]»; возвращает список узлов."""
+        return self.run([Frame(FRAME_BODY)])
 
-    def handle_read(self):
-        self.idx += 1
-        if self.current_token().type == "IDENTIFIER":
-            self.start_id(False)
-        else:
-            self.error("Expected identifier after 'read'", self.current_token())
+    def start_statement(self):
+        """Один оператор со всеми вложенными; возвращает его узел."""
+        frames = []
+        node = self.open_statement(frames)
+        return self.run(frames) if frames else node
 
-    def handle_write(self):
-        self.idx += 1
-        self.start_v()
-
-    def start_v(self):
-        self.start_o()
-        while self.current_token().type == "OPERATOR" and self.current_token().value in {"EQ", "NE", "LT", "LE", "GT", "GE"}:
-            self.if_while_flag = True
-            self.idx += 1
-            self.start_o()
-
-    def start_o(self):
-        self.start_s()
-        while self.current_token().type == "OPERATOR" and self.current_token().value in {"plus", "min", "or"}:
-            self.idx += 1
-            self.start_s()
-
-    def start_s(self):
-        self.start_m()
-        while self.current_token().type == "OPERATOR" and self.current_token().value in {"mult", "div", "and"}:
-            self.idx += 1
-            self.start_m()
-
-    def start_m(self):
-        current_token = self.current_token()
-        if current_token.type == "IDENTIFIER":
-            self.id_check()
-            self.idx += 1
-        elif current_token.value in {"true", "false"}:
-            self.if_while_flag = True
-            self.idx += 1
-        elif current_token.type == "NUMBER":
-            self.idx += 1
-        elif current_token.type == "OPERATOR" and current_token.value == "~":
-            self.idx += 1
-            self.start_m()
-        elif current_token.type == "SEPARATOR" and current_token.value == "(":
-            self.idx += 1
-            self.start_v()
-            if self.current_token().type == "SEPARATOR" and self.current_token().value == ")":
-                self.idx += 1
-            else:
-                self.error("Expected closing parenthesis", current_token)
-        elif current_token.type == "SEPARATOR" and current_token.value == "[":
-            self.start_compound()  # Новый вызов для обработки блока в квадратных скобках
+    def open_statement(self, frames):
+        """
+        Разбирает простой оператор и возвращает его узел. У if, while, for и
+        составного оператора разбирается только начало: в frames добавляется
+        кадр оператора, а его тело разбирает run(). Тогда возвращается None.
+        """
+        code = self.stream.code
+        if code == CODE_ID:
+            return self.start_assign()
+        elif code == CODE_IF:
+            self.handle_if_statement(frames)
+        elif code == CODE_WHILE:
+            self.handle_while_loop(frames)
+        elif code == CODE_FOR:
+            self.handle_for_loop(frames)
+        elif code == CODE_READ:
+            return self.handle_read()
+        elif code == CODE_WRITE:
+            return self.handle_write()
+        elif code == CODE_DIM:
+            return self.start_dim()
+        elif code == CODE_LBRACKET:
+            self.start_block(frames)
+        elif code in KEYWORD_CODES:
+            self.error("Unexpected keyword", self.current_token())
         else:
-            self.error("Unexpected token", current_token)
+            self.error("Incorrect input", self.current_token())
+        return None
 
-    def id_check(self):
-        for var in self.tokens_var:
-            if var.var_name == self.current_token().value:
-                return
-        self.error("Undeclared or incorrect variable", self.current_token())
-
-    def parse_number(self):
+    def run(self, frames):
         """
-        Синтаксический анализ чисел.
-        Распознает как целые числа (включая двоичные, восьмеричные, десятичные, шестнадцатеричные),
-        так и действительные числа с порядком (e, E).
+        Разбирает тела операторов из стека frames, пока не завершится нижний
+        кадр, и возвращает его узел (для FRAME_BODY — список операторов).
+        Вложенный оператор кладёт свой кадр на стек вместо рекурсивного вызова,
+        поэтому глубина вложенности ограничена только памятью. Ошибка в
+        операторе, как и при рекурсивном разборе, обрабатывается телом, в
+        котором он стоит: разбор продолжается с границы оператора.
         """
+        stream = self.stream
+        try:
+            while True:
+                frame = frames[-1]
+                code = stream.code
+                if code == CODE_COLON:
+                    self.advance()  # Разделитель операторов
+                elif code == CODE_EOF or code in BLOCK_END_CODES:
+                    if frame.kind == FRAME_BLOCK and code != CODE_RBRACKET:
+                        frames.pop()
+                        self.symbols.pop_scope()  # Область закрывается и тогда, когда разбор блока прерван ошибкой
+                        try:
+                            self.error("Expected closing ']' for compound statement", self.current_token())
+                        except ParseRecovery as recovery:
+                            if not frames:
+                                raise
+                            self.recover(recovery)  # Ошибка оператора в объемлющем теле
+                        continue
+                    node = self.close_frame(frame)
+                    if node is None:
+                        continue  # Начинается тело else
+                    frames.pop()
+                    if not frames:
+                        return node
+                    frames[-1].body.append(node)
+                else:
+                    try:
+                        node = self.open_statement(frames)
+                    except ParseRecovery as recovery:
+                        self.recover(recovery)
+                        continue
+                    if node is not None:
+                        frame.body.append(node)
+        except BaseException:
+            for frame in reversed(frames):
+                if frame.kind == FRAME_BLOCK:
+                    self.symbols.pop_scope()
+            raise
+
+    def close_frame(self, frame):
+        """
+        Завершает оператор, тело которого дошло до end, else, «]» или конца
+        текста, и возвращает его узел. Если за телом then идёт else, кадр
+        переходит к телу else и возвращается None.
+        """
+        kind = frame.kind
+        if kind == FRAME_THEN:
+            if self.stream.code == CODE_ELSE:
+                self.advance()
+                frame.kind = FRAME_ELSE
+                frame.then_body = frame.body
+                frame.body = []
+                return None
+            self.expect(CODE_END, "Missing 'end' in if statement")
+            return If(frame.header, frame.body, [], frame.line, frame.col)
+        if kind == FRAME_ELSE:
+            self.expect(CODE_END, "Missing 'end' in if statement")
+            return If(frame.header, frame.then_body, frame.body, frame.line, frame.col)
+        if kind == FRAME_WHILE:
+            self.expect(CODE_END, "Missing 'end' in while loop")
+            return While(frame.header, frame.body, frame.line, frame.col)
+        if kind == FRAME_FOR:
+            var, start, stop = frame.header or (None, None, None)
+            self.expect(CODE_END, "Missing 'end' in for loop")
+            return For(var, start, stop, frame.body, frame.line, frame.col)
+        if kind == FRAME_BLOCK:
+            self.symbols.pop_scope()
+            self.advance()  # Пропускаем ']'
+            return Block(frame.body, frame.line, frame.col)
+        return frame.body  # FRAME_BODY
+
+    def start_assign(self):
+        """<присваивания>::= <идентификатор> = <выражение>"""
+        target = self.current_token()
+        line, col = self.stream.position()
+        var = self.start_id(False)
+        if self.stream.code != CODE_ASSIGN:
+            self.error("Expected assignment '='", self.current_token())
+        self.advance()
+        expr = self.parse_expression()
+        if not assignable(var.var_type, expr.type) and expr.type != ERROR_TYPE:
+            self.report("Type mismatch in assignment", target)
+        return Assign(var, expr, line, col)
+
+    def start_block(self, frames):
+        """Составной оператор «[» <оператор> { (: | перевод строки) <оператор> } «]» со своей областью видимости."""
+        line, col = self.stream.position()
+        self.advance()  # Пропускаем '['
+        self.symbols.push_scope()
+        frames.append(Frame(FRAME_BLOCK, None, line, col))
+
+    def start_condition(self):
+        """Условие if или while: выражение логического типа."""
         token = self.current_token()
-        if token.token_type != "NUMBER":
-            self.error(f"Ожидалось число, но найдено {token.token_type}: {token.value}")
-
-        lexeme = token.value
-
-        if re.fullmatch(r"^[01]+[Bb]$", lexeme):
-            print(f"Двоичное число: {lexeme}")
-            return {"type": "binary", "value": int(lexeme[:-1], 2)}
-        elif re.fullmatch(r"^[0-7]+[Oo]$", lexeme):
-            print(f"Восьмеричное число: {lexeme}")
-            return {"type": "octal", "value": int(lexeme[:-1], 8)}
-        elif re.fullmatch(r"^\d+([Dd]?)$", lexeme):
-            print(f"Десятичное число: {lexeme}")
-            return {"type": "decimal", "value": int(lexeme.rstrip('Dd'))}
-        elif re.fullmatch(r"^[0-9A-Fa-f]+[Hh]$", lexeme):
-            print(f"Шестнадцатеричное число: {lexeme}")
-            return {"type": "hexadecimal", "value": int(lexeme[:-1], 16)}
-        elif re.fullmatch(r"^\d*(\.\d+)?([Ee][+-]?\d+)?$", lexeme):
-            print(f"Действительное число: {lexeme}")
-            return {"type": "real", "value": float(lexeme)}
-        else:
-            self.error(f"Некорректный формат числа: {lexeme}")
-
-        self.advance_token()
-
-    def start_compound(self):
-        """Обрабатывает составные выражения в квадратных скобках."""
-        if self.current_token().type == "SEPARATOR" and self.current_token().value == "[":
-            self.idx += 1  # Пропускаем '['
-            self.start_o()  # Ожидаем первый оператор внутри составного блока
-
-            while self.current_token().type == "SEPARATOR" and self.current_token().value == ":":
-                self.idx += 1  # Пропускаем ':'
-                self.start_o()  # Обрабатываем следующий оператор
+        cond = self.parse_expression()
+        if cond.type != "BOOL" and cond.type != ERROR_TYPE:
+            self.report("Condition must be boolean", token)
+        return cond
+
+    def handle_if_statement(self, frames):
+        """if <выражение> then <операторы> [else <операторы>] end"""
+        line, col = self.stream.position()
+        self.advance()
+        cond = self.parse_header(self.start_condition, CODE_THEN, "Missing 'then' in if statement")
+        frames.append(Frame(FRAME_THEN, cond, line, col))
+
+    def handle_while_loop(self, frames):
+        """while <выражение> do <операторы> end"""
+        line, col = self.stream.position()
+        self.advance()
+        cond = self.parse_header(self.start_condition, CODE_DO, "Missing 'do' in while loop")
+        frames.append(Frame(FRAME_WHILE, cond, line, col))
+
+    def handle_for_loop(self, frames):
+        """for <идентификатор> = <выражение> to <выражение> do <операторы> end"""
+        line, col = self.stream.position()
+        self.advance()
+        header = self.parse_header(self.for_header, CODE_DO, "Missing 'do' in for loop")
+        frames.append(Frame(FRAME_FOR, header, line, col))
+
+    def for_header(self):
+        """<идентификатор> = <выражение> to <выражение> в заголовке for; возвращает переменную и границы."""
+        if self.stream.code != CODE_ID:
+            self.error("Expected loop variable after 'for'", self.current_token())
+        counter = self.current_token()
+        var = self.start_id(False)
+        if var.var_type != "INT":
+            self.report("Loop variable must be integer", counter)
+        if self.stream.code != CODE_ASSIGN:
+            self.error("Expected assignment '='", self.current_token())
+        self.advance()
+        start = self.parse_numeric()
+        self.expect(CODE_TO, "Missing 'to' in for loop")
+        stop = self.parse_numeric()
+        return var, start, stop
+
+    def parse_numeric(self):
+        token = self.current_token()
+        expr = self.parse_expression()
+        if expr.type not in NUMERIC_TYPES and expr.type != ERROR_TYPE:
+            self.report("Expected a numeric expression", token)
+        return expr
 
-            if self.current_token().type == "SEPARATOR" and self.current_token().value == "]":
-                self.idx += 1  # Пропускаем ']'
-            else:
-                self.error("Expected closing ']' for compound expression", self.current_token())
+    def handle_read(self):
+        """read <идентификатор> | read «(»<идентификатор> {, <идентификатор>}«)»"""
+        line, col = self.stream.position()
+        self.advance()
+        if self.stream.code == CODE_LPAREN:
+            self.advance()
+            vars_ = [self.start_id(False)]
+            while self.stream.code == CODE_COMMA:
+                self.advance()
+                vars_.append(self.start_id(False))
+            if self.stream.code != CODE_RPAREN:
+                self.error("Expected closing parenthesis", self.current_token())
+            self.advance()
+        elif self.stream.code == CODE_ID:
+            vars_ = [self.start_id(False)]
         else:
-            self.error("Expected '[' to start a compound expression", self.current_token())
+            self.error("Expected identifier after 'read'", self.current_token())
+        return Read(vars_, line, col)
 
-    def parse_expression(self):
+    def handle_write(self):
+        """write <выражение> | write «(»<выражение> {, <выражение>}«)»"""
+        line, col = self.stream.position()
+        self.advance()
+        if self.stream.code != CODE_LPAREN:
+            return Write([self.parse_expression()], line, col)
+        open_token = self.current_token()
+        self.advance()
+        exprs = [self.parse_expression()]
+        while self.stream.code == CODE_COMMA:
+            self.advance()
+            exprs.append(self.parse_expression())
+        if self.stream.code != CODE_RPAREN:
+            self.error("Expected closing parenthesis", open_token)
+        self.advance()
+        if len(exprs) == 1 and self.stream.code in BINDING_POWERS:
+            # write (a) plus b: скобки открывали первое выражение, а не список
+            exprs[0] = self.parse_expression(0, exprs[0])
+        return Write(exprs, line, col)
+
+    def parse_expression(self, min_power=0, left=None):
         """
-        Пример использования чисел в выражениях.
+        Разбор выражения по таблице BINDING_POWERS без рекурсии.
+        <выражение>, <операнд> и <слагаемое> различаются только силой связывания
+        операций. Незавершённые бинарные операции, ~, скобки и составные
+        выражения «[...]» лежат в явном стеке, поэтому глубина вложенности
+        ограничена только памятью. Операция сворачивается, когда следующая
+        связывает не сильнее её (все операции левоассоциативны): дерево и
+        порядок ошибок те же, что у рекурсивного разбора методом Пратта.
+        Верхняя незавершённая бинарная операция хранится в локальных
+        переменных и попадает в стек, только когда над ней открывается
+        следующая: цепочка операций одной силы обходится без стека.
+        Возвращает дерево выражения с вычисленными типами.
         """
-        left = self.parse_number()
-
-        while self.current_token().token_type == "OPERATOR":
-            operator = self.current_token().value
-            self.advance_token()
-            right = self.parse_number()
-
-            # Выполнение операций (если нужно)
-            if operator == "+":
-                left = {"type": "sum", "value": left["value"] + right["value"]}
-            elif operator == "-":
-                left = {"type": "difference", "value": left["value"] - right["value"]}
-            elif operator == "*":
-                left = {"type": "product", "value": left["value"] * right["value"]}
-            elif operator == "/":
-                left = {"type": "division", "value": left["value"] / right["value"]}
+        stream = self.stream
+        stack = []  # Кадры (сила, код, левый операнд) и кадры EXPR_*
+        top_power = 0  # Сила верхней бинарной операции; 0 — её нет
+        top_code = top_left = None
+        nots = 0  # Число кадров ~ в стеке
+        limit = min_power or REL_POWER  # Наименьшая сила операции, продолжающей текущее подвыражение
+        node = left
+        while True:
+            while node is None:
+                # <множитель>::= <идентификатор> | <число> | <логическая_константа> | ~ <множитель> | «(»<выражение>«)»
+                code = stream.code
+                if code == CODE_ID:
+                    line, col = stream.position()
+                    node = Variable(self.id_check(), line, col)
+                    stream.advance()
+                elif code == CODE_NUM:
+                    line, col = stream.position()
+                    kind, value = stream.number()
+                    stream.advance()
+                    node = Number(kind, value, line, col)
+                elif code == CODE_TRUE or code == CODE_FALSE:
+                    self.if_while_flag = True
+                    line, col = stream.position()
+                    stream.advance()
+                    node = Boolean(code == CODE_TRUE, line, col)
+                elif code == CODE_NOT or code == CODE_LPAREN or code == CODE_LBRACKET:
+                    if top_power:
+                        stack.append((top_power, top_code, top_left))
+                        top_power = 0
+                    token = self.current_token()
+                    if code == CODE_NOT:
+                        line, col = stream.position()
+                        stack.append((EXPR_NOT, token, line, col))
+                        nots += 1
+                    elif code == CODE_LPAREN:
+                        stack.append((EXPR_PAREN, token, limit))
+                        limit = REL_POWER
+                    else:
+                        # Блок выражений в квадратных скобках: элементы разделяются ':'
+                        line, col = stream.position()
+                        stack.append((EXPR_COMPOUND, [], line, col, limit))
+                        limit = ADD_POWER
+                    stream.advance()
+                else:
+                    self.error("Unexpected token", self.current_token())
+            if nots and stack[-1][0] == EXPR_NOT:
+                while nots and stack[-1][0] == EXPR_NOT:
+                    _, token, line, col = stack.pop()
+                    nots -= 1
+                    if node.type == "BOOL":
+                        node = Unary(CODE_NOT, node, "BOOL", line, col)
+                        continue
+                    if node.type != ERROR_TYPE:
+                        self.report("Operand of '~' must be boolean", token)
+                    node = Unary(CODE_NOT, node, ERROR_TYPE, line, col)
+                if stack and stack[-1][0] > 0:
+                    top_power, top_code, top_left = stack.pop()
+            code = stream.code
+            power = BINDING_POWERS.get(code, 0)  # 0 — не бинарная операция
+            # Сворачиваются операции, связывающие не слабее следующей, а в конце подвыражения — все его операции
+            bound = power if power >= limit else REL_POWER
+            while top_power >= bound:
+                type_ = BINARY_TYPES.get((top_code, top_left.type, node.type))
+                if type_ is None:
+                    type_ = self.operand_mismatch(top_code, top_left, node)
+                node = Binary(top_code, top_left, node, type_, top_left.line, top_left.col)
+                if stack and stack[-1][0] > 0:
+                    top_power, top_code, top_left = stack.pop()
+                else:
+                    top_power = 0
+            if power >= limit:
+                if top_power:
+                    stack.append((top_power, top_code, top_left))
+                top_power, top_code, top_left = power, code, node
+                if power == REL_POWER:
+                    self.if_while_flag = True
+                stream.advance()
+                node = None
+                continue
+            if not stack:
+                return node
+            frame = stack.pop()
+            if frame[0] == EXPR_PAREN:
+                if code != CODE_RPAREN:
+                    self.error("Expected closing parenthesis", frame[1])
+                limit = frame[2]
             else:
-                self.error(f"Неизвестный оператор: {operator}")
+                items = frame[1]
+                items.append(node)
+                if code == CODE_COLON:
+                    stream.advance()  # Следующий элемент составного блока
+                    stack.append(frame)
+                    node = None
+                    continue
+                if code != CODE_RBRACKET:
+                    self.error("Expected closing ']' for compound expression", self.current_token())
+                node = CompoundExpr(items, frame[2], frame[3])
+                limit = frame[4]
+            stream.advance()
+            if stack and stack[-1][0] > 0:
+                top_power, top_code, top_left = stack.pop()
+
+    def operand_mismatch(self, code, left, right):
+        """Операнды не подходят операции: сообщает об ошибке, если её нет в самих операндах, и возвращает ERROR_TYPE."""
+        if left.type != ERROR_TYPE and right.type != ERROR_TYPE:
+            self.report("Operand types do not match the operation",
+                        Token("OPERATOR", CODE_LEXEMES[code], left.col, left.line, code))
+        return ERROR_TYPE
 
-        return left
+    def id_check(self):
+        sym = self.stream.sym()
+        if sym is None:
+            sym = self.intern(self.stream.value())
+        var = self.symbols.lookup(sym)
+        if var is None:
+            self.error("Undeclared or incorrect variable", self.current_token())
+        var.uses += 1
+        return var
 
-def main():
-    input_file = "input_file_3.txt"  # Имя входного файла
-    try:
-        # Создаем экземпляр лексера и анализируем входной файл
+    def parse_number(self):
+        """
+        Возвращает вид и значение текущего числа, уже разобранные лексером,
+        и переходит к следующему токену.
+        """
+        if self.stream.code != CODE_NUM:
+            self.error("Expected a number", self.current_token())
+        kind, value = self.stream.number()
+        self.advance()
+        return {"type": kind, "value": value}
+
+
+def collect_diagnostics(lines: List[str], lexer: Optional[Lexer] = None) -> Tuple[Optional[Program], List[Diagnostic]]:
+    """
+    Анализ в режиме восстановления: один проход собирает все лексические
+    и синтаксические ошибки текста. Возвращает дерево Program (при ошибках
+    оно неполное и не предназначено для выполнения) и диагностики по порядку
+    позиций. Синтаксические ошибки в строке с лексической ошибкой не сообщаются:
+    обычно они её следствие.
+    """
+    if lexer is None:
         lexer = Lexer(keywords=KEYWORDS.keys(), separators=SEPARATORS.keys(), operators=OPERATORS.keys())
-        lexer.read_file(input_file)
-        tokens = lexer.tokenize(lexer.input_lines)
-
-        # Печать всех токенов
-        print("\n=== Лексический анализ ===")
-        lexer.print_tokens()
+    lexical = []
+    saved = lexer.diagnostics
+    lexer.diagnostics = lexical
+    try:
+        store = lexer.tokenize_store(lines)
+    finally:
+        lexer.diagnostics = saved
+    syntax = []
+    program = Parser(store, diagnostics=syntax).parse_program()
+    return program, merge_diagnostics(lexical, syntax, len(lines))
+
+
+def merge_diagnostics(lexical: List[Diagnostic], syntax: List[Diagnostic], line_count: int) -> List[Diagnostic]:
+    """
+    Объединяет ошибки режима восстановления в один список по порядку позиций,
+    отбрасывая синтаксические ошибки в строках с лексической ошибкой.
+    """
+    lexical_lines = {diagnostic.line for diagnostic in lexical}
+    diagnostics = lexical + [diagnostic for diagnostic in syntax if diagnostic.line not in lexical_lines]
+    # Ошибки в конце текста имеют позицию (0, 0) и идут последними
+    diagnostics.sort(key=lambda diagnostic: (diagnostic.line or line_count + 1, diagnostic.col))
+    return diagnostics
+
+
+# Уровни инструментирования анализа: каждый следующий включает предыдущие
+LEVEL_OFF, LEVEL_PHASES, LEVEL_COUNTERS, LEVEL_TRACE = range(4)
+LEVEL_NAMES = {"off": LEVEL_OFF, "phases": LEVEL_PHASES, "counters": LEVEL_COUNTERS, "trace": LEVEL_TRACE}
+# Правила грамматики, которые начинаются с оператора в open_statement (dim считается в start_dim)
+STATEMENT_RULES = {CODE_ID: "assign", CODE_IF: "if", CODE_WHILE: "while", CODE_FOR: "for", CODE_READ: "read",
+                   CODE_WRITE: "write", CODE_LBRACKET: "block"}
+LEX_TYPE_NAMES = {lex_type.value: lex_type.name for lex_type in LexType}
+
+
+class Instrumentation:
+    """
+    Сведения об анализе текста. level — один из LEVEL_*:
+    phases — время фаз (read, lex, parse); counters — ещё и счётчики (символы,
+    строки, токены по LexType, вызовы правил грамматики, ошибки, наибольшая
+    глубина вложенности операторов и выражений); trace — ещё и события
+    (правила, токены, ошибки) в кольцевом буфере на trace_size последних.
+    При LEVEL_OFF ничего не собирается и разбор идёт обычным Parser.
+    """
+
+    def __init__(self, level: int = LEVEL_COUNTERS, trace_size: int = 1000):
+        self.level = level
+        self.phases = {}  # Фаза -> суммарное время в секундах
+        self.counters = Counter()
+        self.tokens_by_type = Counter()
+        self.rules = Counter()
+        self.max_statement_depth = 0
+        self.max_expression_depth = 0
+        self.events = deque(maxlen=trace_size) if level >= LEVEL_TRACE else None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Замер времени фазы name; время повторных замеров складывается."""
+        if self.level < LEVEL_PHASES:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def event(self, kind: str, detail: str, line: int, col: int) -> None:
+        if self.events is not None:
+            self.events.append((kind, detail, line, col))
+
+    def count_tokens(self, store: TokenStore) -> None:
+        """Счётчики лексического анализа по готовому хранилищу: проход лексера не замедляется."""
+        if self.level < LEVEL_COUNTERS:
+            return
+        self.counters["chars"] += len(store.source)
+        self.counters["lines"] += len(store.line_starts)
+        self.counters["tokens"] += len(store)
+        for code, count in Counter(store.codes).items():
+            self.tokens_by_type[LEX_TYPE_NAMES.get(code, str(code))] += count
+        if self.events is not None:
+            # В буфере остались бы только последние события, поэтому записываются только они
+            for index in range(max(0, len(store) - self.events.maxlen), len(store)):
+                detail = f"{LEX_TYPE_NAMES[store.codes[index]]} {store.value(index)}"
+                self.event("token", detail, store.lines[index], store.column(index))
+
+    def to_dict(self) -> dict:
+        report = {"level": next(name for name, level in LEVEL_NAMES.items() if level == self.level),
+                  "phases_ms": {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()}}
+        if self.level >= LEVEL_COUNTERS:
+            report["counters"] = dict(self.counters, max_statement_depth=self.max_statement_depth,
+                                      max_expression_depth=self.max_expression_depth)
+            report["tokens_by_type"] = dict(self.tokens_by_type.most_common())
+            report["rules"] = dict(self.rules.most_common())
+        if self.events is not None:
+            report["trace"] = [{"event": kind, "detail": detail, "line": line, "col": col}
+                               for kind, detail, line, col in self.events]
+        return report
+
+
+def expression_depth(expr) -> int:
+    """Высота дерева выражения; обход по уровням, без рекурсии."""
+    depth = 0
+    level = [expr]
+    while level:
+        depth += 1
+        below = []
+        for node in level:
+            node_type = type(node)
+            if node_type is Binary:
+                below.append(node.left)
+                below.append(node.right)
+            elif node_type is Unary:
+                below.append(node.operand)
+            elif node_type is CompoundExpr:
+                below.extend(node.items)
+        level = below
+    return depth
+
+
+class InstrumentedParser(Parser):
+    """
+    Parser, который считает вызовы правил грамматики, ошибки и глубину
+    вложенности и записывает события разбора в instrumentation. Проверки
+    есть только в этом подклассе: обычный Parser инструментированием не замедляется.
+    """
+
+    def __init__(self, tokens, instrumentation: Instrumentation, **options):
+        self.instrumentation = instrumentation
+        super().__init__(tokens, **options)
+
+    def trace(self, kind, detail, token):
+        self.instrumentation.event(kind, detail, token.y_coord, token.x_coord)
 
-        if not tokens:
-            print("Ошибка: список токенов пуст после лексера.")
+    def error(self, message, token):
+        if self.diagnostics is None:  # В режиме восстановления ошибку записывает report
+            self.instrumentation.counters["errors"] += 1
+            self.trace("error", message, token)
+        super().error(message, token)
+
+    def report(self, message, token):
+        if self.diagnostics is not None:
+            self.instrumentation.counters["errors"] += 1
+            self.trace("error", message, token)
+        super().report(message, token)
+
+    def parse_program(self):
+        self.instrumentation.rules["program"] += 1
+        return super().parse_program()
+
+    def start_dim(self):
+        self.instrumentation.rules["dim"] += 1
+        self.trace("rule", "dim", self.current_token())
+        return super().start_dim()
+
+    def open_statement(self, frames):
+        instrumentation = self.instrumentation
+        rule = STATEMENT_RULES.get(self.stream.code)
+        if rule is not None:
+            instrumentation.rules[rule] += 1
+            self.trace("rule", rule, self.current_token())
+        node = super().open_statement(frames)
+        # Открытые составные операторы: все кадры, кроме нижнего тела программы
+        depth = len(frames) - (frames[0].kind == FRAME_BODY) if frames else 0
+        if depth > instrumentation.max_statement_depth:
+            instrumentation.max_statement_depth = depth
+        return node
+
+    def parse_expression(self, min_power=0, left=None):
+        instrumentation = self.instrumentation
+        instrumentation.rules["expression"] += 1
+        expr = super().parse_expression(min_power, left)
+        depth = expression_depth(expr)
+        if depth > instrumentation.max_expression_depth:
+            instrumentation.max_expression_depth = depth
+        return expr
+
+
+def analyze_file(filename: str, instrumentation: Optional[Instrumentation] = None,
+                 lexer: Optional[Lexer] = None) -> Tuple[TokenStore, Program]:
+    """
+    Чтение, лексический и синтаксический анализ файла с замером фаз и
+    счётчиками instrumentation (None — без инструментирования).
+    Ошибки анализа передаются вызывающему как обычно.
+    """
+    if instrumentation is None:
+        instrumentation = Instrumentation(LEVEL_OFF)
+    if lexer is None:
+        lexer = Lexer(keywords=KEYWORDS.keys(), separators=SEPARATORS.keys(), operators=OPERATORS.keys())
+    with instrumentation.phase("read"):
+        with open(filename, "r", encoding="utf-8") as file:
+            lines = file.readlines()
+    with instrumentation.phase("lex"):
+        store = lexer.tokenize_store(lines)
+    instrumentation.count_tokens(store)
+    with instrumentation.phase("parse"):
+        if instrumentation.level >= LEVEL_COUNTERS:
+            parser = InstrumentedParser(store, instrumentation)
         else:
-            print("\nСписок токенов после лексического анализа:")
-            for token in tokens:
+            parser = Parser(store)
+        program = parser.parse_program()
+    return store, program
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Лексический и синтаксический анализ программы")
+    parser.add_argument("file", nargs="?", default="input_file_3.txt")
+    parser.add_argument("--tokens", action="store_true", help="вывести список токенов")
+    parser.add_argument("--stats", nargs="?", const="-", metavar="FILE",
+                        help="отчёт JSON о фазах и счётчиках анализа (в FILE или на стандартный вывод)")
+    parser.add_argument("--level", choices=LEVEL_NAMES, help="уровень инструментирования (по умолчанию counters)")
+    parser.add_argument("--trace-size", type=int, default=1000, help="размер кольцевого буфера событий")
+    args = parser.parse_args(argv)
+    level = LEVEL_NAMES[args.level] if args.level else (LEVEL_COUNTERS if args.stats else LEVEL_OFF)
+    instrumentation = Instrumentation(level, args.trace_size)
+    status = 0
+    try:
+        store, _ = analyze_file(args.file, instrumentation)
+        if args.tokens:
+            for token in store:
                 print(token)
-
-        # Создаем экземпляр парсера и анализируем токены
-        print("\n=== Синтаксический анализ ===")
-        parser = Parser(tokens)
-        parser.start_prog()
-
+        print("Программа корректна.")
     except FileNotFoundError:
-        print(f"Ошибка: файл '{input_file}' не найден.")
+        print(f"Ошибка: файл '{args.file}' не найден.")
+        status = 1
     except ValueError as e:
         print(f"Лексическая ошибка: {e}")
+        status = 1
     except SyntaxError as e:
         print(f"Синтаксическая ошибка: {e}")
+        status = 1
     except Exception as e:
         print(f"Неизвестная ошибка: {e}")
+        status = 1
+    if args.stats:
+        report = json.dumps(instrumentation.to_dict(), ensure_ascii=False, indent=2)
+        if args.stats == "-":
+            print(report)
+        else:
+            with open(args.stats, "w", encoding="utf-8") as file:
+                file.write(report + "\n")
+    return status
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
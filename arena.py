@@ -0,0 +1,301 @@
+"""
+Арена выражений: узлы хранятся в параллельных массивах без объекта Python на узел.
+
+Узел — номер в массивах kinds (вид KIND_*), ops (код LexType операции или
+номер вида числа), types (номер типа значения), firsts и seconds
+(операнды, номер литерала или переменной, начало и длина списка элементов
+составного выражения в items). Значения чисел хранятся в literals, объявления
+переменных VarToken — в symbols, по одному разу.
+
+Структурно одинаковые поддеревья совпадают (hash-consing): конструктор
+возвращает номер уже существующего узла с теми же видом, операцией, типом
+и операндами. Поэтому память растёт с числом различных выражений, равенство
+поддеревьев — сравнение номеров, а кэши последующих проходов можно строить
+по номеру узла. Индекс узлов — таблица с открытой адресацией в array("i"):
+ключи не хранятся отдельно, узел сравнивается с искомым по массивам.
+Позиции (строка, столбец) в арене не хранятся: один узел соответствует
+многим местам программы.
+"""
+import gc
+from array import array
+from typing import Iterator, List, Optional, Tuple
+
+from ast_nodes import (Assign, Binary, Block, Boolean, CompoundExpr, Declare, Expr, For, If, Number, Read, Unary,
+                       Variable, While, Write)
+from Kr_kp_TFYA import ERROR_TYPE, NUMBER_FORMS
+
+KIND_NUMBER, KIND_BOOLEAN, KIND_VARIABLE, KIND_UNARY, KIND_BINARY, KIND_COMPOUND = range(6)
+KIND_NAMES = ("number", "boolean", "variable", "unary", "binary", "compound")
+NUMBER_KIND_NAMES = tuple(kind for kind, _ in NUMBER_FORMS)
+NUMBER_KIND_CODES = {kind: code for code, kind in enumerate(NUMBER_KIND_NAMES)}
+TYPE_NAMES = ("INT", "REAL", "BOOL", ERROR_TYPE)
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+TYPE_INT, TYPE_REAL, TYPE_BOOL = range(3)
+
+EMPTY = -1  # Свободная ячейка индекса
+
+
+class ExprArena:
+    """
+    Хранилище выражений с hash-consing. Конструкторы number, boolean,
+    variable, unary, binary и compound принимают номера узлов-операндов
+    и возвращают номер узла; add переносит в арену дерево узлов ast_nodes,
+    expr строит такое дерево обратно.
+    """
+
+    def __init__(self):
+        self.kinds = array("B")
+        self.ops = array("B")
+        self.types = array("B")
+        self.firsts = array("i")
+        self.seconds = array("i")
+        self.items = array("i")  # Элементы составных выражений подряд
+        self.literals = []  # Значения чисел
+        self.literal_ids = {}  # (тип, значение) -> номер в literals
+        self.symbols = []  # Объявления VarToken
+        self.symbol_ids = {}  # VarToken -> номер в symbols
+        self.table = array("i", [EMPTY]) * 8
+        self.lookups = 0  # Вызовы конструкторов, включая найденные в индексе узлы
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @property
+    def nbytes(self) -> int:
+        """Байт в массивах узлов и индекса (без таблиц литералов и переменных)."""
+        return sum(values.itemsize * len(values)
+                   for values in (self.kinds, self.ops, self.types, self.firsts, self.seconds, self.items, self.table))
+
+    def intern(self, kind: int, op: int, type_: int, first: int, second: int) -> int:
+        """Номер узла с такими полями; новый узел добавляется, если его ещё нет."""
+        self.lookups += 1
+        table = self.table
+        mask = len(table) - 1
+        slot = hash((kind, op, type_, first, second)) & mask
+        node = table[slot]
+        while node != EMPTY:
+            if self.firsts[node] == first and self.seconds[node] == second and self.kinds[node] == kind \
+                    and self.ops[node] == op and self.types[node] == type_:
+                return node
+            slot = (slot + 1) & mask
+            node = table[slot]
+        node = len(self.kinds)
+        self.kinds.append(kind)
+        self.ops.append(op)
+        self.types.append(type_)
+        self.firsts.append(first)
+        self.seconds.append(second)
+        table[slot] = node
+        if 2 * len(self.kinds) > len(table):
+            self.rehash()
+        return node
+
+    def node_hash(self, node: int) -> int:
+        kind = self.kinds[node]
+        if kind == KIND_COMPOUND:
+            start = self.firsts[node]
+            return hash((kind, self.types[node], tuple(self.items[start:start + self.seconds[node]])))
+        return hash((kind, self.ops[node], self.types[node], self.firsts[node], self.seconds[node]))
+
+    def rehash(self) -> None:
+        """Индекс вдвое большего размера: заполнен не больше чем наполовину."""
+        table = self.table = array("i", [EMPTY]) * (2 * len(self.table))
+        mask = len(table) - 1
+        for node in range(len(self.kinds)):
+            slot = self.node_hash(node) & mask
+            while table[slot] != EMPTY:
+                slot = (slot + 1) & mask
+            table[slot] = node
+
+    def number(self, kind: str, value) -> int:
+        # Тип входит в ключ, как в Bytecode.constant: 1 не совпадает с 1.0
+        key = (type(value), value)
+        literal = self.literal_ids.get(key)
+        if literal is None:
+            literal = self.literal_ids[key] = len(self.literals)
+            self.literals.append(value)
+        return self.intern(KIND_NUMBER, NUMBER_KIND_CODES[kind], TYPE_REAL if kind == "real" else TYPE_INT, literal, 0)
+
+    def boolean(self, value: bool) -> int:
+        return self.intern(KIND_BOOLEAN, 0, TYPE_BOOL, int(value), 0)
+
+    def variable(self, var) -> int:
+        symbol = self.symbol_ids.get(var)
+        if symbol is None:
+            symbol = self.symbol_ids[var] = len(self.symbols)
+            self.symbols.append(var)
+        return self.intern(KIND_VARIABLE, 0, TYPE_CODES[var.var_type], symbol, 0)
+
+    def unary(self, op: int, operand: int, type_: str = "BOOL") -> int:
+        return self.intern(KIND_UNARY, op, TYPE_CODES[type_], operand, 0)
+
+    def binary(self, op: int, left: int, right: int, type_: str) -> int:
+        return self.intern(KIND_BINARY, op, TYPE_CODES[type_], left, right)
+
+    def compound(self, items: List[int]) -> int:
+        """Составное выражение; его тип — тип последнего элемента."""
+        self.lookups += 1
+        type_ = self.types[items[-1]]
+        count = len(items)
+        key = array("i", items)
+        table = self.table
+        mask = len(table) - 1
+        slot = hash((KIND_COMPOUND, type_, tuple(items))) & mask
+        node = table[slot]
+        while node != EMPTY:
+            if self.kinds[node] == KIND_COMPOUND and self.seconds[node] == count and self.types[node] == type_:
+                start = self.firsts[node]
+                if self.items[start:start + count] == key:
+                    return node
+            slot = (slot + 1) & mask
+            node = table[slot]
+        node = len(self.kinds)
+        self.kinds.append(KIND_COMPOUND)
+        self.ops.append(0)
+        self.types.append(type_)
+        self.firsts.append(len(self.items))
+        self.seconds.append(count)
+        self.items.extend(key)
+        table[slot] = node
+        if 2 * len(self.kinds) > len(table):
+            self.rehash()
+        return node
+
+    def type_name(self, node: int) -> str:
+        return TYPE_NAMES[self.types[node]]
+
+    def children(self, node: int) -> Tuple[int, ...]:
+        """Номера узлов-операндов."""
+        kind = self.kinds[node]
+        if kind == KIND_BINARY:
+            return self.firsts[node], self.seconds[node]
+        if kind == KIND_UNARY:
+            return (self.firsts[node],)
+        if kind == KIND_COMPOUND:
+            start = self.firsts[node]
+            return tuple(self.items[start:start + self.seconds[node]])
+        return ()
+
+    def value(self, node: int):
+        """Значение числа или логической константы, объявление VarToken переменной."""
+        kind = self.kinds[node]
+        if kind == KIND_NUMBER:
+            return self.literals[self.firsts[node]]
+        if kind == KIND_BOOLEAN:
+            return bool(self.firsts[node])
+        if kind == KIND_VARIABLE:
+            return self.symbols[self.firsts[node]]
+        raise ValueError(f"Node {node} is a {KIND_NAMES[kind]} expression, not a leaf")
+
+    def add(self, expr: Expr) -> int:
+        """Номер узла дерева expr; дерево обходится без рекурсии, операнды добавляются раньше операций."""
+        # Арена не создаёт циклических ссылок: сборщик циклов отключается, как при разборе
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.add_tree(expr)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def add_tree(self, expr: Expr) -> int:
+        done = []  # Номера уже добавленных операндов
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            node_type = type(node)
+            if node_type is Variable:
+                done.append(self.variable(node.var))
+            elif node_type is Number:
+                done.append(self.number(node.kind, node.value))
+            elif node_type is Boolean:
+                done.append(self.boolean(node.value))
+            elif not ready:
+                stack.append((node, True))
+                if node_type is Binary:
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+                elif node_type is Unary:
+                    stack.append((node.operand, False))
+                else:
+                    stack.extend((item, False) for item in reversed(node.items))
+            elif node_type is Binary:
+                right = done.pop()
+                done.append(self.binary(node.op, done.pop(), right, node.type))
+            elif node_type is Unary:
+                done.append(self.unary(node.op, done.pop(), node.type))
+            else:
+                count = len(node.items)
+                items = done[-count:]
+                del done[-count:]
+                done.append(self.compound(items))
+        return done[0]
+
+    def expr(self, node: int, line: int = 0, col: int = 0) -> Expr:
+        """Дерево узлов ast_nodes для узла арены; у всех узлов дерева позиция (line, col)."""
+        built = {}  # Номер узла -> уже построенный узел: общие поддеревья строятся один раз
+        stack = [node]
+        while stack:
+            current = stack[-1]
+            if current in built:
+                stack.pop()
+                continue
+            pending = [child for child in self.children(current) if child not in built]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            kind = self.kinds[current]
+            type_ = TYPE_NAMES[self.types[current]]
+            if kind == KIND_NUMBER:
+                result = Number(NUMBER_KIND_NAMES[self.ops[current]], self.value(current), line, col)
+            elif kind == KIND_BOOLEAN:
+                result = Boolean(self.value(current), line, col)
+            elif kind == KIND_VARIABLE:
+                result = Variable(self.value(current), line, col)
+            elif kind == KIND_UNARY:
+                result = Unary(self.ops[current], built[self.firsts[current]], type_, line, col)
+            elif kind == KIND_BINARY:
+                result = Binary(self.ops[current], built[self.firsts[current]], built[self.seconds[current]], type_,
+                                line, col)
+            else:
+                result = CompoundExpr([built[child] for child in self.children(current)], line, col)
+            built[current] = result
+        return built[node]
+
+
+def program_expressions(program) -> Iterator[Expr]:
+    """Выражения операторов программы в порядке текста (без рекурсии по вложенным операторам)."""
+    stack = [iter(program.body)]
+    while stack:
+        statement = next(stack[-1], None)
+        if statement is None:
+            stack.pop()
+            continue
+        statement_type = type(statement)
+        if statement_type is Assign:
+            yield statement.expr
+        elif statement_type is Write:
+            yield from statement.exprs
+        elif statement_type is If:
+            yield statement.cond
+            stack.append(iter(statement.else_body))
+            stack.append(iter(statement.then_body))
+        elif statement_type is While:
+            yield statement.cond
+            stack.append(iter(statement.body))
+        elif statement_type is For:
+            yield statement.start
+            yield statement.stop
+            stack.append(iter(statement.body))
+        elif statement_type is Block:
+            stack.append(iter(statement.body))
+        elif statement_type is not Declare and statement_type is not Read:
+            raise TypeError(f"Unknown statement node: {statement!r}")
+
+
+def intern_program(program, arena: Optional[ExprArena] = None) -> Tuple[ExprArena, List[int]]:
+    """Арена со всеми выражениями программы и номера их корней в порядке program_expressions."""
+    if arena is None:
+        arena = ExprArena()
+    return arena, [arena.add(expr) for expr in program_expressions(program)]
@@ -0,0 +1,259 @@
+"""
+Узлы дерева разбора учебного языка: выражения и операторы программы.
+Операции хранятся целочисленными кодами LexType, переменные — ссылкой на объявление VarToken.
+У выражений есть поле type с типом значения: "INT", "REAL" или "BOOL".
+"""
+
+_FIELDS = {}  # Класс узла -> имена всех его полей
+
+
+class Node:
+    __slots__ = ("line", "col")
+
+    def __init__(self, line: int = 0, col: int = 0):
+        self.line = line
+        self.col = col
+
+
+def node_fields(node_type) -> list:
+    """Имена полей класса узла вместе с полями базовых классов."""
+    fields = _FIELDS.get(node_type)
+    if fields is None:
+        fields = [name for cls in reversed(node_type.__mro__) for name in getattr(cls, "__slots__", ())]
+        _FIELDS[node_type] = fields
+    return fields
+
+
+def iter_nodes(node):
+    """Обходит поддерево node в прямом порядке, включая сам node."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        children = []
+        for name in node_fields(type(node)):
+            value = getattr(node, name)
+            if isinstance(value, Node):
+                children.append(value)
+            elif isinstance(value, list):
+                children.extend(item for item in value if isinstance(item, Node))
+        stack.extend(reversed(children))
+
+
+class Expr(Node):
+    """Выражение; type — тип его значения, вычисленный парсером."""
+    __slots__ = ("type",)
+
+
+class Number(Expr):
+    """Числовая константа: вид (binary, octal, decimal, hexadecimal, real) и значение."""
+    __slots__ = ("kind", "value")
+
+    def __init__(self, kind, value, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.kind = kind
+        self.value = value
+        self.type = "REAL" if kind == "real" else "INT"
+
+    def __repr__(self):
+        return f"Number({self.kind}, {self.value})"
+
+
+class Boolean(Expr):
+    """Логическая константа true или false."""
+    __slots__ = ("value",)
+
+    def __init__(self, value, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.value = value
+        self.type = "BOOL"
+
+    def __repr__(self):
+        return f"Boolean({self.value})"
+
+
+class Variable(Expr):
+    """Обращение к переменной; var — её объявление из таблицы символов."""
+    __slots__ = ("var",)
+
+    def __init__(self, var, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.var = var
+        self.type = var.var_type
+
+    def __repr__(self):
+        return f"Variable({self.var.var_name})"
+
+
+class Unary(Expr):
+    """Унарная операция ~ над множителем."""
+    __slots__ = ("op", "operand")
+
+    def __init__(self, op, operand, type_="BOOL", line=0, col=0):
+        self.line = line
+        self.col = col
+        self.op = op
+        self.operand = operand
+        self.type = type_
+
+    def __repr__(self):
+        return f"Unary({self.op}, {self.operand!r})"
+
+
+class Binary(Expr):
+    """Бинарная операция; op — код LexType операции."""
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op, left, right, type_, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.op = op
+        self.left = left
+        self.right = right
+        self.type = type_
+
+    def __repr__(self):
+        return f"Binary({self.op}, {self.left!r}, {self.right!r})"
+
+
+class CompoundExpr(Expr):
+    """Составное выражение «[» e { : e } «]»; его значение — значение последнего элемента."""
+    __slots__ = ("items",)
+
+    def __init__(self, items, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.items = items
+        self.type = items[-1].type
+
+    def __repr__(self):
+        return f"CompoundExpr({self.items!r})"
+
+
+class Program(Node):
+    """Программа: имя, список операторов и все объявления переменных в порядке появления."""
+    __slots__ = ("name", "body", "symbols")
+
+    def __init__(self, name, body, symbols, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.name = name
+        self.body = body
+        self.symbols = symbols
+
+    def __repr__(self):
+        return f"Program({self.name}, {self.body!r})"
+
+
+class Declare(Node):
+    """Описание dim; vars — объявленные переменные VarToken."""
+    __slots__ = ("vars",)
+
+    def __init__(self, vars_, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.vars = vars_
+
+    def __repr__(self):
+        return f"Declare({[var.var_name for var in self.vars]})"
+
+
+class Assign(Node):
+    """Присваивание <идентификатор> = <выражение>."""
+    __slots__ = ("var", "expr")
+
+    def __init__(self, var, expr, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.var = var
+        self.expr = expr
+
+    def __repr__(self):
+        return f"Assign({self.var.var_name}, {self.expr!r})"
+
+
+class If(Node):
+    """Условный оператор; else_body пуст, если ветви else нет."""
+    __slots__ = ("cond", "then_body", "else_body")
+
+    def __init__(self, cond, then_body, else_body, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.cond = cond
+        self.then_body = then_body
+        self.else_body = else_body
+
+    def __repr__(self):
+        return f"If({self.cond!r}, {self.then_body!r}, {self.else_body!r})"
+
+
+class While(Node):
+    """Цикл с условием while <выражение> do ... end."""
+    __slots__ = ("cond", "body")
+
+    def __init__(self, cond, body, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.cond = cond
+        self.body = body
+
+    def __repr__(self):
+        return f"While({self.cond!r}, {self.body!r})"
+
+
+class For(Node):
+    """Фиксированный цикл for <переменная> = start to stop do ... end; граница stop вычисляется один раз."""
+    __slots__ = ("var", "start", "stop", "body")
+
+    def __init__(self, var, start, stop, body, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.var = var
+        self.start = start
+        self.stop = stop
+        self.body = body
+
+    def __repr__(self):
+        return f"For({self.var.var_name}, {self.start!r}, {self.stop!r}, {self.body!r})"
+
+
+class Read(Node):
+    """Ввод значений переменных vars."""
+    __slots__ = ("vars",)
+
+    def __init__(self, vars_, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.vars = vars_
+
+    def __repr__(self):
+        return f"Read({[var.var_name for var in self.vars]})"
+
+
+class Write(Node):
+    """Вывод значений выражений exprs одной строкой."""
+    __slots__ = ("exprs",)
+
+    def __init__(self, exprs, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.exprs = exprs
+
+    def __repr__(self):
+        return f"Write({self.exprs!r})"
+
+
+class Block(Node):
+    """Составной оператор «[» ... «]» со своей областью видимости."""
+    __slots__ = ("body",)
+
+    def __init__(self, body, line=0, col=0):
+        self.line = line
+        self.col = col
+        self.body = body
+
+    def __repr__(self):
+        return f"Block({self.body!r})"
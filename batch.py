@@ -0,0 +1,200 @@
+"""
+Пакетная проверка множества файлов программ в пуле процессов.
+
+Запуск: python batch.py [--jobs N] [--chunksize N] [--ordered] [--all-errors] [--cache DIR] ПУТЬ ...
+ПУТЬ — файл, каталог (проверяются все *.txt в нём и подкаталогах) или шаблон
+вида "input_file*.txt". Результат по каждому файлу выводится строкой JSON
+в stdout по мере готовности, итоговая сводка — строкой JSON в stderr.
+С --all-errors файл анализируется в режиме восстановления, и в результат
+добавляется список всех его ошибок "diagnostics". С --cache результаты
+анализа хранятся в каталоге DIR (см. cache.py), неизменённые файлы
+повторно не анализируются, а в результат добавляется поле "cached".
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import time
+from functools import partial
+from multiprocessing import Pool
+from typing import Iterable, Iterator, List, Optional
+
+from cache import AnalysisCache
+from Kr_kp_TFYA import KEYWORDS, OPERATORS, SEPARATORS, Lexer, Parser, collect_diagnostics
+
+STATUSES = ("ok", "lexical_error", "syntax_error", "read_error")
+
+_lexer = None  # Лексер процесса: таблицы сканера строятся один раз на процесс, а не на файл
+_cache = None  # Кэш результатов процесса, если задан каталог кэша
+
+
+def init_worker(cache_dir: Optional[str] = None) -> None:
+    global _lexer, _cache
+    _lexer = Lexer(keywords=KEYWORDS.keys(), separators=SEPARATORS.keys(), operators=OPERATORS.keys())
+    _cache = AnalysisCache(cache_dir) if cache_dir else None
+
+
+def expand_paths(patterns: Iterable[str]) -> List[str]:
+    """Раскрывает каталоги и шаблоны в список файлов без повторов, сохраняя порядок."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found = sorted(glob.glob(os.path.join(pattern, "**", "*.txt"), recursive=True))
+        elif glob.has_magic(pattern):
+            found = sorted(glob.glob(pattern, recursive=True))
+        else:
+            found = [pattern]
+        paths.extend(found)
+    return list(dict.fromkeys(paths))
+
+
+def check_file(path: str, all_errors: bool = False) -> dict:
+    """
+    Лексический и синтаксический анализ одного файла; результат — словарь для вывода в JSON.
+    all_errors — собрать все ошибки файла за один проход; статус и позиция берутся по первой.
+    """
+    if _lexer is None:
+        init_worker()
+    if _cache is not None:
+        return check_cached(path, all_errors)
+    result = {"file": path, "status": "ok"}
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            lines = file.readlines()
+    except (OSError, UnicodeDecodeError) as error:
+        result["status"] = "read_error"
+        result["message"] = str(error)
+        return result
+    result.update(check_lines(lines, all_errors))
+    return result
+
+
+def check_source(source: str, all_errors: bool = False) -> dict:
+    """Анализ текста программы, как check_file, но без чтения файла и без поля "file" (см. server.py)."""
+    if _lexer is None:
+        init_worker()
+    if _cache is not None:
+        return analysis_result(_cache.analyze(source.encode("utf-8"), all_errors), all_errors)
+    # Переводы строк те же, что при чтении файла в текстовом режиме
+    return check_lines(io.StringIO(source, newline=None).readlines(), all_errors)
+
+
+def check_lines(lines: List[str], all_errors: bool = False) -> dict:
+    """
+    Анализ строк программы лексером процесса: статус и первая ошибка, с
+    all_errors — ещё все диагностики. Идентификаторы программы после анализа
+    удаляются из таблицы имён лексера: иначе она росла бы с каждым файлом
+    или запросом долго работающего процесса.
+    """
+    names_count = len(_lexer.names)
+    try:
+        return analyze_lines(lines, all_errors)
+    finally:
+        _lexer.forget_names(names_count)
+
+
+def analyze_lines(lines: List[str], all_errors: bool = False) -> dict:
+    result = {"status": "ok"}
+    if all_errors:
+        _, diagnostics = collect_diagnostics(lines, _lexer)
+        if diagnostics:
+            first = diagnostics[0]
+            result["status"] = f"{first.kind}_error"
+            result["message"] = first.message
+            result["line"], result["col"] = first.line, first.col
+        result["diagnostics"] = [diagnostic.to_dict() for diagnostic in diagnostics]
+        return result
+    try:
+        Parser(_lexer.tokenize_store(lines)).parse_program()
+    except ValueError as error:
+        result["status"] = "lexical_error"
+        result["message"] = str(error)
+        result["line"], result["col"] = getattr(error, "position", (None, None))
+    except SyntaxError as error:
+        result["status"] = "syntax_error"
+        result["message"] = str(error)
+        result["line"], result["col"] = getattr(error, "position", (None, None))
+    return result
+
+
+def check_cached(path: str, all_errors: bool = False) -> dict:
+    """check_file через кэш процесса: результат тот же, с полем "cached" — None, "memory" или "disk"."""
+    result = {"file": path, "status": "ok"}
+    try:
+        analysis = _cache.analyze_file(path, all_errors)
+    except (OSError, UnicodeDecodeError) as error:
+        result["status"] = "read_error"
+        result["message"] = str(error)
+        return result
+    result.update(analysis_result(analysis, all_errors))
+    return result
+
+
+def analysis_result(analysis, all_errors: bool = False) -> dict:
+    """Поля результата по записи кэша Analysis."""
+    result = {"status": analysis.status}
+    if analysis.status != "ok":
+        result["message"] = analysis.message
+        result["line"], result["col"] = analysis.line, analysis.col
+    if all_errors:
+        result["diagnostics"] = [diagnostic.to_dict() for diagnostic in analysis.diagnostics]
+    result["cached"] = analysis.cached
+    return result
+
+
+def check_files(paths: List[str], jobs: int = 0, chunksize: int = 0, ordered: bool = False,
+                all_errors: bool = False, cache_dir: Optional[str] = None) -> Iterator[dict]:
+    """
+    Выдаёт результаты проверки по мере готовности. jobs=0 — по числу процессоров,
+    jobs=1 — в текущем процессе без пула; chunksize=0 подбирается по числу файлов.
+    cache_dir — каталог кэша результатов, общий для всех процессов.
+    """
+    check = partial(check_file, all_errors=True) if all_errors else check_file
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(paths) < 2:
+        init_worker(cache_dir)
+        yield from map(check, paths)
+        return
+    if not chunksize:
+        # Крупные порции уменьшают число обменов с процессами, но не должны оставлять процессы без работы
+        chunksize = max(1, min(256, len(paths) // (jobs * 8)))
+    with Pool(jobs, initializer=init_worker, initargs=(cache_dir,)) as pool:
+        if ordered:
+            yield from pool.imap(check, paths, chunksize)
+        else:
+            yield from pool.imap_unordered(check, paths, chunksize)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Пакетная проверка программ")
+    parser.add_argument("paths", nargs="+", help="файлы, каталоги или шаблоны")
+    parser.add_argument("--jobs", type=int, default=0, help="число процессов (по умолчанию — по числу процессоров)")
+    parser.add_argument("--chunksize", type=int, default=0, help="файлов в одной порции для процесса")
+    parser.add_argument("--ordered", action="store_true", help="выводить результаты в порядке файлов")
+    parser.add_argument("--all-errors", action="store_true", help="сообщать все ошибки файла, а не только первую")
+    parser.add_argument("--cache", metavar="DIR", help="каталог кэша результатов анализа")
+    args = parser.parse_args(argv)
+
+    paths = expand_paths(args.paths)
+    counts = dict.fromkeys(STATUSES, 0)
+    start = time.perf_counter()
+    write = sys.stdout.write
+    cached = dict.fromkeys(("memory", "disk", None), 0)
+    for result in check_files(paths, args.jobs, args.chunksize, args.ordered, args.all_errors, args.cache):
+        counts[result["status"]] += 1
+        if "cached" in result:
+            cached[result["cached"]] += 1
+        write(json.dumps(result, ensure_ascii=False) + "\n")
+    elapsed = time.perf_counter() - start
+    summary = {"files": len(paths), **counts, "seconds": round(elapsed, 3),
+               "files_per_sec": round(len(paths) / elapsed) if elapsed > 0 else None}
+    if args.cache:
+        summary["cache"] = {"memory_hits": cached["memory"], "disk_hits": cached["disk"], "misses": cached[None]}
+    print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+    return 0 if counts["ok"] == len(paths) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
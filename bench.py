@@ -0,0 +1,1040 @@
+"""
+Микробенчмарки лексера и парсера учебного языка.
+
+Запуск: python bench.py numbers [--count N] [--seed S]
+        python bench.py vm [--file input_file.txt] [--runs N] [--input 3 --input 1.5] [--passes all]
+        python bench.py vector [--file input_file.txt] [--lanes N] [--low 0] [--high 24]
+        python bench.py codegen [--size N] [--runs N]
+        python bench.py incremental [--blocks N] [--edits N]
+        python bench.py file [--statements N] [--path generated.txt]
+        python bench.py tokens [--statements N]
+        python bench.py parallel [--statements N] [--jobs 1,2,4]
+        python bench.py cache [--files N] [--statements N]
+        python bench.py nesting [--depths 100,1000,10000,100000]
+        python bench.py dataflow [--sizes 5000,10000,20000,40000] [--dims N]
+        python bench.py arena [--statements 10000,100000]
+        python bench.py server [--clients N] [--requests N] [--statements N] [--jobs N]
+        python bench.py scaling [--axes statements,depth] [--save base.json] [--compare base.json]
+        python bench.py compare base.json current.json [--threshold 0.2]
+
+scaling измеряет лексер и парсер на программах generator.ProgramGenerator,
+изменяя по одному параметру от базового набора SCALING_BASE. Результат —
+JSON с кривой по каждой оси; его можно сохранить как эталон и сравнить
+с ним следующий запуск: пропускная способность ниже эталона или пиковая
+память выше него больше чем на threshold считаются регрессией (код выхода 1).
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import pickle
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from arena import (KIND_BINARY, KIND_BOOLEAN, KIND_COMPOUND, KIND_NUMBER, KIND_UNARY, KIND_VARIABLE, ExprArena,
+                   program_expressions)
+from ast_nodes import Binary, Boolean, CompoundExpr, Number, Read, Unary, Variable, iter_nodes
+from batch import check_source
+from cache import AnalysisCache
+from codegen import CodeCache, CompiledProgram, compile_code
+from dataflow import ControlFlowGraph, DefiniteDefaults, LiveVariables, ReachingDefaults, check_program, solve
+from Kr_kp_TFYA import KEYWORDS, OPERATORS, SEPARATORS, Lexer, Parser, classify_number, decode_lines
+from generator import generate_program
+from incremental import IncrementalDocument
+from optimizer import DEFAULT_PASSES, optimize
+from parallel_lexer import tokenize_parallel
+from server import AnalysisClient, AnalysisServer
+from tokenfile import load_tokens, write_tokens
+from vector import VectorExecutor
+from vm import VM, ExecutionError, compile_program
+
+
+def make_lexer() -> Lexer:
+    return Lexer(keywords=KEYWORDS.keys(), separators=SEPARATORS.keys(), operators=OPERATORS.keys())
+
+
+def best_time(func: Callable[[], object], repeat: int, min_total: float = 0.0) -> float:
+    """Лучшее время из repeat запусков; запуски продолжаются, пока их общее время меньше min_total секунд."""
+    best = float("inf")
+    total = 0.0
+    runs = 0
+    while runs < repeat or total < min_total:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+        runs += 1
+    return best
+
+
+def peak_memory(func: Callable[[], object]) -> int:
+    """Наибольший объём памяти (байт), выделенной Python во время func()."""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def retained_memory(func: Callable[[], object]) -> int:
+    """Объём памяти (байт), которую занимает результат func() после её завершения."""
+    tracemalloc.start()
+    try:
+        result = func()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current
+
+
+def random_number(rnd: random.Random) -> str:
+    """Случайная числовая лексема одного из пяти видов."""
+    kind = rnd.randrange(5)
+    if kind == 0:
+        return format(rnd.randrange(1, 1 << 16), "b") + rnd.choice("Bb")
+    if kind == 1:
+        return format(rnd.randrange(1, 1 << 16), "o") + rnd.choice("Oo")
+    if kind == 2:
+        return str(rnd.randrange(1 << 16)) + rnd.choice(("", "D", "d"))
+    if kind == 3:
+        return str(rnd.randrange(10)) + format(rnd.randrange(1 << 16), "X") + rnd.choice("Hh")
+    return f"{rnd.randrange(1000)}.{rnd.randrange(1000)}" + rnd.choice(("", "e5", "E-3", "e+12"))
+
+
+def number_lines(count: int, seed: int = 1, per_line: int = 8) -> List[str]:
+    """Строки присваиваний, состоящие почти из одних чисел."""
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(0, count, per_line):
+        numbers = [random_number(rnd) for _ in range(per_line)]
+        lines.append("a = " + " plus ".join(numbers) + "\n")
+    return lines
+
+
+def bench_numbers(count: int = 200000, seed: int = 1, repeat: int = 3) -> dict:
+    """Пропускная способность разбора чисел: классификатор и лексер на числовом входе."""
+    lines = number_lines(count, seed)
+    lexemes = [random_number(random.Random(seed)) for _ in range(count)]
+    numbers = len(lines) * 8
+
+    classify_time = best_time(lambda: [classify_number(lexeme) for lexeme in lexemes], repeat)
+    tokens_time = best_time(lambda: make_lexer().tokenize(lines), repeat)
+    store_time = best_time(lambda: make_lexer().tokenize_store(lines), repeat)
+    return {
+        "numbers": numbers,
+        "classify_per_sec": round(count / classify_time),
+        "tokenize_numbers_per_sec": round(numbers / tokens_time),
+        "tokenize_store_numbers_per_sec": round(numbers / store_time),
+    }
+
+
+def parse_program(lines: List[str]):
+    """Дерево программы без отладочного вывода парсера."""
+    return Parser(make_lexer().tokenize_store(lines)).parse_program()
+
+
+def bench_vm(filename: str = "input_file.txt", runs: int = 20000, inputs: Sequence[str] = ("3", "1.5"),
+             passes: Sequence[str] = (), repeat: int = 3) -> dict:
+    """
+    Компиляция программы и многократное выполнение её байт-кода на одних и тех же
+    входных данных; passes — оптимизирующие проходы, применяемые перед компиляцией.
+    """
+    with open(filename, "r", encoding="utf-8") as file:
+        lines = file.readlines()
+    program = parse_program(lines)
+    removed = optimize(program, passes)
+    compile_time = best_time(lambda: compile_program(program), repeat)
+    bytecode = compile_program(program)
+    vm = VM(bytecode)
+    output = vm.run(inputs, count=True)
+    executed = vm.executed
+
+    def run_all():
+        for _ in range(runs):
+            vm.run(inputs)
+
+    run_time = best_time(run_all, repeat)
+    return {
+        "file": filename,
+        "removed_nodes": removed,
+        "instructions": len(bytecode),
+        "executed_per_run": executed,
+        "output": output,
+        "compile_ms": round(compile_time * 1000, 3),
+        "runs_per_sec": round(runs / run_time),
+        "instructions_per_sec": round(runs * executed / run_time),
+    }
+
+
+def bench_vector(filename: str = "input_file.txt", lanes: int = 1000000, low: float = 0.0, high: float = 24.0,
+                 seed: int = 1, vm_runs: int = 20000, check: int = 1000, repeat: int = 3) -> dict:
+    """
+    Выполнение программы на lanes наборах входных данных: VectorExecutor над
+    столбцами NumPy против VM, запускаемой на каждый набор. Значения read —
+    равномерно распределённые числа из [low, high), по одному на каждую
+    переменную операторов read программы. Первые check наборов сверяются с VM.
+    """
+    import numpy as np
+    with open(filename, "r", encoding="utf-8") as file:
+        program = parse_program(file.readlines())
+    values = sum(len(node.vars) for node in iter_nodes(program) if isinstance(node, Read))
+    inputs = np.random.default_rng(seed).uniform(low, high, (lanes, values))
+    executor = VectorExecutor(program)
+    vector_time = best_time(lambda: executor.run(inputs), repeat)
+    result = executor.run(inputs)
+
+    vm = VM(compile_program(program))
+    rows = inputs[:max(vm_runs, check)].tolist()
+
+    def run_scalar(row):
+        try:
+            return vm.run(row), None
+        except ExecutionError as error:
+            return None, str(error)
+
+    vm_time = best_time(lambda: [run_scalar(row) for row in rows[:vm_runs]], repeat)
+    mismatches = 0
+    for lane, row in enumerate(rows[:check]):
+        vector_error = result.error(lane)
+        if run_scalar(row) != ((None, vector_error) if vector_error else (result.output(lane), None)):
+            mismatches += 1
+    return {
+        "file": filename,
+        "lanes": lanes,
+        "inputs_per_lane": values,
+        "failed_lanes": int(result.failed.sum()),
+        "vector_ms": round(vector_time * 1000, 1),
+        "vector_rows_per_sec": round(lanes / vector_time),
+        "vm_rows_per_sec": round(vm_runs / vm_time),
+        "speedup": round(lanes / vector_time / (vm_runs / vm_time), 1),
+        "checked_lanes": min(check, lanes),
+        "mismatches": mismatches,
+    }
+
+
+LOOP_PROGRAMS = {
+    # Вложенные for с целой и вещественной арифметикой
+    "nested_for": """program loops
+dim n as integer
+dim i as integer
+dim j as integer
+dim s as integer
+dim x as real
+read n
+for i = 1 to n do
+  for j = 1 to n do
+    s = s plus i mult j div 3 min j
+    x = x plus 0.5 mult i
+  end
+end
+write (s, x)
+end
+""",
+    # while с ветвлением в теле
+    "while_if": """program loops
+dim n as integer
+dim i as integer
+dim s as integer
+read n
+while i LT n mult n do
+  if (i div 2) mult 2 EQ i then s = s min 1 else s = s plus 2 end
+  i = i plus 1
+end
+write (s, i)
+end
+""",
+    # Подсчёт простых чисел перебором делителей
+    "primes": """program loops
+dim n as integer
+dim k as integer
+dim d as integer
+dim count as integer
+dim prime as boolean
+read n
+for k = 2 to n mult 20 do
+  prime = true
+  d = 2
+  while prime and (d mult d LE k) do
+    if k min (k div d) mult d EQ 0 then prime = false end
+    d = d plus 1
+  end
+  if prime then count = count plus 1 end
+end
+write (count)
+end
+""",
+}
+
+
+def bench_codegen(size: int = 300, runs: int = 2000, repeat: int = 3) -> dict:
+    """
+    Программа, скомпилированная в код Python (codegen), против VM: циклы
+    LOOP_PROGRAMS с read n = size и многократный запуск короткой
+    input_file.txt. Для каждой программы — время компиляции без кэша и из
+    кэша в памяти и время выполнения; выводы обеих реализаций сверяются.
+    """
+    result = {}
+    cases = [(name, source, [str(size)], 1) for name, source in LOOP_PROGRAMS.items()]
+    with open("input_file.txt", "r", encoding="utf-8") as file:
+        cases.append(("input_file.txt", file.read(), ["3", "1.5"], runs))
+    for name, source, inputs, count in cases:
+        data = source.encode("utf-8")
+        program = parse_program(decode_lines(data))
+        vm = VM(compile_program(program))
+        compiled = CompiledProgram(compile_code(program))
+
+        def cold():
+            CodeCache().load_program(data)
+
+        cache = CodeCache()
+        cache.load_program(data)
+        vm_time = best_time(lambda: [vm.run(inputs) for _ in range(count)], repeat)
+        python_time = best_time(lambda: [compiled.run(inputs) for _ in range(count)], repeat)
+        result[name] = {
+            "runs": count,
+            "compile_ms": round(best_time(cold, repeat) * 1000, 3),
+            "cached_load_ms": round(best_time(lambda: cache.load_program(data), repeat) * 1000, 3),
+            "vm_ms": round(vm_time * 1000, 1),
+            "python_ms": round(python_time * 1000, 1),
+            "speedup": round(vm_time / python_time, 1),
+            "same_output": vm.run(inputs) == compiled.run(inputs),
+        }
+    # Выражение и вложенность циклов глубже, чем компилирует CPython: load_program выполняет программы на VM
+    depth = 5000
+    deep_cases = [
+        ("deep_chain", deep_chain_program(depth), ["2"], [str(1 + 2 * depth)]),
+        ("deep_nesting", nested_while_program(depth), ["0"], ["1"]),
+    ]
+    for name, source, inputs, expected in deep_cases:
+        data = source.encode("utf-8")
+        loaded = CodeCache().load_program(data)
+        result[name] = {
+            "depth": depth,
+            "compile_ms": round(best_time(lambda: CodeCache().load_program(data), repeat) * 1000, 3),
+            "runs_on": type(loaded).__name__,
+            "same_output": loaded.run(inputs) == expected,
+        }
+    return result
+
+
+def nested_while_program(depth: int) -> str:
+    """Программа из depth вложенных циклов while a LT 1, самый внутренний увеличивает a."""
+    return ("program nest\ndim a as integer\nread a\n" + "while a LT 1 do\n" * depth + "a = a plus 1\n"
+            + "end\n" * depth + "write (a)\nend\n")
+
+
+def deep_chain_program(operands: int) -> str:
+    """Программа с присваиванием цепочки из operands сложений: a = 1 plus a plus a ..."""
+    chain = " plus ".join(["a"] * operands)
+    return f"program chain\ndim a as integer\nread a\na = 1 plus {chain}\nwrite (a)\nend\n"
+
+
+def long_program(blocks: int) -> List[str]:
+    """Длинная корректная программа из повторяющихся циклов с ветвлениями: 10 строк на блок."""
+    lines = ["program long\n", "dim a, b, c as integer\n", "dim r as real\n", "dim f as boolean\n"]
+    for index in range(blocks):
+        lines += [
+            "a = 0\n",
+            "while a LT 10 do\n",
+            "  a = a plus 1\n",
+            "  if a GT 5 then\n",
+            f"    b = b plus a mult {index % 7 + 1}\n",
+            "  else\n",
+            "    r = r plus 1.5 { шаг }\n",
+            "  end\n",
+            "end\n",
+            "c = c plus 1 : f = ~f\n",
+        ]
+    lines.append("write (a, b, c)\nend\n")
+    return lines
+
+
+def bench_incremental(blocks: int = 1000, edits: int = 200) -> dict:
+    """Правка одной строки в середине длинной программы: инкрементальный анализ против полного."""
+    lines = long_program(blocks)
+    full_time = best_time(lambda: parse_program(lines), 3)
+    start = time.perf_counter()
+    document = IncrementalDocument(lines)
+    document.analyze()
+    open_time = time.perf_counter() - start
+
+    target = 4 + (blocks // 2) * 10 + 4  # Строка "b = b plus a mult k" в среднем блоке
+    comment = target + 2  # Строка с комментарием: её правка меняет состояние лексера
+    times = []
+    reparsed = 0
+    for index in range(edits):
+        if index % 4 == 3:
+            # Открытая скобка комментария: перелексируется всё до следующей «}»
+            line_no, text = comment, ("    r = r plus 1.5 { шаг\n" if index % 8 == 3 else "    r = r plus 1.5 { шаг }\n")
+        else:
+            line_no, text = target, f"    b = b plus a mult {index % 9 + 1}\n"
+        start = time.perf_counter()
+        document.set_line(line_no, text)
+        try:
+            document.analyze()
+        except (ValueError, SyntaxError):
+            pass
+        times.append(time.perf_counter() - start)
+        reparsed += document.reparsed
+    times.sort()
+    return {
+        "lines": len(lines),
+        "full_parse_ms": round(full_time * 1000, 2),
+        "open_ms": round(open_time * 1000, 2),
+        "edit_median_ms": round(times[len(times) // 2] * 1000, 3),
+        "edit_p90_ms": round(times[len(times) * 9 // 10] * 1000, 3),
+        "statements_reparsed_per_edit": round(reparsed / edits, 2),
+    }
+
+
+def bench_cache(files: int = 200, statements: int = 300) -> dict:
+    """
+    Анализ набора разных программ без кэша, с промахами (анализ и запись на диск),
+    с попаданиями в памяти и с попаданиями на диске в новом экземпляре кэша.
+    """
+    texts = ["".join(generate_program(seed, statements=statements)).encode("utf-8") for seed in range(files)]
+    directory = tempfile.mkdtemp()
+    try:
+        def analyze_all(cache: AnalysisCache) -> float:
+            start = time.perf_counter()
+            for text in texts:
+                cache.analyze(text)
+            return time.perf_counter() - start
+
+        def parse_all() -> None:
+            for text in texts:
+                Parser(make_lexer().tokenize_store(decode_lines(text))).parse_program()
+
+        cache = AnalysisCache(directory, memory_entries=files)
+        timings = {"uncached": best_time(parse_all, 3), "miss": analyze_all(cache), "memory_hit": analyze_all(cache)}
+        disk_cache = AnalysisCache(directory)
+        timings["disk_hit"] = analyze_all(disk_cache)
+        stats = {"first": cache.stats.to_dict(), "second": disk_cache.stats.to_dict()}
+        result = {"files": files, "tokens": sum(len(cache.analyze(text).tokens) for text in texts)}
+        for name, seconds in timings.items():
+            result[f"{name}_ms"] = round(seconds * 1000, 1)
+        result["disk_bytes"] = sum(size for _, size, _ in disk_cache.disk_entries())
+        result["stats"] = stats
+        return result
+    finally:
+        shutil.rmtree(directory)
+
+
+def read_lines(filename: str) -> List[str]:
+    with open(filename, "r", encoding="utf-8") as file:
+        return file.readlines()
+
+
+def bench_file(statements: int = 100000, filename: Optional[str] = None, repeat: int = 3) -> dict:
+    """
+    Лексический анализ файла двумя путями: readlines() и tokenize_store по str
+    против отображения в память и tokenize_file по байтам; затем разбор результата.
+    Если filename не задан, программа генерируется во временный файл.
+    """
+    temporary = filename is None
+    if temporary:
+        handle, filename = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(handle, "w", encoding="utf-8") as file:
+            file.writelines(generate_program(1, statements=statements, depth=3, dims=30, comments=0.1))
+    try:
+        tokens = len(make_lexer().tokenize_store(read_lines(filename)))
+
+        def by_lines():
+            return make_lexer().tokenize_store(read_lines(filename))
+
+        def by_bytes():
+            store = make_lexer().tokenize_file(filename)
+            store.close()
+            return store
+
+        def parse_lines():
+            Parser(make_lexer().tokenize_store(read_lines(filename))).parse_program()
+
+        def parse_bytes():
+            store = make_lexer().tokenize_file(filename)
+            Parser(store).parse_program()
+            store.close()
+
+        phases = {"readlines_tokenize_store": by_lines, "tokenize_file": by_bytes,
+                  "readlines_tokenize_store_parse": parse_lines, "tokenize_file_parse": parse_bytes}
+        result = {"file": filename if not temporary else None, "bytes": os.path.getsize(filename), "tokens": tokens}
+        for name, func in phases.items():
+            seconds = best_time(func, repeat)
+            result[name] = {"ms": round(seconds * 1000, 1), "tokens_per_sec": round(tokens / seconds),
+                            "peak_kb": round(peak_memory(func) / 1024)}
+        return result
+    finally:
+        if temporary:
+            os.remove(filename)
+
+
+def bench_tokens(statements: int = 100000, repeat: int = 3) -> dict:
+    """
+    Передача токенов между этапами: двоичный файл tokenfile (запись,
+    загрузка через mmap, разбор загруженного) против повторного
+    лексического анализа и pickle списка объектов Token.
+    """
+    directory = tempfile.mkdtemp()
+    source = os.path.join(directory, "program.txt")
+    target = os.path.join(directory, "program.tok")
+    try:
+        with open(source, "w", encoding="utf-8") as file:
+            file.writelines(generate_program(1, statements=statements, depth=3, dims=30, comments=0.1))
+        store = make_lexer().tokenize_file(source)
+        tokens = len(store)
+
+        def load():
+            load_tokens(target).close()
+
+        def parse_loaded():
+            loaded = load_tokens(target)
+            Parser(loaded).parse_program()
+            loaded.close()
+
+        lex_time = best_time(lambda: make_lexer().tokenize_file(source).close(), repeat)
+        write_time = best_time(lambda: write_tokens(store, target), repeat)
+        load_time = best_time(load, repeat)
+        parse_time = best_time(lambda: Parser(store).parse_program(), repeat)
+        parse_loaded_time = best_time(parse_loaded, repeat)
+        loaded = load_tokens(target)
+        same = all(list(getattr(store, name)) == list(getattr(loaded, name)) for name in ("codes", "refs", "lines"))
+        loaded.close()
+        pickled = pickle.dumps(store.to_tokens(), pickle.HIGHEST_PROTOCOL)
+        unpickle_time = best_time(lambda: pickle.loads(pickled), repeat)
+        return {
+            "tokens": tokens,
+            "source_bytes": os.path.getsize(source),
+            "file_bytes": os.path.getsize(target),
+            "pickle_bytes": len(pickled),
+            "lex_ms": round(lex_time * 1000, 1),
+            "write_ms": round(write_time * 1000, 1),
+            "load_ms": round(load_time * 1000, 2),
+            "load_tokens_per_sec": round(tokens / load_time),
+            "unpickle_ms": round(unpickle_time * 1000, 1),
+            "parse_lexed_ms": round(parse_time * 1000, 1),
+            "parse_loaded_ms": round(parse_loaded_time * 1000, 1),
+            "same_tokens": same,
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_parallel(statements: int = 300000, jobs: Sequence[int] = (), repeat: int = 3) -> dict:
+    """
+    Лексический анализ одного большого файла: tokenize_file против
+    tokenize_parallel с разным числом процессов. Пул создаётся заранее,
+    поэтому запуск процессов во время не входит; результат сверяется
+    с последовательным.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    jobs = list(jobs) or sorted({1, 2, os.cpu_count() or 1})
+    handle, filename = tempfile.mkstemp(suffix=".txt")
+    try:
+        with os.fdopen(handle, "w", encoding="utf-8") as file:
+            file.writelines(generate_program(1, statements=statements, depth=3, dims=30, comments=0.1))
+        reference = make_lexer().tokenize_file(filename)
+        sequential = best_time(lambda: make_lexer().tokenize_file(filename).close(), repeat)
+        result = {"cpu_count": os.cpu_count(), "bytes": os.path.getsize(filename), "tokens": len(reference),
+                  "sequential_ms": round(sequential * 1000, 1), "parallel": []}
+        for count in jobs:
+            with ProcessPoolExecutor(count) as executor:
+                list(executor.map(abs, range(count)))  # Процессы пула запускаются до измерения
+                seconds = best_time(lambda: tokenize_parallel(filename, count, executor=executor).close(), repeat)
+                store = tokenize_parallel(filename, count, executor=executor)
+                same = store.numbers == reference.numbers and all(
+                    list(getattr(store, name)) == list(getattr(reference, name))
+                    for name in ("codes", "starts", "ends", "refs", "line_starts"))
+                store.close()
+            result["parallel"].append({"jobs": count, "ms": round(seconds * 1000, 1),
+                                       "speedup": round(sequential / seconds, 2), "same_tokens": same})
+        reference.close()
+        return result
+    finally:
+        os.remove(filename)
+
+
+def nested_program(kind: str, depth: int) -> List[str]:
+    """Программа с одной конструкцией kind, вложенной depth раз (см. NESTING_KINDS)."""
+    if kind == "parens":
+        body = ["a = " + "(" * depth + "a" + ")" * depth + "\n"]
+    elif kind == "not":
+        body = ["f = " + "~" * depth + "f\n"]
+    elif kind == "compound":
+        body = ["a = " + "[1 : " * depth + "a" + "]" * depth + "\n"]
+    elif kind == "while":
+        body = ["while f do\n"] * depth + ["f = true\n"] + ["end\n"] * depth
+    elif kind == "blocks":
+        body = ["[\n"] * depth + ["a = 1\n"] + ["]\n"] * depth
+    else:
+        body = ["if f then f = false else\n"] * depth + ["f = true\n"] + ["end\n"] * depth
+    return ["program nested\n", "dim a as integer\n", "dim f as boolean\n"] + body + ["end\n"]
+
+
+NESTING_KINDS = ("parens", "not", "compound", "while", "blocks", "if_else")
+
+
+def bench_nesting(depths: Sequence[int] = (100, 1000, 10000, 100000), repeat: int = 3) -> dict:
+    """
+    Разбор глубоко вложенных конструкций: время на уровень вложенности.
+    Парсер не рекурсивен, поэтому глубина ограничена только памятью.
+    """
+    result = {"recursion_limit": sys.getrecursionlimit()}
+    for kind in NESTING_KINDS:
+        curve = []
+        for depth in depths:
+            store = make_lexer().tokenize_store(nested_program(kind, depth))
+            seconds = best_time(lambda: Parser(store).parse_program(), repeat)
+            curve.append({"depth": depth, "ms": round(seconds * 1000, 2),
+                          "us_per_level": round(seconds * 1e6 / depth, 3)})
+        result[kind] = curve
+    return result
+
+
+def bench_dataflow(sizes: Sequence[int] = (5000, 10000, 20000, 40000), dims: int = 1000, repeat: int = 3) -> dict:
+    """
+    Построение графа потока управления и check_program на сгенерированных
+    программах: при dims переменных (fixed_dims) и при числе переменных,
+    равном числу операторов (dims_equal_statements). passes_per_block —
+    пересчётов блока рабочим списком в среднем по трём задачам.
+    """
+    result = {}
+    for axis in ("fixed_dims", "dims_equal_statements"):
+        curve = []
+        for size in sizes:
+            program = parse_program(generate_program(1, dims=dims if axis == "fixed_dims" else size, statements=size,
+                                                     depth=3))
+            build = best_time(lambda: ControlFlowGraph(program), repeat)
+            cfg = ControlFlowGraph(program)
+            check = best_time(lambda: check_program(program, cfg), repeat)
+            passes = sum(solve(problem(cfg)).passes for problem in (ReachingDefaults, DefiniteDefaults, LiveVariables))
+            curve.append({
+                "statements": size,
+                "variables": len(cfg.vars),
+                "blocks": len(cfg.blocks),
+                "cfg_ms": round(build * 1000, 1),
+                "check_ms": round(check * 1000, 1),
+                "us_per_statement": round((build + check) * 1e6 / size, 1),
+                "passes_per_block": round(passes / 3 / len(cfg.blocks), 2),
+                "check_peak_mb": round(peak_memory(lambda: check_program(program, cfg)) / 2 ** 20, 1),
+                "warnings": len(check_program(program, cfg)),
+            })
+        result[axis] = curve
+    return result
+
+
+def constructor_calls(exprs) -> list:
+    """
+    Вызовы конструкторов, которые строят деревья exprs: операнды раньше
+    операций, None — конец очередного дерева (см. build_objects и build_arena).
+    """
+    calls = []
+    for expr in exprs:
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            node_type = type(node)
+            if node_type is Number:
+                calls.append((KIND_NUMBER, node.kind, node.value))
+            elif node_type is Boolean:
+                calls.append((KIND_BOOLEAN, node.value))
+            elif node_type is Variable:
+                calls.append((KIND_VARIABLE, node.var))
+            elif not ready:
+                stack.append((node, True))
+                if node_type is Binary:
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+                elif node_type is Unary:
+                    stack.append((node.operand, False))
+                else:
+                    stack.extend((item, False) for item in reversed(node.items))
+            elif node_type is Binary:
+                calls.append((KIND_BINARY, node.op, node.type))
+            elif node_type is Unary:
+                calls.append((KIND_UNARY, node.op, node.type))
+            else:
+                calls.append((KIND_COMPOUND, len(node.items)))
+        calls.append(None)
+    return calls
+
+
+def build_objects(calls: list) -> list:
+    """Деревья узлов ast_nodes по вызовам constructor_calls: объект на каждый узел."""
+    roots = []
+    stack = []
+    for call in calls:
+        if call is None:
+            roots.append(stack.pop())
+            continue
+        kind = call[0]
+        if kind == KIND_BINARY:
+            right = stack.pop()
+            stack.append(Binary(call[1], stack.pop(), right, call[2]))
+        elif kind == KIND_VARIABLE:
+            stack.append(Variable(call[1]))
+        elif kind == KIND_NUMBER:
+            stack.append(Number(call[1], call[2]))
+        elif kind == KIND_BOOLEAN:
+            stack.append(Boolean(call[1]))
+        elif kind == KIND_UNARY:
+            stack.append(Unary(call[1], stack.pop(), call[2]))
+        else:
+            items = stack[-call[1]:]
+            del stack[-call[1]:]
+            stack.append(CompoundExpr(items))
+    return roots
+
+
+def build_arena(calls: list) -> Tuple[ExprArena, List[int]]:
+    """Те же деревья в ExprArena: номера корней."""
+    arena = ExprArena()
+    roots = []
+    stack = []
+    for call in calls:
+        if call is None:
+            roots.append(stack.pop())
+            continue
+        kind = call[0]
+        if kind == KIND_BINARY:
+            right = stack.pop()
+            stack.append(arena.binary(call[1], stack.pop(), right, call[2]))
+        elif kind == KIND_VARIABLE:
+            stack.append(arena.variable(call[1]))
+        elif kind == KIND_NUMBER:
+            stack.append(arena.number(call[1], call[2]))
+        elif kind == KIND_BOOLEAN:
+            stack.append(arena.boolean(call[1]))
+        elif kind == KIND_UNARY:
+            stack.append(arena.unary(call[1], stack.pop(), call[2]))
+        else:
+            items = stack[-call[1]:]
+            del stack[-call[1]:]
+            stack.append(arena.compound(items))
+    return arena, roots
+
+
+def bench_arena(statements: Sequence[int] = (10000, 100000), repeat: int = 3) -> dict:
+    """
+    Выражения input_file.txt и сгенерированных программ: объекты ast_nodes
+    (объект на узел) против ExprArena. Оба варианта строятся по одной
+    последовательности вызовов конструкторов при отключённом сборщике циклов,
+    как при разборе; память — занятая результатом после построения.
+    """
+    sources = [("input_file.txt", read_lines("input_file.txt"))]
+    sources.extend((f"generated_{count}", generate_program(1, statements=count)) for count in statements)
+    result = {}
+    for name, lines in sources:
+        calls = constructor_calls(program_expressions(parse_program(lines)))
+        expressions = calls.count(None)
+        nodes = len(calls) - expressions
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            objects_time = best_time(lambda: build_objects(calls), repeat, 0.2)
+            arena_time = best_time(lambda: build_arena(calls), repeat, 0.2)
+            objects_memory = retained_memory(lambda: build_objects(calls))
+            arena_memory = retained_memory(lambda: build_arena(calls))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        arena, _ = build_arena(calls)
+        result[name] = {
+            "expressions": expressions,
+            "nodes": nodes,
+            "distinct_nodes": len(arena),
+            "objects_ms": round(objects_time * 1000, 2),
+            "arena_ms": round(arena_time * 1000, 2),
+            "objects_bytes_per_node": round(objects_memory / nodes, 1),
+            "arena_bytes_per_node": round(arena_memory / nodes, 1),
+            "memory_ratio": round(objects_memory / arena_memory, 2),
+        }
+    return result
+
+
+def bench_server(clients: int = 8, requests: int = 400, statements: int = 200, jobs: int = 0,
+                 spawn_runs: int = 10) -> dict:
+    """
+    Задержка и пропускная способность server.AnalysisServer: clients соединений
+    одновременно отправляют запросы с разными программами, каждое следующий
+    после ответа на предыдущий. Для сравнения — анализ тех же текстов в текущем
+    процессе и запуск процесса Kr_kp_TFYA.py на каждую программу.
+    """
+    sources = ["".join(generate_program(seed, statements=statements)) for seed in range(min(requests, 64))]
+    latencies = []
+    statuses = {}
+
+    async def load() -> Tuple[float, int]:
+        server = AnalysisServer(jobs)
+        await server.start(port=0)
+        host, port = server.address()[:2]
+
+        async def client(index: int) -> None:
+            connection = await AnalysisClient.connect(host, port)
+            try:
+                for number in range(index, requests, clients):
+                    start = time.perf_counter()
+                    response = await connection.analyze(sources[number % len(sources)])
+                    latencies.append(time.perf_counter() - start)
+                    statuses[response["status"]] = statuses.get(response["status"], 0) + 1
+            finally:
+                await connection.close()
+
+        try:
+            start = time.perf_counter()
+            await asyncio.gather(*(client(index) for index in range(clients)))
+            return time.perf_counter() - start, server.jobs
+        finally:
+            await server.close()
+
+    elapsed, jobs = asyncio.run(load())
+    latencies.sort()
+    in_process = best_time(lambda: [check_source(source) for source in sources], 3) / len(sources)
+
+    handle, filename = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(handle, "w", encoding="utf-8") as file:
+        file.write(sources[0])
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Kr_kp_TFYA.py")
+    spawn = []
+    try:
+        for _ in range(spawn_runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script, filename], stdout=subprocess.DEVNULL, check=False)
+            spawn.append(time.perf_counter() - start)
+    finally:
+        os.remove(filename)
+    spawn.sort()
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "jobs": jobs,
+        "statuses": statuses,
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "latency_p99_ms": round(latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000, 2),
+        "latency_max_ms": round(latencies[-1] * 1000, 2),
+        "in_process_ms_per_request": round(in_process * 1000, 2),
+        "process_per_request_ms": round(spawn[len(spawn) // 2] * 1000, 1),
+    }
+
+
+# Базовые параметры генератора и значения, которые принимает каждая ось кривой
+SCALING_BASE = {"dims": 12, "statements": 2000, "depth": 2, "expr_len": 4, "comments": 0.1}
+SCALING_MIN_TIME = 0.5  # Секунд замеров на фазу: лучшее время меньше зависит от случайных задержек
+SCALING_AXES = {
+    "statements": (500, 1000, 2000, 4000, 8000),
+    "dims": (12, 120, 1200, 6000),
+    "depth": (0, 1, 2, 3, 4),
+    "expr_len": (1, 4, 16, 64),
+    "comments": (0.0, 0.25, 0.5, 1.0),
+}
+
+
+def measure_phases(lines: List[str], repeat: int = 5) -> dict:
+    """
+    Время и пиковая память отдельно для лексера (tokenize — список Token,
+    tokenize_store — колоночное хранилище) и для парсера по готовому хранилищу.
+    Парсер вызывается через parse_program: это start_prog без отладочного вывода.
+    """
+    store = make_lexer().tokenize_store(lines)
+    tokens = len(store)
+    phases = {
+        "tokenize": lambda: make_lexer().tokenize(lines),
+        "tokenize_store": lambda: make_lexer().tokenize_store(lines),
+        "parse": lambda: Parser(store).parse_program(),
+    }
+    result = {"lines": len(lines), "tokens": tokens, "phases": {}}
+    for name, func in phases.items():
+        seconds = best_time(func, repeat, SCALING_MIN_TIME)
+        result["phases"][name] = {
+            "ms": round(seconds * 1000, 3),
+            "tokens_per_sec": round(tokens / seconds),
+            "lines_per_sec": round(len(lines) / seconds),
+            "ns_per_token": round(seconds * 1e9 / tokens, 1),
+            "peak_kb": round(peak_memory(func) / 1024),
+        }
+    return result
+
+
+def bench_scaling(axes: Sequence[str] = tuple(SCALING_AXES), seed: int = 1, repeat: int = 5) -> dict:
+    """Кривые масштабирования: для каждой оси — замеры при каждом её значении, остальные параметры базовые."""
+    curves = {}
+    for axis in axes:
+        if axis not in SCALING_AXES:
+            raise ValueError(f"Unknown scaling axis: {axis}")
+        points = []
+        for value in SCALING_AXES[axis]:
+            options = dict(SCALING_BASE, **{axis: value})
+            point = {"value": value}
+            point.update(measure_phases(generate_program(seed, **options), repeat))
+            points.append(point)
+        curves[axis] = points
+    return {"python": platform.python_version(), "seed": seed, "repeat": repeat, "base": SCALING_BASE,
+            "curves": curves}
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.2) -> List[dict]:
+    """
+    Регрессии current относительно baseline: фаза, у которой пропускная способность
+    упала или пиковая память выросла больше чем на threshold. Сравниваются только
+    точки, которые есть в обоих результатах.
+    """
+    regressions = []
+    for axis, points in current["curves"].items():
+        base_points = {point["value"]: point for point in baseline["curves"].get(axis, ())}
+        for point in points:
+            base_point = base_points.get(point["value"])
+            if base_point is None:
+                continue
+            for phase, stats in point["phases"].items():
+                base_stats = base_point["phases"].get(phase)
+                if base_stats is None:
+                    continue
+                # Пропускная способность ухудшается при уменьшении, память — при росте
+                for metric, sign in (("tokens_per_sec", -1), ("peak_kb", 1)):
+                    change = (stats[metric] - base_stats[metric]) / max(base_stats[metric], 1)
+                    if change * sign > threshold:
+                        regressions.append({"axis": axis, "value": point["value"], "phase": phase, "metric": metric,
+                                            "baseline": base_stats[metric], "current": stats[metric],
+                                            "change": f"{change * 100:+.1f}%"})
+    return regressions
+
+
+def report_regressions(regressions: List[dict], threshold: float) -> int:
+    """Печатает регрессии в stderr; возвращает код выхода."""
+    for item in regressions:
+        print(f"REGRESSION {item['axis']}={item['value']} {item['phase']} {item['metric']}: "
+              f"{item['baseline']} -> {item['current']} ({item['change']})", file=sys.stderr)
+    if not regressions:
+        print(f"No regressions beyond {threshold:.0%}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def load_json(filename: str) -> dict:
+    with open(filename, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Микробенчмарки лексера и парсера")
+    sub = parser.add_subparsers(dest="command", required=True)
+    numbers = sub.add_parser("numbers", help="разбор числовых литералов")
+    numbers.add_argument("--count", type=int, default=200000)
+    numbers.add_argument("--seed", type=int, default=1)
+    vm = sub.add_parser("vm", help="выполнение байт-кода программы")
+    vm.add_argument("--file", default="input_file.txt")
+    vm.add_argument("--runs", type=int, default=20000)
+    vm.add_argument("--input", action="append", help="значение для read (можно повторять)")
+    vm.add_argument("--passes", default="", help="проходы оптимизации через запятую или all")
+    vector = sub.add_parser("vector", help="выполнение программы на многих наборах входных данных (NumPy) против VM")
+    vector.add_argument("--file", default="input_file.txt")
+    vector.add_argument("--lanes", type=int, default=1000000, help="число наборов входных данных")
+    vector.add_argument("--low", type=float, default=0.0, help="нижняя граница входных значений")
+    vector.add_argument("--high", type=float, default=24.0, help="верхняя граница входных значений")
+    codegen = sub.add_parser("codegen", help="программа, скомпилированная в код Python, против VM на циклах")
+    codegen.add_argument("--size", type=int, default=300, help="значение n для read в программах с циклами")
+    codegen.add_argument("--runs", type=int, default=2000, help="запусков input_file.txt")
+    incremental = sub.add_parser("incremental", help="инкрементальный анализ после правки одной строки")
+    incremental.add_argument("--blocks", type=int, default=1000)
+    incremental.add_argument("--edits", type=int, default=200)
+    file_bench = sub.add_parser("file", help="лексический анализ файла: readlines и str против mmap и байтов")
+    file_bench.add_argument("--statements", type=int, default=100000, help="размер сгенерированной программы")
+    file_bench.add_argument("--path", help="файл программы вместо сгенерированного")
+    tokens_bench = sub.add_parser("tokens", help="двоичный файл токенов против повторного анализа и pickle")
+    tokens_bench.add_argument("--statements", type=int, default=100000, help="размер сгенерированной программы")
+    parallel = sub.add_parser("parallel", help="лексический анализ большого файла в нескольких процессах")
+    parallel.add_argument("--statements", type=int, default=300000, help="размер сгенерированной программы")
+    parallel.add_argument("--jobs", default="", help="числа процессов через запятую (по умолчанию 1, 2, все процессоры)")
+    cache_bench = sub.add_parser("cache", help="кэш результатов анализа: промахи, попадания в памяти и на диске")
+    cache_bench.add_argument("--files", type=int, default=200)
+    cache_bench.add_argument("--statements", type=int, default=300)
+    nesting = sub.add_parser("nesting", help="разбор глубоко вложенных конструкций: время на уровень")
+    nesting.add_argument("--depths", default="100,1000,10000,100000", help="глубины через запятую")
+    dataflow = sub.add_parser("dataflow", help="граф потока управления и анализ потока данных: время на оператор")
+    dataflow.add_argument("--sizes", default="5000,10000,20000,40000", help="числа операторов через запятую")
+    dataflow.add_argument("--dims", type=int, default=1000, help="число переменных в кривой fixed_dims")
+    arena_bench = sub.add_parser("arena", help="выражения в арене с hash-consing против объекта на узел")
+    arena_bench.add_argument("--statements", default="10000,100000", help="размеры сгенерированных программ")
+    server_bench = sub.add_parser("server", help="сервер анализа под нагрузкой: задержка и запросы в секунду")
+    server_bench.add_argument("--clients", type=int, default=8, help="одновременных соединений")
+    server_bench.add_argument("--requests", type=int, default=400)
+    server_bench.add_argument("--statements", type=int, default=200, help="размер программы в запросе")
+    server_bench.add_argument("--jobs", type=int, default=0, help="процессов пула сервера")
+    scaling = sub.add_parser("scaling", help="кривые масштабирования лексера и парсера на сгенерированных программах")
+    scaling.add_argument("--axes", default=",".join(SCALING_AXES), help="оси через запятую: " + ", ".join(SCALING_AXES))
+    scaling.add_argument("--seed", type=int, default=1)
+    scaling.add_argument("--repeat", type=int, default=5)
+    scaling.add_argument("--save", help="сохранить результат в файл JSON (эталон)")
+    scaling.add_argument("--compare", help="сравнить результат с эталоном из файла JSON")
+    scaling.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение, доля")
+    compare = sub.add_parser("compare", help="сравнить два сохранённых результата scaling")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args(argv)
+
+    if args.command == "numbers":
+        print(json.dumps(bench_numbers(args.count, args.seed), ensure_ascii=False, indent=2))
+    elif args.command == "vm":
+        inputs = args.input if args.input is not None else ("3", "1.5")
+        passes = DEFAULT_PASSES if args.passes == "all" else [name for name in args.passes.split(",") if name]
+        print(json.dumps(bench_vm(args.file, args.runs, inputs, passes), ensure_ascii=False, indent=2))
+    elif args.command == "vector":
+        print(json.dumps(bench_vector(args.file, args.lanes, args.low, args.high), ensure_ascii=False, indent=2))
+    elif args.command == "codegen":
+        print(json.dumps(bench_codegen(args.size, args.runs), ensure_ascii=False, indent=2))
+    elif args.command == "incremental":
+        print(json.dumps(bench_incremental(args.blocks, args.edits), ensure_ascii=False, indent=2))
+    elif args.command == "file":
+        print(json.dumps(bench_file(args.statements, args.path), ensure_ascii=False, indent=2))
+    elif args.command == "tokens":
+        print(json.dumps(bench_tokens(args.statements), ensure_ascii=False, indent=2))
+    elif args.command == "parallel":
+        jobs = [int(count) for count in args.jobs.split(",") if count]
+        print(json.dumps(bench_parallel(args.statements, jobs), ensure_ascii=False, indent=2))
+    elif args.command == "cache":
+        print(json.dumps(bench_cache(args.files, args.statements), ensure_ascii=False, indent=2))
+    elif args.command == "nesting":
+        depths = [int(depth) for depth in args.depths.split(",") if depth]
+        print(json.dumps(bench_nesting(depths), ensure_ascii=False, indent=2))
+    elif args.command == "dataflow":
+        sizes = [int(size) for size in args.sizes.split(",") if size]
+        print(json.dumps(bench_dataflow(sizes, args.dims), ensure_ascii=False, indent=2))
+    elif args.command == "arena":
+        statements = [int(count) for count in args.statements.split(",") if count]
+        print(json.dumps(bench_arena(statements), ensure_ascii=False, indent=2))
+    elif args.command == "server":
+        print(json.dumps(bench_server(args.clients, args.requests, args.statements, args.jobs), ensure_ascii=False,
+                         indent=2))
+    elif args.command == "scaling":
+        axes = [axis for axis in args.axes.split(",") if axis]
+        unknown = [axis for axis in axes if axis not in SCALING_AXES]
+        if unknown:
+            parser.error(f"unknown scaling axis: {', '.join(unknown)}")
+        result = bench_scaling(axes, args.seed, args.repeat)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        if args.save:
+            with open(args.save, "w", encoding="utf-8") as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+        if args.compare:
+            return report_regressions(compare_results(load_json(args.compare), result, args.threshold),
+                                      args.threshold)
+    elif args.command == "compare":
+        return report_regressions(compare_results(load_json(args.baseline), load_json(args.current), args.threshold),
+                                  args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Кэш результатов лексического и синтаксического анализа по содержимому текста.
+
+Ключ записи — SHA-256 от таблиц грамматики (KEYWORDS, OPERATORS, SEPARATORS),
+режима анализа и байтов исходного текста. Неизменённый текст не анализируется
+повторно ни в этом процессе, ни в следующем запуске, а после изменения
+грамматики старые записи просто перестают находиться. Запись содержит поток
+токенов (массивы TokenStore), список объявленных переменных и результат
+разбора: статус и первую ошибку или, в режиме all_errors, все диагностики.
+
+Записи хранятся в памяти (LRU на memory_entries записей) и, если задан
+каталог, на диске: файл на запись, общий размер ограничен disk_limit байт,
+при превышении удаляются записи, к которым дольше всего не обращались.
+Записи на диске читаются через marshal, поэтому каталог кэша должен быть
+доверенным.
+"""
+import hashlib
+import marshal
+import os
+import tempfile
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from Kr_kp_TFYA import (KEYWORDS, OPERATORS, SEPARATORS, Diagnostic, Lexer, Parser, TokenStore, decode_lines,
+                        merge_diagnostics)
+
+CACHE_FORMAT = 1  # Увеличивается при изменении состава записи
+TOKEN_ARRAYS = ("codes", "starts", "ends", "lines", "refs", "line_starts")
+ENTRY_SUFFIX = ".entry"
+DISK_EVICT_TARGET = 0.75  # Вытеснение освобождает место с запасом, а не до самого предела
+
+
+def grammar_digest() -> bytes:
+    """Хэш таблиц грамматики и формата записи: общая часть ключа всех записей."""
+    tables = [CACHE_FORMAT, array("I").itemsize]
+    for table in (KEYWORDS, OPERATORS, SEPARATORS):
+        tables.append(sorted((lexeme, lex_type.name) for lexeme, lex_type in table.items()))
+    return hashlib.sha256(repr(tables).encode("utf-8")).digest()
+
+
+def analyze_source(data: bytes, all_errors: bool = False) -> Tuple[dict, Optional[TokenStore]]:
+    """
+    Анализирует текст и возвращает запись кэша и хранилище токенов (None, если
+    лексический анализ прерван ошибкой). Лексер создаётся на каждый текст,
+    чтобы номера имён в записи не зависели от ранее проанализированных текстов.
+    """
+    start = time.perf_counter()
+    lines = decode_lines(data)
+    lexer = Lexer(keywords=KEYWORDS.keys(), separators=SEPARATORS.keys(), operators=OPERATORS.keys())
+    entry = {"format": CACHE_FORMAT, "status": "ok", "message": None, "line": None, "col": None,
+             "diagnostics": None}
+    store = parser = None
+    if all_errors:
+        lexical = lexer.diagnostics = []
+        store = lexer.tokenize_store(lines)
+        syntax = []
+        parser = Parser(store, diagnostics=syntax)
+        parser.parse_program()
+        diagnostics = merge_diagnostics(lexical, syntax, len(lines))
+        if diagnostics:
+            first = diagnostics[0]
+            entry.update(status=f"{first.kind}_error", message=first.message, line=first.line, col=first.col)
+        entry["diagnostics"] = [(item.message, item.line, item.col, item.kind) for item in diagnostics]
+    else:
+        try:
+            store = lexer.tokenize_store(lines)
+            parser = Parser(store)
+            parser.parse_program()
+        except (ValueError, SyntaxError) as error:
+            line, col = getattr(error, "position", (None, None))
+            status = "lexical_error" if isinstance(error, ValueError) else "syntax_error"
+            entry.update(status=status, message=str(error), line=line, col=col)
+    # Объявления до первой ошибки, если разбор прерван
+    entry["symbols"] = [(var.var_name, var.var_type, var.y_coord, var.x_coord, var.level)
+                        for var in (parser.tokens_var if parser is not None else ())]
+    if store is not None:
+        entry["tokens"] = {name: getattr(store, name).tobytes() for name in TOKEN_ARRAYS}
+        entry["names"] = store.names
+        entry["numbers"] = store.numbers
+    else:
+        entry["tokens"] = entry["names"] = entry["numbers"] = None
+    entry["seconds"] = time.perf_counter() - start
+    return entry, store
+
+
+class Analysis:
+    """
+    Результат анализа текста. status — "ok", "lexical_error" или "syntax_error";
+    message, line, col — первая ошибка; cached — откуда взят результат:
+    None (анализ выполнен), "memory" или "disk"; seconds — время исходного анализа.
+    Токены, объявления и диагностики восстанавливаются из записи при обращении.
+    """
+
+    def __init__(self, entry: dict, data: bytes, cached: Optional[str] = None, store: Optional[TokenStore] = None):
+        self.entry = entry
+        self.data = data
+        self.cached = cached
+        self.status = entry["status"]
+        self.message = entry["message"]
+        self.line = entry["line"]
+        self.col = entry["col"]
+        self.seconds = entry["seconds"]
+        self._tokens = store
+
+    @property
+    def tokens(self) -> Optional[TokenStore]:
+        """Хранилище токенов текста; None, если лексический анализ прерван ошибкой."""
+        if self._tokens is None and self.entry["tokens"] is not None:
+            store = TokenStore("".join(decode_lines(self.data)), list(self.entry["names"]))
+            for name, raw in self.entry["tokens"].items():
+                getattr(store, name).frombytes(raw)
+            store.numbers = list(self.entry["numbers"])
+            self._tokens = store
+        return self._tokens
+
+    @property
+    def symbols(self) -> List[Tuple[str, str, int, int, int]]:
+        """Объявленные переменные: (имя, тип, строка, столбец, уровень вложенности)."""
+        return [tuple(symbol) for symbol in self.entry["symbols"]]
+
+    @property
+    def diagnostics(self) -> Optional[List[Diagnostic]]:
+        """Все ошибки текста в режиме all_errors, иначе None."""
+        if self.entry["diagnostics"] is None:
+            return None
+        return [Diagnostic(*fields) for fields in self.entry["diagnostics"]]
+
+
+class CacheStats:
+    """Счётчики обращений к кэшу; saved_seconds — сумма времени анализа, которое заменили попадания."""
+    __slots__ = ("memory_hits", "disk_hits", "misses", "evictions", "disk_evictions", "saved_seconds")
+
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.saved_seconds = 0.0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def to_dict(self) -> dict:
+        counters = {name: getattr(self, name) for name in self.__slots__}
+        counters["saved_seconds"] = round(self.saved_seconds, 3)
+        return counters
+
+    def __repr__(self):
+        return f"CacheStats(hits={self.hits}, misses={self.misses}, saved={self.saved_seconds:.3f}s)"
+
+
+class AnalysisCache:
+    """
+    directory — каталог записей на диске (None — только память);
+    memory_entries — число записей в памяти; disk_limit — предел размера
+    каталога в байтах.
+    """
+
+    def __init__(self, directory: Optional[str] = None, memory_entries: int = 256, disk_limit: int = 256 * 2 ** 20):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.disk_limit = disk_limit
+        self.memory = OrderedDict()  # Ключ -> запись, от давно использованных к недавним
+        self.stats = CacheStats()
+        self.grammar = grammar_digest()
+        self.disk_size = None  # Размер каталога; вычисляется при первой записи на диск
+
+    def key(self, data: bytes, all_errors: bool = False) -> str:
+        digest = hashlib.sha256(self.grammar)
+        digest.update(b"all" if all_errors else b"first")
+        digest.update(data)
+        return digest.hexdigest()
+
+    def analyze(self, data: bytes, all_errors: bool = False) -> Analysis:
+        """Результат анализа текста: из памяти, с диска или, при промахе, новым анализом."""
+        key = self.key(data, all_errors)
+        stats = self.stats
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+            stats.memory_hits += 1
+            stats.saved_seconds += entry["seconds"]
+            return Analysis(entry, data, "memory")
+        entry = self.load(key)
+        if entry is not None:
+            stats.disk_hits += 1
+            stats.saved_seconds += entry["seconds"]
+            self.remember(key, entry)
+            return Analysis(entry, data, "disk")
+        stats.misses += 1
+        entry, store = analyze_source(data, all_errors)
+        self.remember(key, entry)
+        self.save(key, entry)
+        return Analysis(entry, data, None, store)
+
+    def analyze_file(self, path: str, all_errors: bool = False) -> Analysis:
+        with open(path, "rb") as file:
+            return self.analyze(file.read(), all_errors)
+
+    def remember(self, key: str, entry: dict) -> None:
+        memory = self.memory
+        memory[key] = entry
+        memory.move_to_end(key)
+        while len(memory) > self.memory_entries:
+            memory.popitem(last=False)
+            self.stats.evictions += 1
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def load(self, key: str) -> Optional[dict]:
+        """Запись с диска или None; повреждённая запись или запись другого формата считается промахом."""
+        if self.directory is None:
+            return None
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                entry = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):  # Записи нет или она повреждена
+            return None
+        if not isinstance(entry, dict) or entry.get("format") != CACHE_FORMAT:
+            return None
+        try:
+            os.utime(path)  # Время изменения файла служит временем последнего обращения
+        except OSError:
+            pass  # Запись уже вытеснена другим процессом
+        return entry
+
+    def save(self, key: str, entry: dict) -> None:
+        """Записывает запись на диск атомарно (через временный файл) и вытесняет старые при превышении предела."""
+        if self.directory is None:
+            return
+        data = marshal.dumps(entry)
+        if len(data) > self.disk_limit:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if self.disk_size is None:
+            self.disk_size = sum(size for _, size, _ in self.disk_entries())
+        path = self.path(key)
+        try:
+            replaced = os.path.getsize(path)  # Перезаписываемая запись того же ключа
+        except OSError:
+            replaced = 0
+        handle, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return
+        self.disk_size += len(data) - replaced
+        if self.disk_size > self.disk_limit:
+            self.evict_disk()
+
+    def disk_entries(self) -> List[Tuple[float, int, str]]:
+        """Записи каталога: (время последнего обращения, размер, путь)."""
+        entries = []
+        for item in os.scandir(self.directory):
+            if not item.name.endswith(ENTRY_SUFFIX):
+                continue
+            try:
+                stat = item.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, item.path))
+        return entries
+
+    def evict_disk(self) -> None:
+        """Удаляет записи, к которым дольше всего не обращались, до доли DISK_EVICT_TARGET предела."""
+        entries = sorted(self.disk_entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_limit * DISK_EVICT_TARGET
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                self.stats.disk_evictions += 1
+            except FileNotFoundError:
+                pass  # Удалена другим процессом
+            total -= size
+        self.disk_size = total
+
+    def clear(self) -> None:
+        """Удаляет все записи из памяти и с диска."""
+        self.memory.clear()
+        if self.directory is not None and os.path.isdir(self.directory):
+            for _, _, path in self.disk_entries():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self.disk_size = None
@@ -0,0 +1,321 @@
+"""
+Компиляция дерева программы в код Python.
+
+PythonCompiler переводит Program в ast.Module с одной функцией program:
+переменные программы становятся её локальными переменными, if и while —
+операторами Python, for ... to ... do — циклом for по range, если тело не
+изменяет счётчик и обе границы целые, иначе циклом while. read и write
+вызывают функции, которые передаются функции программы при запуске.
+Модуль компилируется compile() один раз и выполняется со скоростью обычного
+кода Python. Вывод и ошибки выполнения те же, что у VM: исключения
+переводятся в ExecutionError, а номер строки берётся из трассировки, потому
+что операторы сохраняют номера строк исходного текста.
+
+Объекты кода кэшируются по SHA-256 исходного текста (CodeCache). CPython не
+компилирует больше 20 вложенных циклов и слишком глубокие выражения; такие
+программы load_program выполняет на VM.
+"""
+import ast
+import builtins
+import hashlib
+import time
+from importlib.util import MAGIC_NUMBER
+from types import CodeType
+from typing import Iterable, List, Optional, Union
+
+from ast_nodes import (Assign, Binary, Block, Boolean, CompoundExpr, Declare, For, If, Number, Read, Unary, Variable,
+                       While, Write, iter_nodes)
+from cache import CACHE_FORMAT, AnalysisCache
+from Kr_kp_TFYA import KEYWORDS, OPERATORS, SEPARATORS, Lexer, Parser, decode_lines
+from vm import DEFAULT_VALUES, VM, ExecutionError, compile_program, convert_input, format_value, truncate_div
+
+CODEGEN_FORMAT = 2  # Увеличивается при изменении генерируемого кода
+FUNCTION_NAME = "program"
+# Параметры функции программы; локальные переменные программы (v<номер>_<имя>) с ними не совпадают
+FUNCTION_TEMPLATE = f"def {FUNCTION_NAME}(_read, _write, _div):\n    pass\n"
+
+BINARY_OPS = {
+    OPERATORS["plus"].value: ast.Add,
+    OPERATORS["min"].value: ast.Sub,
+    OPERATORS["mult"].value: ast.Mult,
+    # and/or над boolean: обе части вычисляются, как в VM
+    OPERATORS["and"].value: ast.BitAnd,
+    OPERATORS["or"].value: ast.BitOr,
+}
+COMPARE_OPS = {
+    OPERATORS["EQ"].value: ast.Eq,
+    OPERATORS["NE"].value: ast.NotEq,
+    OPERATORS["LT"].value: ast.Lt,
+    OPERATORS["LE"].value: ast.LtE,
+    OPERATORS["GT"].value: ast.Gt,
+    OPERATORS["GE"].value: ast.GtE,
+}
+CODE_DIV = OPERATORS["div"].value
+
+
+def name(identifier: str, store: bool = False) -> ast.Name:
+    return ast.Name(id=identifier, ctx=ast.Store() if store else ast.Load())
+
+
+def call(function: str, *args) -> ast.Call:
+    return ast.Call(func=name(function), args=list(args), keywords=[])
+
+
+def assigns(body, var) -> bool:
+    """Изменяет ли какой-нибудь оператор body переменную var."""
+    for statement in body:
+        for node in iter_nodes(statement):
+            node_type = type(node)
+            if node_type is Assign or node_type is For:
+                if node.var is var:
+                    return True
+            elif (node_type is Read or node_type is Declare) and var in node.vars:
+                return True
+    return False
+
+
+class PythonCompiler:
+    """Переводит дерево Program в ast.Module с функцией program(_read, _write, _div)."""
+
+    def __init__(self):
+        self.names = {}  # Объявление VarToken -> имя локальной переменной
+        self.hidden = 0  # Число скрытых переменных границ циклов for
+        self.statements = {
+            Declare: self.compile_declare,
+            Assign: self.compile_assign,
+            If: self.compile_if,
+            While: self.compile_while,
+            For: self.compile_for,
+            Read: self.compile_read,
+            Write: self.compile_write,
+            Block: self.compile_block,
+        }
+
+    def compile(self, program) -> ast.Module:
+        self.names = {var: f"v{index}_{var.var_name}" for index, var in enumerate(program.symbols)}
+        self.hidden = 0
+        module = ast.parse(FUNCTION_TEMPLATE)
+        function = module.body[0]
+        # Все переменные получают начальные значения при входе, как слоты VM: dim в невыполненной ветви
+        # не оставляет имя несвязанным, а выполненный dim присваивает значение заново
+        defaults = [ast.Assign(targets=[name(self.names[var], True)], value=ast.Constant(DEFAULT_VALUES[var.var_type]),
+                               lineno=1, end_lineno=1)
+                    for var in program.symbols]
+        function.body = defaults + self.compile_body(program.body) or [ast.Pass(lineno=1, end_lineno=1)]
+        return ast.fix_missing_locations(module)
+
+    def compile_body(self, body) -> list:
+        statements = []
+        for node in body:
+            for statement in self.statements[type(node)](node):
+                # Операторы вложенного блока [ ... ] уже имеют свои строки
+                if getattr(statement, "lineno", None) is None:
+                    statement.lineno = statement.end_lineno = node.line
+                statements.append(statement)
+        return statements
+
+    def block(self, body) -> list:
+        """Тело составного оператора Python: пустое тело — pass."""
+        return self.compile_body(body) or [ast.Pass()]
+
+    def compile_block(self, node) -> list:
+        return self.compile_body(node.body)
+
+    def compile_declare(self, node) -> list:
+        return [ast.Assign(targets=[name(self.names[var], True)], value=ast.Constant(DEFAULT_VALUES[var.var_type]))
+                for var in node.vars]
+
+    def store(self, var, expr) -> ast.Assign:
+        """Присваивание с приведением числового типа, как в VM."""
+        value = self.expr(expr)
+        if var.var_type == "INT" and expr.type == "REAL":
+            value = call("int", value)
+        elif var.var_type == "REAL" and expr.type == "INT":
+            value = call("float", value)
+        return ast.Assign(targets=[name(self.names[var], True)], value=value)
+
+    def compile_assign(self, node) -> list:
+        return [self.store(node.var, node.expr)]
+
+    def compile_if(self, node) -> list:
+        orelse = self.compile_body(node.else_body) if node.else_body else []
+        return [ast.If(test=self.expr(node.cond), body=self.block(node.then_body), orelse=orelse)]
+
+    def compile_while(self, node) -> list:
+        return [ast.While(test=self.expr(node.cond), body=self.block(node.body), orelse=[])]
+
+    def compile_for(self, node) -> list:
+        """
+        Граница вычисляется один раз и хранится в скрытой переменной. Цикл по
+        range после завершения оставляет в счётчике границу, а VM — границу
+        плюс один; это исправляет присваивание после цикла.
+        """
+        counter = self.names[node.var]
+        stop = f"_stop{self.hidden}"
+        self.hidden += 1
+        header = [self.store(node.var, node.start),
+                  ast.Assign(targets=[name(stop, True)], value=self.expr(node.stop))]
+        body = self.block(node.body)
+        if node.var.var_type == "INT" and node.stop.type == "INT" and not assigns(node.body, node.var):
+            limit = ast.BinOp(left=name(stop), op=ast.Add(), right=ast.Constant(1))
+            loop = ast.For(target=name(counter, True), iter=call("range", name(counter), limit), body=body,
+                           orelse=[])
+            last = ast.Compare(left=name(counter), ops=[ast.Eq()], comparators=[name(stop)])
+            after = ast.If(test=last, body=[ast.Assign(targets=[name(counter, True)], value=limit)], orelse=[])
+            return header + [loop, after]
+        test = ast.Compare(left=name(counter), ops=[ast.LtE()], comparators=[name(stop)])
+        step = ast.AugAssign(target=name(counter, True), op=ast.Add(), value=ast.Constant(1), lineno=node.line,
+                             end_lineno=node.line)
+        return header + [ast.While(test=test, body=body + [step], orelse=[])]
+
+    def compile_read(self, node) -> list:
+        return [ast.Assign(targets=[name(self.names[var], True)], value=call("_read", ast.Constant(var.var_type)))
+                for var in node.vars]
+
+    def compile_write(self, node) -> list:
+        return [ast.Expr(value=call("_write", *(self.expr(expr) for expr in node.exprs)))]
+
+    def expr(self, node) -> ast.expr:
+        node_type = type(node)
+        if node_type is Binary:
+            left = self.expr(node.left)
+            right = self.expr(node.right)
+            if node.op == CODE_DIV:
+                if node.type == "INT":
+                    return call("_div", left, right)
+                return ast.BinOp(left=left, op=ast.Div(), right=right)
+            op = BINARY_OPS.get(node.op)
+            if op is not None:
+                return ast.BinOp(left=left, op=op(), right=right)
+            return ast.Compare(left=left, ops=[COMPARE_OPS[node.op]()], comparators=[right])
+        if node_type is Variable:
+            return name(self.names[node.var])
+        if node_type is Number or node_type is Boolean:
+            return ast.Constant(node.value)
+        if node_type is Unary:
+            return ast.UnaryOp(op=ast.Not(), operand=self.expr(node.operand))
+        if node_type is CompoundExpr:
+            # Все элементы вычисляются по порядку, значение — последний
+            items = ast.Tuple(elts=[self.expr(item) for item in node.items], ctx=ast.Load())
+            return ast.Subscript(value=items, slice=ast.Constant(-1), ctx=ast.Load())
+        raise TypeError(f"Unknown expression node: {node!r}")
+
+
+def compile_code(program, filename: Optional[str] = None) -> CodeType:
+    """Объект кода модуля с функцией программы; SyntaxError или RecursionError, если CPython его не компилирует."""
+    module = PythonCompiler().compile(program)
+    return compile(module, filename or f"<program {program.name}>", "exec")
+
+
+class CompiledProgram:
+    """Программа, скомпилированная в функцию Python; run() выполняет её так же, как VM.run."""
+
+    def __init__(self, code: CodeType):
+        namespace = {"__builtins__": builtins}
+        exec(code, namespace)
+        self.function = namespace[FUNCTION_NAME]
+        self.filename = code.co_filename
+        self.output = []
+
+    def run(self, inputs: Iterable = ()) -> List[str]:
+        """Выполняет программу; read берёт значения из inputs, вывод write возвращается списком строк."""
+        self.output = output = []
+        values = iter(inputs)
+
+        def read(var_type):
+            value = next(values, None)
+            if value is None:
+                raise EOFError
+            return convert_input(var_type, value)
+
+        def write(*items):
+            output.append(" ".join(map(format_value, items)))
+
+        try:
+            self.function(read, write, truncate_div)
+        except ZeroDivisionError as error:
+            raise ExecutionError("Division by zero", self.error_line(error)) from None
+        except OverflowError as error:
+            raise ExecutionError("Numeric overflow", self.error_line(error)) from None
+        except EOFError as error:
+            raise ExecutionError("Input exhausted", self.error_line(error)) from None
+        except ValueError as error:
+            raise ExecutionError(str(error), self.error_line(error)) from None
+        return output
+
+    def error_line(self, error: BaseException) -> int:
+        """Строка исходного текста оператора, в котором возникла ошибка: последний кадр кода программы."""
+        line = 0
+        trace = error.__traceback__
+        while trace is not None:
+            if trace.tb_frame.f_code.co_filename == self.filename:
+                line = trace.tb_lineno
+            trace = trace.tb_next
+        return line
+
+
+def parse_source(data: bytes):
+    lexer = Lexer(keywords=KEYWORDS.keys(), separators=SEPARATORS.keys(), operators=OPERATORS.keys())
+    return Parser(lexer.tokenize_store(decode_lines(data))).start_prog()
+
+
+class CodeCache(AnalysisCache):
+    """
+    Кэш объектов кода по SHA-256 исходного текста. Хранение в памяти и на
+    диске и вытеснение — как у AnalysisCache; в ключ входит и версия байт-кода
+    CPython, потому что формат marshal объектов кода зависит от неё.
+    saved_seconds в stats — сэкономленное время разбора и компиляции.
+    """
+
+    def key(self, data: bytes, all_errors: bool = False) -> str:
+        digest = hashlib.sha256(self.grammar)
+        digest.update(b"python" + MAGIC_NUMBER + bytes((CODEGEN_FORMAT,)))
+        digest.update(data)
+        return digest.hexdigest()
+
+    def load_program(self, data: bytes) -> Union[CompiledProgram, VM]:
+        """
+        Программа, готовая к запуску: скомпилированная функция из кэша или
+        новая; VM, если CPython программу не компилирует. Ошибки разбора
+        передаются вызывающему.
+        """
+        key = self.key(data)
+        stats = self.stats
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+            stats.memory_hits += 1
+        else:
+            entry = self.load(key)
+            if entry is not None:
+                stats.disk_hits += 1
+                self.remember(key, entry)
+        if entry is not None:
+            stats.saved_seconds += entry["seconds"]
+            return CompiledProgram(entry["code"])
+        stats.misses += 1
+        start = time.perf_counter()
+        program = parse_source(data)
+        try:
+            code = compile_code(program)
+        except (SyntaxError, RecursionError, MemoryError):  # Вложенность больше, чем допускает CPython
+            return VM(compile_program(program))
+        entry = {"format": CACHE_FORMAT, "code": code, "seconds": time.perf_counter() - start}
+        self.remember(key, entry)
+        self.save(key, entry)
+        return CompiledProgram(code)
+
+
+_code_cache = None  # Кэш load_program по умолчанию: только в памяти
+
+
+def load_program(data: Union[bytes, str], cache: Optional[CodeCache] = None) -> Union[CompiledProgram, VM]:
+    """Разбирает и компилирует текст программы (с кэшем по содержимому); результат запускается run(inputs)."""
+    global _code_cache
+    if cache is None:
+        if _code_cache is None:
+            _code_cache = CodeCache()
+        cache = _code_cache
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return cache.load_program(data)
@@ -0,0 +1,489 @@
+"""
+Граф потока управления программы и анализ потока данных.
+
+Запуск: python dataflow.py FILE [--json]
+
+ControlFlowGraph строится по дереву Program: базовые блоки состоят из шагов
+Step — оператор или часть заголовка цикла со слотами прочитанных, присвоенных
+и объявленных переменных (слот — номер объявления в program.symbols).
+Значения задач хранятся по блокам масками: маска — целое число Python, бит
+которого — слот переменной, поэтому объединение, пересечение и разность
+множеств переменных — одна операция над целым. У шагов маски не хранятся:
+их ширина — число переменных программы, и память росла бы как произведение
+числа операторов на число переменных.
+
+solve решает задачу DataflowProblem методом рабочего списка: блоки
+обрабатываются в обратном порядке обхода в глубину (для обратных задач —
+в прямом), и блок снова попадает в список, только если изменился вход.
+На структурных программах языка каждый блок пересчитывается не больше
+глубины вложенности циклов плюс два раза. Задачи: ReachingDefaults (до точки
+может дойти значение по умолчанию из dim, не перезаписанное присваиванием,
+read или for), DefiniteDefaults (то же на всех путях) и LiveVariables.
+check_program по ним сообщает чтение переменной до присваивания,
+неиспользуемые переменные и присваивания, значение которых не читается.
+"""
+import argparse
+import gc
+import heapq
+import json
+import sys
+from typing import Iterator, List, Optional, Tuple
+
+from ast_nodes import Assign, Binary, Block, CompoundExpr, Declare, For, If, Read, Unary, Variable, While, Write
+from Kr_kp_TFYA import Diagnostic, analyze_file
+
+# Виды шагов: оператор или часть заголовка цикла
+(STEP_DECLARE, STEP_ASSIGN, STEP_READ, STEP_WRITE, STEP_COND,
+ STEP_FOR_START, STEP_FOR_STOP, STEP_FOR_TEST, STEP_FOR_NEXT) = range(9)
+
+
+def expression_reads(expr) -> List[Variable]:
+    """Обращения к переменным в выражении в порядке вычисления (без рекурсии: выражения бывают очень глубокими)."""
+    reads = []
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is Variable:
+            reads.append(node)
+        elif node_type is Binary:
+            stack.append(node.right)
+            stack.append(node.left)
+        elif node_type is Unary:
+            stack.append(node.operand)
+        elif node_type is CompoundExpr:
+            stack.extend(reversed(node.items))
+    return reads
+
+
+def slot_mask(slots) -> int:
+    """Маска множества слотов."""
+    mask = 0
+    for slot in slots:
+        mask |= 1 << slot
+    return mask
+
+
+class Step:
+    """
+    Шаг базового блока: node — оператор, kind — вид STEP_*, reads — узлы
+    Variable, которые он читает; uses, defs и decls — слоты прочитанных,
+    присвоенных и объявленных переменных. Чтение выполняется до присваивания.
+    """
+    __slots__ = ("node", "kind", "reads", "uses", "defs", "decls")
+
+    def __init__(self, node, kind: int, reads: List[Variable], uses: Tuple[int, ...] = (),
+                 defs: Tuple[int, ...] = (), decls: Tuple[int, ...] = ()):
+        self.node = node
+        self.kind = kind
+        self.reads = reads
+        self.uses = uses
+        self.defs = defs
+        self.decls = decls
+
+    def __repr__(self):
+        return f"Step({type(self.node).__name__}, kind={self.kind}, line={self.node.line})"
+
+
+class BasicBlock:
+    """Базовый блок: шаги выполняются подряд; дуги — номера блоков в ControlFlowGraph.blocks."""
+    __slots__ = ("index", "steps", "succs", "preds")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.steps = []
+        self.succs = []  # Номера блоков-преемников
+        self.preds = []
+
+    def __repr__(self):
+        return f"BasicBlock({self.index}, steps={len(self.steps)}, succs={self.succs})"
+
+
+class ControlFlowGraph:
+    """
+    Граф потока управления программы. entry — блок начала программы (в него
+    не входят дуги), exit — блок конца. slots — объявление VarToken -> номер бита.
+    """
+
+    def __init__(self, program):
+        self.program = program
+        self.vars = list(program.symbols)
+        self.slots = {var: slot for slot, var in enumerate(self.vars)}
+        self.blocks = []
+        self.entry = self.new_block()
+        self.current = self.entry
+        # Граф не содержит циклических ссылок (дуги — номера блоков), поэтому сборщик циклов
+        # на время построения отключается, как при разборе: иначе он многократно обходит все шаги
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.build(program.body)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        self.exit = self.new_block()
+        self.link(self.current, self.exit)
+        self.current = None
+
+    @property
+    def universe(self) -> int:
+        """Маска всех переменных программы."""
+        return (1 << len(self.vars)) - 1
+
+    def new_block(self) -> BasicBlock:
+        block = BasicBlock(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    @staticmethod
+    def link(source: BasicBlock, target: BasicBlock) -> None:
+        source.succs.append(target.index)
+        target.preds.append(source.index)
+
+    def add_step(self, node, kind: int, exprs=(), defs=(), decls=(), uses=()) -> None:
+        """Шаг в текущий блок: чтение выражений exprs и переменных uses, затем присваивание defs."""
+        reads = []
+        for expr in exprs:
+            reads.extend(expression_reads(expr))
+        slots = self.slots
+        used = tuple(slots[var] for var in uses) + tuple(slots[node.var] for node in reads)
+        self.current.steps.append(Step(node, kind, reads, used, tuple(slots[var] for var in defs),
+                                       tuple(slots[var] for var in decls)))
+
+    def build(self, body) -> None:
+        """
+        Обходит операторы без рекурсии: в стеке — итераторы ещё не пройденных
+        списков операторов и действия, завершающие if и циклы после их тел.
+        """
+        stack = [iter(body)]
+        while stack:
+            item = stack.pop()
+            if type(item) is tuple:
+                item[0](*item[1:])
+                continue
+            statement = next(item, None)
+            if statement is None:
+                continue
+            stack.append(item)
+            statement_type = type(statement)
+            if statement_type is Assign:
+                self.add_step(statement, STEP_ASSIGN, (statement.expr,), (statement.var,))
+            elif statement_type is Declare:
+                self.add_step(statement, STEP_DECLARE, decls=statement.vars)
+            elif statement_type is Read:
+                self.add_step(statement, STEP_READ, defs=statement.vars)
+            elif statement_type is Write:
+                self.add_step(statement, STEP_WRITE, statement.exprs)
+            elif statement_type is Block:
+                stack.append(iter(statement.body))
+            elif statement_type is If:
+                self.add_step(statement, STEP_COND, (statement.cond,))
+                branch = self.current
+                self.current = self.new_block()
+                self.link(branch, self.current)
+                stack.append((self.end_then, statement, branch, stack))
+                stack.append(iter(statement.then_body))
+            elif statement_type is While:
+                header = self.new_block()
+                self.link(self.current, header)
+                self.current = header
+                self.add_step(statement, STEP_COND, (statement.cond,))
+                self.current = self.new_block()
+                self.link(header, self.current)
+                stack.append((self.end_loop, header))
+                stack.append(iter(statement.body))
+            elif statement_type is For:
+                # Как в VM: присваивание начала, граница вычисляется один раз, затем проверка и тело
+                self.add_step(statement, STEP_FOR_START, (statement.start,), (statement.var,))
+                self.add_step(statement, STEP_FOR_STOP, (statement.stop,))
+                header = self.new_block()
+                self.link(self.current, header)
+                self.current = header
+                self.add_step(statement, STEP_FOR_TEST, uses=(statement.var,))
+                self.current = self.new_block()
+                self.link(header, self.current)
+                stack.append((self.end_for, statement, header))
+                stack.append(iter(statement.body))
+
+    def end_then(self, node, branch: BasicBlock, stack: list) -> None:
+        then_end = self.current
+        join = self.new_block()
+        self.link(then_end, join)
+        if node.else_body:
+            self.current = self.new_block()
+            self.link(branch, self.current)
+            stack.append((self.end_else, join))
+            stack.append(iter(node.else_body))
+        else:
+            self.link(branch, join)
+            self.current = join
+
+    def end_else(self, join: BasicBlock) -> None:
+        self.link(self.current, join)
+        self.current = join
+
+    def end_loop(self, header: BasicBlock) -> None:
+        self.link(self.current, header)
+        self.current = self.new_block()
+        self.link(header, self.current)
+
+    def end_for(self, node, header: BasicBlock) -> None:
+        self.add_step(node, STEP_FOR_NEXT, defs=(node.var,), uses=(node.var,))
+        self.end_loop(header)
+
+    def reverse_postorder(self) -> List[int]:
+        """
+        Номера блоков в обратном порядке обхода в глубину от entry; недостижимые
+        блоки — в конце. Преемники обходятся с последнего, поэтому тело цикла
+        идёт раньше блоков после цикла и успевает сойтись до их обработки.
+        """
+        blocks = self.blocks
+        visited = [False] * len(blocks)
+        order = []
+        visited[self.entry.index] = True
+        stack = [(self.entry.index, reversed(self.entry.succs))]
+        while stack:
+            index, succs = stack[-1]
+            for succ in succs:
+                if not visited[succ]:
+                    visited[succ] = True
+                    stack.append((succ, reversed(blocks[succ].succs)))
+                    break
+            else:
+                stack.pop()
+                order.append(index)
+        order.reverse()
+        order.extend(index for index, seen in enumerate(visited) if not seen)
+        return order
+
+    def steps(self) -> Iterator[Tuple[BasicBlock, Step]]:
+        for block in self.blocks:
+            for step in block.steps:
+                yield block, step
+
+
+class DataflowProblem:
+    """
+    Задача анализа потока данных над масками слотов переменных. forward —
+    направление, union — слияние на стыке путей: объединение (на каком-либо
+    пути) или пересечение (на всех путях). Передаточная функция шага —
+    gen | (x & ~kill), её задаёт step_effect.
+    """
+    forward = True
+    union = True
+
+    def __init__(self, cfg: ControlFlowGraph):
+        self.cfg = cfg
+
+    def step_effect(self, step: Step) -> Tuple[int, int]:
+        """Маски (gen, kill) шага."""
+        raise NotImplementedError
+
+    def boundary(self) -> int:
+        """Значение на входе entry (прямая задача) или на выходе exit (обратная)."""
+        return 0
+
+    def top(self) -> int:
+        """Начальное значение остальных блоков: нейтральный элемент слияния."""
+        return 0 if self.union else self.cfg.universe
+
+    def block_effect(self, block: BasicBlock) -> Tuple[int, int]:
+        """Композиция передаточных функций шагов блока в направлении задачи."""
+        gen = kill = 0
+        steps = block.steps if self.forward else reversed(block.steps)
+        for step in steps:
+            step_gen, step_kill = self.step_effect(step)
+            gen = step_gen | (gen & ~step_kill)
+            kill |= step_kill
+        return gen, kill
+
+
+class DataflowResult:
+    """
+    Решение задачи: before и after — значения в начале и в конце каждого
+    блока в порядке выполнения программы; passes — число пересчётов блоков.
+    """
+
+    def __init__(self, problem: DataflowProblem, before: List[int], after: List[int], passes: int):
+        self.problem = problem
+        self.before = before
+        self.after = after
+        self.passes = passes
+
+    def step_facts(self, block: BasicBlock) -> List[Tuple[Step, int]]:
+        """
+        Шаги блока со значением задачи на стороне, откуда идёт анализ:
+        перед шагом для прямой задачи, после шага для обратной.
+        """
+        problem = self.problem
+        result = []
+        if problem.forward:
+            value = self.before[block.index]
+            steps = block.steps
+        else:
+            value = self.after[block.index]
+            steps = reversed(block.steps)
+        for step in steps:
+            result.append((step, value))
+            gen, kill = problem.step_effect(step)
+            value = gen | (value & ~kill)
+        if not problem.forward:
+            result.reverse()
+        return result
+
+
+def solve(problem: DataflowProblem) -> DataflowResult:
+    """Неподвижная точка задачи методом рабочего списка с приоритетом по порядку обхода."""
+    cfg = problem.cfg
+    blocks = cfg.blocks
+    order = cfg.reverse_postorder()
+    if problem.forward:
+        start = cfg.entry.index
+        sources = [block.preds for block in blocks]
+        targets = [block.succs for block in blocks]
+    else:
+        order.reverse()
+        start = cfg.exit.index
+        sources = [block.succs for block in blocks]
+        targets = [block.preds for block in blocks]
+    rank = [0] * len(blocks)
+    for position, index in enumerate(order):
+        rank[index] = position
+    effects = [problem.block_effect(block) for block in blocks]
+    union = problem.union
+    top = problem.top()
+    inputs = [top] * len(blocks)
+    outputs = [top] * len(blocks)
+    queued = [True] * len(blocks)
+    heap = list(range(len(blocks)))  # Позиции блоков в order: сначала обрабатываются более ранние
+    passes = 0
+    while heap:
+        index = order[heapq.heappop(heap)]
+        queued[index] = False
+        passes += 1
+        if index == start:
+            value = problem.boundary()
+        elif len(sources[index]) == 1:
+            value = outputs[sources[index][0]]  # Без копии: у большинства блоков один источник
+        elif union:
+            value = 0
+            for source in sources[index]:
+                value |= outputs[source]
+        else:
+            value = top
+            for source in sources[index]:
+                value &= outputs[source]
+        inputs[index] = value
+        gen, kill = effects[index]
+        if gen or kill:
+            value = gen | (value & ~kill)
+        if value != outputs[index]:
+            outputs[index] = value
+            for target in targets[index]:
+                if not queued[target]:
+                    queued[target] = True
+                    heapq.heappush(heap, rank[target])
+    if problem.forward:
+        return DataflowResult(problem, inputs, outputs, passes)
+    return DataflowResult(problem, outputs, inputs, passes)
+
+
+class ReachingDefaults(DataflowProblem):
+    """
+    Достигающие определения, сведённые к слотам переменных: бит слота
+    установлен, если до точки на каком-либо пути доходит значение по умолчанию
+    из dim, не перезаписанное присваиванием, read или for.
+    """
+
+    def step_effect(self, step: Step) -> Tuple[int, int]:
+        return slot_mask(step.decls), slot_mask(step.defs)
+
+
+class DefiniteDefaults(ReachingDefaults):
+    """То же, что ReachingDefaults, но на всех путях: переменной точно ничего не присвоено после dim."""
+    union = False
+
+
+class LiveVariables(DataflowProblem):
+    """Живые переменные: бит слота установлен, если текущее значение может быть прочитано дальше."""
+    forward = False
+
+    def step_effect(self, step: Step) -> Tuple[int, int]:
+        return slot_mask(step.uses), slot_mask(step.defs + step.decls)
+
+
+def unassigned_reads(result: DataflowResult) -> Iterator[Variable]:
+    """Узлы Variable, перед чтением которых бит переменной в решении прямой задачи result установлен."""
+    cfg = result.problem.cfg
+    slots = cfg.slots
+    for block in cfg.blocks:
+        for step, value in result.step_facts(block):
+            if value:
+                for node in step.reads:
+                    if value >> slots[node.var] & 1:
+                        yield node
+
+
+def uninitialized_reads(cfg: ControlFlowGraph) -> List[Diagnostic]:
+    """Чтения переменной, которой на всех или на некоторых путях ничего не присвоено после dim."""
+    # Задачи решаются по очереди: в памяти одновременно значения только одной из них
+    certain = set(map(id, unassigned_reads(solve(DefiniteDefaults(cfg)))))
+    diagnostics = []
+    for node in unassigned_reads(solve(ReachingDefaults(cfg))):
+        if id(node) in certain:
+            message = "Variable is used before assignment"
+        else:
+            message = "Variable may be used before assignment"
+        diagnostics.append(Diagnostic(f"{message}: {node.var.var_name}", node.line, node.col, "dataflow"))
+    return diagnostics
+
+
+def unused_values(cfg: ControlFlowGraph) -> List[Diagnostic]:
+    """
+    Переменные, которые нигде не читаются, и присваивания, значение которых
+    не читается дальше ни на одном пути (для переменных, которые где-то читаются).
+    """
+    used = set()
+    for _, step in cfg.steps():
+        used.update(step.uses)
+    diagnostics = [Diagnostic(f"Variable is never used: {var.var_name}", var.y_coord, var.x_coord, "dataflow")
+                   for slot, var in enumerate(cfg.vars) if slot not in used]
+    live = solve(LiveVariables(cfg))
+    for block in cfg.blocks:
+        for step, after in live.step_facts(block):
+            if step.kind == STEP_ASSIGN and step.defs[0] in used and not after >> step.defs[0] & 1:
+                node = step.node
+                diagnostics.append(Diagnostic(f"Assigned value is never used: {node.var.var_name}", node.line,
+                                              node.col, "dataflow"))
+    return diagnostics
+
+
+def check_program(program, cfg: Optional[ControlFlowGraph] = None) -> List[Diagnostic]:
+    """Предупреждения анализа потока данных (uninitialized_reads и unused_values) по порядку позиций."""
+    if cfg is None:
+        cfg = ControlFlowGraph(program)
+    diagnostics = uninitialized_reads(cfg) + unused_values(cfg)
+    diagnostics.sort(key=lambda diagnostic: (diagnostic.line, diagnostic.col))
+    return diagnostics
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Неинициализированные и неиспользуемые переменные программы")
+    parser.add_argument("file")
+    parser.add_argument("--json", action="store_true", help="вывести предупреждения строками JSON")
+    args = parser.parse_args(argv)
+    try:
+        _, program = analyze_file(args.file)
+    except FileNotFoundError:
+        print(f"Ошибка: файл '{args.file}' не найден.", file=sys.stderr)
+        return 1
+    except (ValueError, SyntaxError) as error:
+        print(f"Ошибка анализа: {error}", file=sys.stderr)
+        return 1
+    for diagnostic in check_program(program):
+        print(json.dumps(diagnostic.to_dict(), ensure_ascii=False) if args.json else diagnostic)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Генератор корректных программ учебного языка для бенчмарков.
+
+Программа зависит только от параметров и seed. Размер и форма задаются
+числом описаний dim, числом операторов, глубиной вложенности if/while/for,
+числом операндов в выражениях и плотностью комментариев. Программы проходят
+лексический и синтаксический анализ без ошибок и выполняются на VM без
+ввода: циклы ограничены отдельными счётчиками, делитель div — ненулевая
+константа, а mult умножает только на константу, поэтому значения не растут
+взрывообразно.
+
+Запуск: python generator.py [--seed S] [--dims N] [--statements N] [--depth N]
+                            [--expr-len N] [--comments P]
+"""
+import argparse
+import random
+import sys
+from typing import List, Optional
+
+TYPE_NAMES = (("INT", "integer"), ("REAL", "real"), ("BOOL", "boolean"))
+RELATIONS = ("EQ", "NE", "LT", "LE", "GT", "GE")
+LOOP_LIMIT = 3  # Число итераций каждого цикла
+
+
+class ProgramGenerator:
+    """
+    dims — число описаний dim (типы чередуются: integer, real, boolean);
+    statements — общее число операторов, включая вложенные;
+    depth — наибольшая глубина вложенности if/while/for;
+    expr_len — число операндов арифметического выражения;
+    comments — доля строк с комментарием в конце (часть из них многострочные).
+    """
+
+    def __init__(self, seed: int = 1, dims: int = 12, statements: int = 200, depth: int = 2,
+                 expr_len: int = 4, comments: float = 0.1):
+        self.seed = seed
+        self.dims = max(dims, 3)  # Хотя бы одна переменная каждого типа
+        self.statements = statements
+        self.depth = depth
+        self.expr_len = max(expr_len, 1)
+        self.comments = comments
+        self.rnd = random.Random(seed)
+        self.vars = {"INT": [], "REAL": [], "BOOL": []}
+        self.lines = []
+        self.left = 0  # Сколько операторов ещё можно создать
+
+    def generate(self) -> List[str]:
+        """Текст программы списком строк с символами перевода строки."""
+        self.rnd.seed(self.seed)
+        self.vars = {"INT": [], "REAL": [], "BOOL": []}
+        self.lines = ["program generated\n"]
+        for index in range(self.dims):
+            var_type, type_name = TYPE_NAMES[index % 3]
+            name = f"{type_name[0]}{index}"
+            self.vars[var_type].append(name)
+            self.emit(0, f"dim {name} as {type_name}")
+        # Счётчики циклов объявляются отдельно: операторы тела их не изменяют
+        for level in range(1, self.depth + 1):
+            self.emit(0, f"dim w{level}, k{level} as integer")
+        self.left = self.statements
+        while self.left > 0:
+            self.statement(0)
+        self.lines.append("end\n")
+        return self.lines
+
+    def emit(self, level: int, text: str) -> None:
+        rnd = self.rnd
+        indent = "  " * level
+        if self.comments and rnd.random() < self.comments:
+            if rnd.random() < 0.2:
+                self.lines.append(f"{indent}{text} {{ многострочный\n")
+                self.lines.append(f"{indent}  комментарий }}\n")
+                return
+            text += " { комментарий }"
+        self.lines.append(f"{indent}{text}\n")
+
+    def statement(self, level: int) -> None:
+        self.left -= 1
+        rnd = self.rnd
+        if level < self.depth and rnd.random() < 0.3:
+            kind = rnd.randrange(3)
+            if kind == 0:
+                self.if_statement(level)
+            elif kind == 1:
+                self.while_loop(level)
+            else:
+                self.for_loop(level)
+        elif rnd.random() < 0.15:
+            values = [self.expression(rnd.choice(("INT", "REAL", "BOOL"))) for _ in range(rnd.randint(1, 3))]
+            self.emit(level, "write (" + ", ".join(values) + ")")
+        else:
+            var_type = rnd.choice(("INT", "REAL", "BOOL"))
+            self.emit(level, f"{rnd.choice(self.vars[var_type])} = {self.expression(var_type)}")
+
+    def body(self, level: int) -> None:
+        """Тело вложенного оператора: от одного до четырёх операторов, пока не исчерпан общий счёт."""
+        for _ in range(self.rnd.randint(1, 4)):
+            self.statement(level)
+            if self.left <= 0:
+                break
+
+    def if_statement(self, level: int) -> None:
+        self.emit(level, f"if {self.condition()} then")
+        self.body(level + 1)
+        if self.left > 0 and self.rnd.random() < 0.5:
+            self.emit(level, "else")
+            self.body(level + 1)
+        self.emit(level, "end")
+
+    def while_loop(self, level: int) -> None:
+        counter = f"w{level + 1}"
+        self.emit(level, f"{counter} = 0")
+        self.emit(level, f"while ({counter} LT {LOOP_LIMIT}) and {self.condition()} do")
+        self.body(level + 1)
+        self.emit(level + 1, f"{counter} = {counter} plus 1")
+        self.emit(level, "end")
+
+    def for_loop(self, level: int) -> None:
+        self.emit(level, f"for k{level + 1} = 1 to {LOOP_LIMIT} do")
+        self.body(level + 1)
+        self.emit(level, "end")
+
+    def condition(self) -> str:
+        """Логическое выражение в скобках: отношение, переменная или их отрицание."""
+        rnd = self.rnd
+        choice = rnd.random()
+        if choice < 0.6:
+            return f"({self.operand('INT')} {rnd.choice(RELATIONS)} {self.arithmetic(rnd.choice(('INT', 'REAL')))})"
+        if choice < 0.8:
+            return f"~{rnd.choice(self.vars['BOOL'])}"
+        return f"({rnd.choice(self.vars['BOOL'])} or {rnd.choice(('true', 'false'))})"
+
+    def expression(self, var_type: str) -> str:
+        if var_type == "BOOL":
+            rnd = self.rnd
+            parts = [self.condition() for _ in range(max(1, self.expr_len // 4))]
+            text = parts[0]
+            for part in parts[1:]:
+                text += f" {rnd.choice(('and', 'or'))} {part}"
+            return text
+        return self.arithmetic(var_type)
+
+    def arithmetic(self, var_type: str) -> str:
+        """
+        Сумма из expr_len операндов; mult и div применяются только к константе,
+        div — с ненулевым делителем. Целое выражение строится из целых операндов.
+        """
+        rnd = self.rnd
+        text = self.operand(var_type)
+        for _ in range(self.expr_len - 1):
+            choice = rnd.random()
+            if choice < 0.2:
+                text += f" mult {rnd.randint(1, 3)}"
+            elif choice < 0.3:
+                text += f" div {rnd.randint(1, 9)}"
+            elif choice < 0.35:
+                text = f"({text}) plus [{self.operand('INT')} : {self.operand(var_type)}]"
+            else:
+                text += f" {rnd.choice(('plus', 'min'))} {self.operand(var_type)}"
+        return text
+
+    def operand(self, var_type: str) -> str:
+        rnd = self.rnd
+        choice = rnd.random()
+        if choice < 0.5:
+            if var_type == "REAL" and rnd.random() < 0.5:
+                return rnd.choice(self.vars["INT"])  # Целое в вещественном выражении
+            return rnd.choice(self.vars[var_type])
+        if var_type == "REAL" and choice < 0.8:
+            return f"{rnd.randrange(100)}.{rnd.randrange(100)}"
+        value = rnd.randrange(1, 256)
+        kind = rnd.randrange(5)
+        if kind == 0:
+            return format(value, "b") + "B"
+        if kind == 1:
+            return format(value, "o") + "O"
+        if kind == 2:
+            return "0" + format(value, "X") + "H"
+        return str(value)
+
+
+def generate_program(seed: int = 1, **options) -> List[str]:
+    """Строки программы ProgramGenerator(seed, **options)."""
+    return ProgramGenerator(seed, **options).generate()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Генератор корректных программ")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dims", type=int, default=12)
+    parser.add_argument("--statements", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--expr-len", type=int, default=4)
+    parser.add_argument("--comments", type=float, default=0.1)
+    args = parser.parse_args(argv)
+    sys.stdout.writelines(generate_program(args.seed, dims=args.dims, statements=args.statements, depth=args.depth,
+                                           expr_len=args.expr_len, comments=args.comments))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Инкрементальный лексический и синтаксический анализ редактируемого текста.
+
+Документ хранит токены каждой строки и состояние лексера (State.S или внутри
+многострочного комментария) в начале каждой строки. После правки строки
+лексируются заново, начиная с первой изменённой, пока состояние в начале
+очередной неизменённой строки не совпадёт с сохранённым.
+
+Разбор хранится списком операторов верхнего уровня. Повторно разбираются
+только операторы, начиная с того, что предшествует изменённым строкам; как
+только разбор доходит до начала старого оператора за изменёнными строками,
+а набор объявлений верхнего уровня в переразобранной части не изменился,
+оставшиеся операторы берутся из предыдущего разбора без изменений.
+"""
+import gc
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Optional
+
+from ast_nodes import Program, iter_nodes
+from Kr_kp_TFYA import (BLOCK_END_CODES, CODE_COLON, CODE_END, CODE_EOF, KEYWORDS, OPERATORS, SEPARATORS, Lexer,
+                        Parser, State, SymbolTable, Token)
+
+
+class Entry:
+    """Оператор верхнего уровня: строка начала, первый токен, дерево и объявленные в нём переменные."""
+    __slots__ = ("start", "first", "node", "symbols")
+
+    def __init__(self, start: int, first: Token, node, symbols):
+        self.start = start
+        self.first = first
+        self.node = node
+        self.symbols = symbols
+
+
+class IncrementalParser(Parser):
+    """
+    Парсер операторов с заданной таблицей символов. Объявления верхнего уровня
+    берут объект VarToken из reuse, если в заменяемой части было объявление
+    с тем же именем и типом: на него ссылаются деревья неизменённых операторов.
+    """
+
+    def __init__(self, tokens, symbols=None, reuse=None, header=False):
+        super().__init__(tokens, header, symbols)
+        self.reuse = {} if reuse is None else reuse
+
+    def declare(self, token, var_type):
+        if self.symbols.level == 0:
+            var = self.reuse.pop((token.value, var_type), None)
+            if var is not None:
+                var.x_coord = token.x_coord
+                var.y_coord = token.y_coord
+                if not self.symbols.declare(var):
+                    self.report("Duplicate declaration", token)
+                return var
+        return super().declare(token, var_type)
+
+
+class IncrementalDocument:
+    """
+    Текст программы с инкрементальным анализом. edit() заменяет строки и
+    сразу перелексирует затронутые, analyze() возвращает дерево Program
+    или вызывает ту же ошибку (ValueError или SyntaxError), что и полный анализ.
+    Узлы дерева принадлежат документу и переиспользуются следующими анализами,
+    поэтому изменять их на месте (например, проходами optimizer) нельзя.
+    Счётчики VarToken.uses в этом режиме не поддерживаются.
+    """
+
+    def __init__(self, lines: Iterable[str], lexer: Optional[Lexer] = None):
+        self.lexer = lexer or Lexer(keywords=KEYWORDS.keys(), separators=SEPARATORS.keys(),
+                                    operators=OPERATORS.keys())
+        self.lines = list(lines)
+        self.tokens = [None] * len(self.lines)  # Токены каждой строки
+        self.states = [State.S] * (len(self.lines) + 1)  # Состояние лексера в начале каждой строки и в конце текста
+        self.lex_errors = {}  # Номер строки -> сообщение лексической ошибки
+        self.entries = []  # Операторы верхнего уровня последнего успешного разбора
+        self.starts = []  # Строки начала entries, для двоичного поиска
+        self.header_line = 0  # Строка имени программы
+        self.header_offset = 0  # Номер первого токена после имени программы в этой строке
+        self.name = ""
+        self.program = None
+        self.error = None
+        self.dirty = None  # Строки [начало, конец), изменённые после последнего успешного разбора
+        self.relexed = 0  # Перелексировано строк при последней правке
+        self.reparsed = 0  # Переразобрано операторов при последнем анализе
+        state = State.S
+        for index in range(len(self.lines)):
+            self.tokens[index], state = self.lex_line(index, state)
+            self.states[index + 1] = state
+
+    def lex_line(self, index: int, state: State):
+        try:
+            tokens, state = self.lexer.lex_line(self.lines[index], index + 1, state)
+        except ValueError as error:
+            self.lex_errors[index] = str(error)
+            return [], State.S
+        self.lex_errors.pop(index, None)
+        return tokens, state
+
+    def set_line(self, index: int, text: str) -> None:
+        self.edit(index, index + 1, [text])
+
+    def edit(self, start: int, end: int, new_lines: Iterable[str]) -> None:
+        """Заменяет строки [start, end) на new_lines и перелексирует изменившиеся строки."""
+        new_lines = list(new_lines)
+        count = len(new_lines)
+        delta = count - (end - start)
+        stop = start + count  # Первая неизменённая строка в новой нумерации
+        old_next = self.states[end]
+        state = self.states[start]
+
+        errors = self.lex_errors
+        moved = [index for index in errors if index >= end] if delta else []
+        for index in [index for index in errors if start <= index < end or index in moved]:
+            del errors[index]
+        self.lines[start:end] = new_lines
+        self.tokens[start:end] = [None] * count
+        self.states[start:end + 1] = [None] * (count + 1)
+        self.states[stop] = old_next  # Сохранённое состояние для проверки схождения
+
+        index = start
+        total = len(self.lines)
+        while True:
+            if index >= stop and self.states[index] == state:
+                break
+            self.states[index] = state
+            if index == total:
+                break
+            self.tokens[index], state = self.lex_line(index, state)
+            index += 1
+        relexed_end = index
+        self.relexed = relexed_end - start
+
+        if delta:
+            self.shift(start, end, relexed_end, delta, moved)
+        dirty_start, dirty_end = start, max(relexed_end, stop)
+        if self.dirty is not None:
+            old_start, old_end = self.dirty
+            old_start = old_start if old_start < start else (old_start + delta if old_start >= end else start)
+            old_end = old_end if old_end <= start else (old_end + delta if old_end >= end else stop)
+            dirty_start, dirty_end = min(dirty_start, old_start), max(dirty_end, old_end)
+        self.dirty = (dirty_start, dirty_end)
+
+    def shift(self, start: int, end: int, relexed_end: int, delta: int, errors: List[int]) -> None:
+        """Сдвигает номера строк токенов, операторов и ошибок после вставки или удаления строк."""
+        tokens = self.tokens
+        for index in range(relexed_end, len(self.lines)):
+            y_coord = index + 1
+            for token in tokens[index]:
+                token.y_coord = y_coord
+        for index in errors:
+            index += delta
+            if index >= relexed_end:
+                # Сообщение содержит номер строки, поэтому ошибочная строка лексируется заново
+                self.tokens[index], _ = self.lex_line(index, self.states[index])
+        replaced = bisect_left(self.starts, start)
+        first = bisect_left(self.starts, end)
+        # Операторы из заменённых строк будут разобраны заново; их начало прижимается к месту правки,
+        # чтобы список starts оставался упорядоченным
+        for index in range(replaced, first):
+            self.entries[index].start = self.starts[index] = start
+        for entry in self.entries[first:]:
+            entry.start += delta
+            for node in iter_nodes(entry.node):
+                node.line += delta
+            for var in entry.symbols:
+                var.y_coord += delta
+        self.starts[first:] = [start + delta for start in self.starts[first:]]
+        if self.header_line >= end:
+            self.header_line += delta
+
+    def token_stream(self, line: int, offset: int) -> Iterator[Token]:
+        tokens = self.tokens
+        if line < len(tokens):
+            yield from tokens[line][offset:]
+        for index in range(line + 1, len(tokens)):
+            yield from tokens[index]
+
+    def analyze(self) -> Program:
+        if self.dirty is None and self.error is None and self.program is not None:
+            return self.program
+        try:
+            self.check_lexer()
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                if self.program is None and not self.entries or self.dirty is None \
+                        or self.dirty[0] <= self.header_line:
+                    self.parse_full()
+                else:
+                    self.parse_incremental()
+            finally:
+                if gc_enabled:
+                    gc.enable()
+        except (ValueError, SyntaxError) as error:
+            self.error = error
+            self.program = None
+            raise
+        self.error = None
+        self.dirty = None
+        self.program = Program(self.name, [entry.node for entry in self.entries],
+                               [var for entry in self.entries for var in entry.symbols], 1, 1)
+        return self.program
+
+    def check_lexer(self) -> None:
+        if self.lex_errors:
+            raise ValueError(self.lex_errors[min(self.lex_errors)])
+        if self.states[-1] == State.COM:
+            # Незакрытый комментарий открыт в последней строке, которая начинается вне комментария или закрывает его
+            index = len(self.lines) - 1
+            while self.states[index] == State.COM and "}" not in self.lines[index]:
+                index -= 1
+            self.lexer.lex_line(self.lines[index], index + 1, self.states[index])
+            self.lexer.unclosed_comment()
+
+    def parse_full(self) -> None:
+        parser = IncrementalParser(self.token_stream(0, 0), header=True)
+        self.name = parser.program_name
+        # Имя программы — второй токен текста
+        seen = 0
+        for line, tokens in enumerate(self.tokens):
+            if seen + len(tokens) >= 2:
+                self.header_line, self.header_offset = line, 2 - seen
+                break
+            seen += len(tokens)
+        entries, _ = self.parse_statements(parser, None)
+        self.reparsed = len(entries)
+        self.entries = entries
+        self.starts = [entry.start for entry in entries]
+
+    def parse_incremental(self) -> None:
+        dirty_start, dirty_end = self.dirty
+        entries = self.entries
+        first = max(bisect_left(self.starts, dirty_start) - 1, 0)
+        if first == 0:
+            line, offset = self.header_line, self.header_offset
+        else:
+            entry = entries[first]
+            line = entry.start
+            offset = next(index for index, token in enumerate(self.tokens[line]) if token is entry.first)
+
+        symbols = SymbolTable()
+        for entry in entries[:first]:
+            for var in entry.symbols:
+                if var.level == 0:
+                    symbols.declare(var)
+        symbols.symbols.clear()
+        parser = IncrementalParser(self.token_stream(line, offset), symbols)
+        resync = bisect_left(self.starts, dirty_end)  # Первый оператор целиком после изменённых строк
+        for entry in entries[first:resync]:
+            self.pool(parser, entry)
+        new_entries, resumed = self.parse_statements(parser, (first, resync))
+        self.reparsed = len(new_entries)
+        tail = entries[resumed:] if resumed is not None else []
+        self.entries = entries[:first] + new_entries + tail
+        self.starts = [entry.start for entry in self.entries]
+
+    @staticmethod
+    def pool(parser: IncrementalParser, entry: Entry) -> None:
+        for var in entry.symbols:
+            if var.level == 0:
+                parser.reuse[(var.var_name, var.var_type)] = var
+
+    @staticmethod
+    def declared(entry: Entry, ids: set) -> None:
+        ids.update(id(var) for var in entry.symbols if var.level == 0)
+
+    def parse_statements(self, parser: IncrementalParser, reuse_range) -> tuple:
+        """
+        Разбирает операторы верхнего уровня до end. reuse_range — (первый
+        заменяемый, первый возможный для повторного использования) номера старых
+        операторов; возвращает новые операторы и номер старого, с которого
+        продолжается старый разбор, или None.
+        Старый разбор продолжается, если заменённые и новые операторы объявляют
+        на верхнем уровне одни и те же объекты VarToken.
+        """
+        stream = parser.stream
+        entries = []
+        old = self.entries
+        old_ids, new_ids = set(), set()
+        candidate = len(old)
+        if reuse_range is not None:
+            first, candidate = reuse_range
+            for entry in old[first:candidate]:
+                self.declared(entry, old_ids)
+        while True:
+            while stream.code == CODE_COLON:
+                stream.advance()
+            token = stream.current
+            if candidate < len(old) and token is not None:
+                line = token.y_coord - 1
+                # Старые операторы, начало которых разбор уже прошёл, тоже заменяются
+                while candidate < len(old) and (old[candidate].start < line or
+                                                old[candidate].start == line and old[candidate].first is not token):
+                    self.pool(parser, old[candidate])
+                    self.declared(old[candidate], old_ids)
+                    candidate += 1
+                if candidate < len(old) and old[candidate].first is token and old_ids == new_ids:
+                    return entries, candidate
+            if stream.code == CODE_EOF or stream.code in BLOCK_END_CODES:
+                break
+            mark = len(parser.tokens_var)
+            node = parser.start_statement()
+            entry = Entry(token.y_coord - 1, token, node, parser.tokens_var[mark:])
+            self.declared(entry, new_ids)
+            entries.append(entry)
+        if stream.code != CODE_END:
+            parser.error("Program must end with 'end'", parser.current_token())
+        return entries, None
@@ -0,0 +1,439 @@
+"""
+Оптимизирующие проходы по дереву программы.
+
+Каждый проход изменяет дерево Program на месте и возвращает число удалённых
+узлов; Pipeline запускает выбранные проходы по порядку. Проходы сохраняют
+результат программы: свёртка вычисляет константы по тем же правилам, что и VM,
+а из циклов выносятся только выражения, которые не могут вызвать ошибку.
+"""
+import math
+import operator
+from typing import Dict, Iterable, Iterator, List
+
+from arena import ExprArena
+from ast_nodes import (Assign, Binary, Block, Boolean, CompoundExpr, Declare, For, If, Node, Number, Read, Unary,
+                       Variable, While, Write, iter_nodes)
+from Kr_kp_TFYA import OPERATORS, VarToken
+from vm import truncate_div
+
+CODE_DIV = OPERATORS["div"].value
+
+# Вычисление бинарных операций над константами; div обрабатывается отдельно
+FOLD_OPERATIONS = {
+    OPERATORS["plus"].value: operator.add,
+    OPERATORS["min"].value: operator.sub,
+    OPERATORS["mult"].value: operator.mul,
+    OPERATORS["and"].value: lambda left, right: left and right,
+    OPERATORS["or"].value: lambda left, right: left or right,
+    OPERATORS["EQ"].value: operator.eq,
+    OPERATORS["NE"].value: operator.ne,
+    OPERATORS["LT"].value: operator.lt,
+    OPERATORS["LE"].value: operator.le,
+    OPERATORS["GT"].value: operator.gt,
+    OPERATORS["GE"].value: operator.ge,
+}
+
+
+def count_nodes(node) -> int:
+    """Число узлов в поддереве node, включая его самого."""
+    return sum(1 for _ in iter_nodes(node))
+
+
+def is_constant(node) -> bool:
+    return type(node) is Number or type(node) is Boolean
+
+
+def divides_unsafely(node) -> bool:
+    """Операция — div по делителю, не равному константе, отличной от нуля."""
+    return node.op == CODE_DIV and not (type(node.right) is Number and node.right.value != 0)
+
+
+def may_fail(node) -> bool:
+    """Может ли вычисление выражения вызвать ошибку: div по делителю, не равному константе, отличной от нуля."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is Binary:
+            if divides_unsafely(node):
+                return True
+            stack.append(node.right)
+            stack.append(node.left)
+        elif node_type is Unary:
+            stack.append(node.operand)
+        elif node_type is CompoundExpr:
+            stack.extend(node.items)
+    return False
+
+
+def fold_binary(op: int, result_type: str, left, right):
+    """Значение операции над константами или None, если её нельзя вычислить заранее (деление на ноль)."""
+    if op == CODE_DIV:
+        if right == 0:
+            return None
+        return truncate_div(left, right) if result_type == "INT" else left / right
+    return FOLD_OPERATIONS[op](left, right)
+
+
+def transform_statements(body: List[Node], transform) -> None:
+    """
+    Заменяет каждое выражение в операторах body (и во вложенных) на
+    transform(выражение) в порядке текста; вложенные тела обходятся без рекурсии.
+    """
+    stack = [iter(body)]
+    while stack:
+        statement = next(stack[-1], None)
+        if statement is None:
+            stack.pop()
+            continue
+        statement_type = type(statement)
+        if statement_type is Assign:
+            statement.expr = transform(statement.expr)
+        elif statement_type is If:
+            statement.cond = transform(statement.cond)
+            stack.append(iter(statement.else_body))
+            stack.append(iter(statement.then_body))
+        elif statement_type is While:
+            statement.cond = transform(statement.cond)
+            stack.append(iter(statement.body))
+        elif statement_type is For:
+            statement.start = transform(statement.start)
+            statement.stop = transform(statement.stop)
+            stack.append(iter(statement.body))
+        elif statement_type is Write:
+            statement.exprs = [transform(expr) for expr in statement.exprs]
+        elif statement_type is Block:
+            stack.append(iter(statement.body))
+
+
+def assigned_vars(body: List[Node], result=None) -> set:
+    """Переменные, значение которых может измениться при выполнении body."""
+    if result is None:
+        result = set()
+    bodies = [body]
+    while bodies:
+        for statement in bodies.pop():
+            statement_type = type(statement)
+            if statement_type is Assign:
+                result.add(statement.var)
+            elif statement_type is Read or statement_type is Declare:
+                result.update(statement.vars)
+            elif statement_type is If:
+                bodies.append(statement.then_body)
+                bodies.append(statement.else_body)
+            elif statement_type is For:
+                result.add(statement.var)
+                bodies.append(statement.body)
+            elif statement_type is While or statement_type is Block:
+                bodies.append(statement.body)
+    return result
+
+
+def run_steps(steps: Iterator) -> None:
+    """
+    Выполняет генератор, который отдаёт генераторы для вложенных тел, без
+    рекурсии: вложенный генератор выполняется до конца, затем продолжается
+    отдавший его (как vm.Compiler.compile_body).
+    """
+    stack = [steps]
+    while stack:
+        nested = next(stack[-1], None)
+        if nested is None:
+            stack.pop()
+        else:
+            stack.append(nested)
+
+
+class Pass:
+    """Проход оптимизации: изменяет дерево на месте и возвращает число удалённых узлов."""
+    name = ""
+
+    def run(self, program) -> int:
+        raise NotImplementedError
+
+
+class ConstantFolding(Pass):
+    """
+    Вычисляет операции над константами любых видов (двоичные, восьмеричные,
+    шестнадцатеричные, вещественные). Из составного выражения удаляются
+    все элементы, кроме последнего, которые не могут вызвать ошибку:
+    других побочных эффектов у выражений нет.
+    """
+    name = "fold"
+
+    def run(self, program) -> int:
+        before = count_nodes(program)
+        transform_statements(program.body, self.fold)
+        return before - count_nodes(program)
+
+    def fold(self, expr):
+        """Свёрнутое выражение; дерево обходится без рекурсии, операнды сворачиваются раньше операций."""
+        done = []  # Уже свёрнутые операнды
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            node_type = type(node)
+            if node_type is not Binary and node_type is not Unary and node_type is not CompoundExpr:
+                done.append(node)
+            elif not ready:
+                stack.append((node, True))
+                if node_type is Binary:
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+                elif node_type is Unary:
+                    stack.append((node.operand, False))
+                else:
+                    stack.extend((item, False) for item in reversed(node.items))
+            elif node_type is Binary:
+                right = node.right = done.pop()
+                left = node.left = done.pop()
+                if is_constant(left) and is_constant(right):
+                    value = fold_binary(node.op, node.type, left.value, right.value)
+                    if value is not None:
+                        node = self.constant(value, node, left, right)
+                done.append(node)
+            elif node_type is Unary:
+                operand = node.operand = done.pop()
+                if type(operand) is Boolean:
+                    node = Boolean(not operand.value, node.line, node.col)
+                done.append(node)
+            else:
+                count = len(node.items)
+                folded = done[-count:]
+                del done[-count:]
+                items = [item for item in folded[:-1] if may_fail(item)]
+                if items:
+                    items.append(folded[-1])
+                    node.items = items
+                else:
+                    node = folded[-1]
+                done.append(node)
+        return done[0]
+
+    @staticmethod
+    def constant(value, node, left, right):
+        if node.type == "BOOL":
+            return Boolean(value, node.line, node.col)
+        if node.type == "REAL":
+            return Number("real", float(value), node.line, node.col)
+        # Целый результат сохраняет вид литералов, если он у операндов общий
+        kind = left.kind if left.kind == right.kind else "decimal"
+        return Number(kind, value, node.line, node.col)
+
+
+class DeadBranchElimination(Pass):
+    """
+    Убирает ветви if с константным условием, циклы while false
+    и циклы for, которые не выполнятся ни разу (остаётся присваивание счётчику).
+    """
+    name = "dead-branches"
+
+    def run(self, program) -> int:
+        before = count_nodes(program)
+        program.body = self.prune(program.body)
+        return before - count_nodes(program)
+
+    def prune(self, body: List[Node]) -> List[Node]:
+        result = []
+        run_steps(self.prune_steps(body, result))
+        return result
+
+    def prune_steps(self, body: List[Node], result: List[Node]) -> Iterator:
+        """Добавляет в result оставшиеся операторы body; для вложенных тел отдаёт генераторы prune_steps."""
+        for statement in body:
+            statement_type = type(statement)
+            if statement_type is If:
+                if type(statement.cond) is Boolean:
+                    # Операторы ветвей if не образуют своей области видимости, их можно вставить на место if
+                    yield self.prune_steps(statement.then_body if statement.cond.value else statement.else_body, result)
+                    continue
+                then_body, statement.then_body = statement.then_body, []
+                else_body, statement.else_body = statement.else_body, []
+                yield self.prune_steps(then_body, statement.then_body)
+                yield self.prune_steps(else_body, statement.else_body)
+            elif statement_type is While:
+                cond = statement.cond
+                if type(cond) is Boolean and not cond.value:
+                    continue
+                inner, statement.body = statement.body, []
+                yield self.prune_steps(inner, statement.body)
+            elif statement_type is For:
+                start, stop = statement.start, statement.stop
+                if type(start) is Number and type(stop) is Number and self.never_runs(statement.var, start, stop):
+                    result.append(Assign(statement.var, start, statement.line, statement.col))
+                    continue
+                inner, statement.body = statement.body, []
+                yield self.prune_steps(inner, statement.body)
+            elif statement_type is Block:
+                inner, statement.body = statement.body, []
+                yield self.prune_steps(inner, statement.body)
+            result.append(statement)
+
+    @staticmethod
+    def never_runs(var, start, stop) -> bool:
+        """Цикл for с константными границами не выполнится; начало приводится к типу счётчика, как в VM."""
+        value = start.value
+        if var.var_type == "INT" and start.type == "REAL":
+            if not math.isfinite(value):
+                return False  # Приведение завершится ошибкой выполнения: цикл не убирается
+            value = int(value)
+        return value > stop.value
+
+
+class LoopInvariantHoisting(Pass):
+    """
+    Выносит из циклов while/for выражения, не зависящие от переменных,
+    изменяемых в цикле: значение вычисляется один раз перед циклом во временную
+    переменную. Выражения с div по неконстантному делителю не выносятся:
+    цикл может не выполниться ни разу, и деление на ноль появилось бы там, где его не было.
+    Возвращает число узлов, удалённых из тел циклов.
+    """
+    name = "hoist"
+
+    def __init__(self):
+        self.program = None
+        self.arena = None
+        self.removed = 0
+
+    def run(self, program) -> int:
+        self.program = program
+        self.arena = ExprArena()
+        self.removed = 0
+        program.body = self.hoist_body(program.body)
+        return self.removed
+
+    def hoist_body(self, body: List[Node]) -> List[Node]:
+        result = []
+        run_steps(self.hoist_steps(body, result))
+        return result
+
+    def hoist_steps(self, body: List[Node], result: List[Node]) -> Iterator:
+        """Добавляет в result операторы body с вынесенными инвариантами; для вложенных тел отдаёт генераторы."""
+        for statement in body:
+            statement_type = type(statement)
+            if statement_type is While or statement_type is For:
+                # Сначала внутренние циклы: их вынесенные выражения могут оказаться инвариантами и внешнего
+                inner, statement.body = statement.body, []
+                yield self.hoist_steps(inner, statement.body)
+                result.extend(self.hoist_loop(statement))
+            elif statement_type is If:
+                then_body, statement.then_body = statement.then_body, []
+                else_body, statement.else_body = statement.else_body, []
+                yield self.hoist_steps(then_body, statement.then_body)
+                yield self.hoist_steps(else_body, statement.else_body)
+            elif statement_type is Block:
+                inner, statement.body = statement.body, []
+                yield self.hoist_steps(inner, statement.body)
+            result.append(statement)
+
+    def hoist_loop(self, loop) -> List[Node]:
+        """Заменяет инварианты цикла временными переменными; возвращает их присваивания перед циклом."""
+        assigned = assigned_vars(loop.body)
+        if type(loop) is For:
+            assigned.add(loop.var)
+        temps = {}  # Структурный ключ выражения -> временная переменная
+        preheader = []
+
+        def hoisted(node, invariants: set):
+            if id(node) not in invariants:
+                return node
+            key = self.key(node)
+            temp = temps.get(key)
+            if temp is None:
+                temp = temps[key] = self.temporary(node)
+                preheader.append(Assign(temp, node, node.line, node.col))
+            self.removed += count_nodes(node) - 1
+            return Variable(temp, node.line, node.col)
+
+        def replace(expr):
+            # Выносятся наибольшие инвариантные поддеревья: обход сверху вниз без рекурсии
+            invariants = self.invariants(expr, assigned)
+            expr = hoisted(expr, invariants)
+            stack = [expr]
+            while stack:
+                node = stack.pop()
+                node_type = type(node)
+                if node_type is Binary:
+                    node.left = hoisted(node.left, invariants)
+                    node.right = hoisted(node.right, invariants)
+                    stack.append(node.left)
+                    stack.append(node.right)
+                elif node_type is Unary:
+                    node.operand = hoisted(node.operand, invariants)
+                    stack.append(node.operand)
+                elif node_type is CompoundExpr:
+                    node.items = [hoisted(item, invariants) for item in node.items]
+                    stack.extend(node.items)
+            return expr
+
+        if type(loop) is While:
+            loop.cond = replace(loop.cond)
+        transform_statements(loop.body, replace)
+        return preheader
+
+    @staticmethod
+    def invariants(expr, assigned: set) -> set:
+        """
+        id операций в expr, которые не зависят от assigned и не могут вызвать
+        ошибку. Один обход без рекурсии, операнды раньше операций: операция
+        инвариантна, если инвариантны все её операнды.
+        """
+        result = set()
+        done = []  # Инвариантны ли уже обойдённые операнды
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            node_type = type(node)
+            if node_type is Variable:
+                done.append(node.var not in assigned)
+            elif node_type is Number or node_type is Boolean:
+                done.append(True)
+            elif not ready:
+                stack.append((node, True))
+                if node_type is Binary:
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+                elif node_type is Unary:
+                    stack.append((node.operand, False))
+                else:
+                    stack.extend((item, False) for item in node.items)
+            else:
+                count = 2 if node_type is Binary else 1 if node_type is Unary else len(node.items)
+                invariant = all(done[-count:]) and not (node_type is Binary and divides_unsafely(node))
+                del done[-count:]
+                if invariant:
+                    result.add(id(node))
+                done.append(invariant)
+        return result
+
+    def key(self, node) -> int:
+        """Номер выражения в арене: структурно одинаковые инварианты используют одну временную переменную."""
+        return self.arena.add(node)
+
+    def temporary(self, node) -> VarToken:
+        symbols = self.program.symbols
+        temp = VarToken(node.type, f"$t{len(symbols)}", None, node.col, node.line)
+        symbols.append(temp)
+        return temp
+
+
+PASSES = {cls.name: cls for cls in (ConstantFolding, DeadBranchElimination, LoopInvariantHoisting)}
+DEFAULT_PASSES = tuple(PASSES)
+
+
+class Pipeline:
+    """Набор включённых проходов; run возвращает число удалённых узлов по каждому проходу."""
+
+    def __init__(self, passes: Iterable[str] = DEFAULT_PASSES):
+        self.passes = []
+        for name in passes:
+            if name not in PASSES:
+                raise ValueError(f"Unknown optimization pass: {name}")
+            self.passes.append(PASSES[name]())
+
+    def run(self, program) -> Dict[str, int]:
+        return {optimization.name: optimization.run(program) for optimization in self.passes}
+
+
+def optimize(program, passes: Iterable[str] = DEFAULT_PASSES) -> Dict[str, int]:
+    return Pipeline(passes).run(program)
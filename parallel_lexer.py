@@ -0,0 +1,178 @@
+"""
+Параллельный лексический анализ одного большого файла.
+
+Запуск: python parallel_lexer.py FILE [--jobs N]
+
+Файл делится на куски по границам строк, каждый кусок анализирует
+Lexer.tokenize_bytes в отдельном процессе, а результаты склеиваются в один
+ByteTokenStore. Единственное состояние лексера, переходящее через строку, —
+открытый комментарий { ... }, и граница куска выбирается только вне
+комментария: после любой } лексер находится вне комментария, поэтому начало
+строки лежит внутри комментария, только если между последней } перед ним и
+им есть { (comment_open — два поиска по буферу). Граница внутри комментария
+переносится на строку после его закрывающей }.
+
+Результат совпадает с Lexer.tokenize_file того же лексера: те же массивы
+хранилища, номера имён в таблице лексера и первая ошибка с той же позицией.
+Номера имён и чисел кусков переводятся в общие номера в родительском
+процессе, и это единственная последовательная часть, пропорциональная числу
+токенов. Последовательно анализируются небольшие файлы, режим
+восстановления и тексты, которые tokenize_bytes не анализирует по байтам
+(не-ASCII символ вне комментария, одиночный CR, многосимвольные операции).
+"""
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import compress, repeat
+from operator import add
+from typing import List, Optional, Tuple
+
+from Kr_kp_TFYA import (CODE_ID, CODE_NUM, KEYWORDS, LONE_CR_PATTERN, OPERATORS, SEPARATORS, ByteTokenStore, Lexer,
+                        State, TokenStore)
+
+MIN_CHUNK = 2 ** 20  # Меньший кусок не окупает передачу результата между процессами
+CHUNKS_PER_JOB = 4  # Кусков больше, чем процессов: неравные по времени куски распределяются ровнее
+
+
+def comment_open(data, offset: int) -> bool:
+    """Находится ли смещение offset внутри комментария { ... }."""
+    return data.find(b"{", data.rfind(b"}", 0, offset) + 1, offset) != -1
+
+
+def split_chunks(data, count: int) -> List[Tuple[int, int]]:
+    """Не больше count кусков (начало, конец) примерно равной длины; каждый начинается со строки вне комментария."""
+    size = len(data)
+    bounds = [0]
+    for index in range(1, count):
+        bound = data.find(b"\n", max(size * index // count, bounds[-1])) + 1
+        while bound and comment_open(data, bound):
+            close = data.find(b"}", bound)
+            bound = data.find(b"\n", close) + 1 if close != -1 else 0
+        if not bound or bound >= size:
+            break
+        if bound > bounds[-1]:
+            bounds.append(bound)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def lex_chunk(filename: str, start: int, end: int, tables: Tuple[list, list, list]) -> tuple:
+    """
+    Анализирует байты [start, end) файла новым лексером. Возвращает ("error",
+    сообщение, строка, столбец, имена до ошибки) — строка считается от начала
+    куска; ("decoded",), если кусок нельзя анализировать по байтам; иначе
+    ("ok", ...) с массивами хранилища (смещения отсчитаны от начала файла)
+    и ссылками, закодированными для общей таблицы: 0 — нет ссылки,
+    1 + номер имени или 1 + число имён + номер числа куска.
+    """
+    keywords, separators, operators = tables
+    lexer = Lexer(keywords=keywords, separators=separators, operators=operators)
+    with open(filename, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        try:
+            store = lexer.tokenize_bytes(data, start, end)
+        except ValueError as error:
+            line, col = error.position
+            return "error", str(error)[:-len(f" at ({line}, {col})")], line, col, lexer.names
+        if not isinstance(store, ByteTokenStore):
+            return ("decoded",)
+        codes = store.codes
+        bases = [0] * 256  # Код токена -> сдвиг его ссылки в общей таблице
+        bases[CODE_ID] = 1
+        bases[CODE_NUM] = 1 + len(store.names)
+        refs = array("I", map(add, store.refs, map(bases.__getitem__, codes)))
+        lexemes = [None] * len(store.numbers)
+        for index in compress(range(len(codes)), map(CODE_NUM.__eq__, codes)):
+            ref = store.refs[index]
+            if lexemes[ref] is None:
+                lexemes[ref] = data[store.starts[index]:store.ends[index]]
+    return ("ok", codes, store.starts, store.ends, store.line_starts, refs, store.names, lexemes, store.numbers,
+            sorted(store.wide_lines))
+
+
+def tokenize_parallel(filename: str, jobs: int = 0, lexer: Optional[Lexer] = None, executor: Optional[Executor] = None,
+                      min_chunk: int = MIN_CHUNK) -> TokenStore:
+    """
+    Лексический анализ файла в jobs процессах (0 — по числу процессоров) или
+    в готовом пуле executor. Результат и ошибки — как у lexer.tokenize_file;
+    хранилище ссылается на отображение файла в память, пока не вызван close().
+    """
+    if lexer is None:
+        lexer = Lexer(keywords=KEYWORDS.keys(), separators=SEPARATORS.keys(), operators=OPERATORS.keys())
+    jobs = jobs or os.cpu_count() or 1
+    size = os.path.getsize(filename)
+    count = min(jobs * CHUNKS_PER_JOB, size // max(min_chunk, 1))
+    if lexer.byte_classes is None or lexer.diagnostics is not None or count < 2 or (jobs == 1 and executor is None):
+        return lexer.tokenize_file(filename)
+    with open(filename, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    chunks = split_chunks(data, count)
+    if len(chunks) < 2 or LONE_CR_PATTERN.search(data):
+        data.close()
+        return lexer.tokenize_file(filename)
+    tables = (list(lexer.keywords), list(lexer.separators), list(lexer.operators))
+    own = executor is None
+    if own:
+        executor = ProcessPoolExecutor(min(jobs, len(chunks)))
+    mark = (len(lexer.names), 0)
+    try:
+        store = ByteTokenStore(data, lexer.names)
+        number_refs = {}  # Лексема -> номер в пуле чисел хранилища
+        lines = 0  # Строк в уже склеенных кусках
+        for result in executor.map(lex_chunk, repeat(filename), *zip(*chunks), repeat(tables)):
+            if result[0] == "error":
+                _, message, line, lexer.x_coord, names = result
+                lexer.y_coord = line + lines
+                for name in names:  # Таблица имён — как после последовательного анализа до ошибки
+                    lexer.intern(name)
+                lexer.error(message)
+            if result[0] == "decoded":
+                store = lexer.restart_decoded(data, mark)
+                data.close()
+                return store
+            _, codes, starts, ends, line_starts, refs, names, lexemes, numbers, wide_lines = result
+            table = [0]
+            table.extend(map(lexer.intern, names))
+            for lexeme, number in zip(lexemes, numbers):
+                ref = number_refs.get(lexeme)
+                if ref is None:
+                    ref = number_refs[lexeme] = len(store.numbers)
+                    store.numbers.append(number)
+                table.append(ref)
+            store.codes.extend(codes)
+            store.starts.extend(starts)
+            store.ends.extend(ends)
+            store.refs.extend(map(table.__getitem__, refs))
+            store.line_starts.extend(line_starts)
+            store.wide_lines.update(line + lines for line in wide_lines)
+            lines += len(line_starts)
+    except BaseException:
+        data.close()
+        raise
+    finally:
+        if own:
+            executor.shutdown(cancel_futures=True)
+    lexer.state = State.S
+    lexer.y_coord = lines
+    return store
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Параллельный лексический анализ большого файла")
+    parser.add_argument("file")
+    parser.add_argument("--jobs", type=int, default=0, help="число процессов (по умолчанию — по числу процессоров)")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    store = tokenize_parallel(args.file, args.jobs)
+    seconds = time.perf_counter() - start
+    print(json.dumps({"tokens": len(store), "lines": len(store.line_starts), "seconds": round(seconds, 3)}))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
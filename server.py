@@ -0,0 +1,295 @@
+"""
+Сервер анализа программ: JSON по локальному сокету TCP или Unix.
+
+Запуск: python server.py [--host 127.0.0.1] [--port 8765 | --unix PATH] [--jobs N] [--max-pending N]
+                         [--timeout S] [--cache DIR]
+
+Запрос и ответ — одна строка JSON. Запрос
+{"id": 1, "source": "program p ...", "all_errors": false, "timeout": 5}
+отправляет анализ текста в пул процессов; ответ {"id": 1, "status": ...}
+содержит те же поля, что результат batch.py, но без "file". Ответы приходят
+по мере готовности, поэтому по одному соединению можно отправить несколько
+запросов подряд, не дожидаясь ответов. Запрос {"cancel": 1} отменяет запрос 1
+этого соединения, и на него приходит ответ со статусом "cancelled"; запрос,
+не выполненный за timeout секунд, получает ответ со статусом "timeout".
+id, отличный от null, не должен совпадать с id ещё не завершённого запроса
+того же соединения: такой запрос получает ответ "bad_request".
+
+Лексер с таблицами KEYWORDS, OPERATORS и SEPARATORS строится в каждом
+процессе пула один раз, при запуске сервера (batch.init_worker). Анализ идёт
+в процессах пула и не блокирует цикл событий. В пуле одновременно не больше
+max_pending запросов: пока их столько, сервер не читает новые запросы, и
+клиенты притормаживаются буферами сокетов. Отмена и тайм-аут снимают запрос
+с очереди пула; уже начатый анализ доводится до конца, а его результат
+отбрасывается.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from batch import check_source, init_worker
+
+REQUEST_LIMIT = 16 * 2 ** 20  # Наибольшая длина строки запроса или ответа в байтах
+
+
+def valid_request_id(value) -> bool:
+    """id запроса — строка, число или null: по нему ответы и отмена сопоставляются с запросами."""
+    return value is None or isinstance(value, (str, int, float))
+
+
+class AnalysisServer:
+    """
+    jobs — число процессов пула (0 — по числу процессоров); max_pending —
+    наибольшее число запросов в пуле (0 — четыре на процесс); timeout — время
+    на запрос по умолчанию, в секундах; cache_dir — каталог кэша результатов.
+    """
+
+    def __init__(self, jobs: int = 0, max_pending: int = 0, timeout: float = 10.0, cache_dir: Optional[str] = None):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.max_pending = max_pending or self.jobs * 4
+        self.timeout = timeout
+        self.cache_dir = cache_dir
+        self.executor = None
+        self.pending = None  # Семафор запросов в пуле; создаётся в цикле событий
+        self.server = None
+        self.stats = Counter()  # Статус ответа -> число ответов
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765, unix: Optional[str] = None):
+        self.executor = ProcessPoolExecutor(self.jobs, initializer=init_worker, initargs=(self.cache_dir,))
+        self.pending = asyncio.Semaphore(self.max_pending)
+        loop = asyncio.get_running_loop()
+        # Процессы пула запускаются и строят лексер до первого запроса
+        await asyncio.gather(*(loop.run_in_executor(self.executor, check_source, "") for _ in range(self.jobs)))
+        if unix is not None:
+            self.server = await asyncio.start_unix_server(self.handle, unix, limit=REQUEST_LIMIT)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port, limit=REQUEST_LIMIT)
+        return self.server
+
+    def address(self):
+        """Адрес, на котором слушает сервер (порт известен и при port=0)."""
+        return self.server.sockets[0].getsockname()
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Соединение клиента: читает запросы, пока клиент не закроет соединение."""
+        futures = {}  # id запроса (кроме null) -> future анализа в пуле, для отмены
+        running = set()  # Все future анализа соединения в пуле
+        tasks = set()  # Задачи, которые ждут анализ и отправляют ответ
+        lock = asyncio.Lock()
+
+        async def send(response: dict) -> None:
+            if writer.is_closing():
+                return  # Клиент отключился: ответ некому отправлять
+            self.stats[response["status"]] += 1
+            async with lock:
+                writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # Строка длиннее REQUEST_LIMIT: границу следующего запроса уже не найти
+                    await send({"id": None, "status": "bad_request", "message": "Request is too large"})
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    await send({"id": None, "status": "bad_request", "message": "Request is not valid JSON"})
+                    continue
+                if not isinstance(request, dict):
+                    await send({"id": None, "status": "bad_request", "message": "Request must be a JSON object"})
+                    continue
+                if "cancel" in request:
+                    if not valid_request_id(request["cancel"]):
+                        await send({"id": None, "status": "bad_request",
+                                    "message": "Field 'cancel' must be a string, number or null"})
+                        continue
+                    future = futures.get(request["cancel"])
+                    if future is not None:
+                        future.cancel()
+                    continue
+                request_id = request.get("id")
+                source = request.get("source")
+                timeout = request.get("timeout", self.timeout)
+                problem = None
+                if not valid_request_id(request_id):
+                    request_id = None
+                    problem = "Field 'id' must be a string, number or null"
+                elif not isinstance(source, str):
+                    problem = "Field 'source' must be a string"
+                elif isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+                    problem = "Field 'timeout' must be a positive number"
+                elif request_id is not None and request_id in futures:
+                    problem = "Field 'id' must differ from the ids of unfinished requests"
+                if problem is not None:
+                    await send({"id": request_id, "status": "bad_request", "message": problem})
+                    continue
+                await self.pending.acquire()  # Обратное давление: следующий запрос читается, когда в пуле есть место
+                task = None
+                try:
+                    future = asyncio.wrap_future(self.executor.submit(check_source, source,
+                                                                      bool(request.get("all_errors"))))
+                    running.add(future)
+                    if request_id is not None:
+                        futures[request_id] = future
+                    task = asyncio.create_task(self.serve(request_id, future, timeout, send))
+                except BrokenProcessPool as error:
+                    await send({"id": request_id, "status": "server_error", "message": str(error)})
+                    continue
+                finally:
+                    if task is None:  # Место в пуле освобождает serve, если задача создана
+                        self.pending.release()
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                # Отменённый или выполненный запрос больше нельзя отменить по его id
+                future.add_done_callback(running.discard)
+                future.add_done_callback(lambda done, key=request_id: futures.pop(key, None)
+                                         if futures.get(key) is done else None)
+        finally:
+            # Запросы отключившегося клиента снимаются с очереди пула
+            for future in list(running):
+                future.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self, request_id, future: asyncio.Future, timeout: float, send) -> None:
+        """Ждёт анализ запроса и отправляет ответ; отменённый future даёт ответ "cancelled"."""
+        try:
+            # Тайм-аут отменяет future, а с ним и анализ, если тот ещё не начат
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            result = {"status": "timeout", "message": f"Analysis did not finish in {timeout} s"}
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise  # Отменена сама задача: сервер останавливается
+            result = {"status": "cancelled"}
+        except BrokenProcessPool as error:
+            result = {"status": "server_error", "message": str(error)}
+        except Exception as error:  # Ошибка в процессе пула: клиент всё равно получает ответ
+            result = {"status": "server_error", "message": f"{type(error).__name__}: {error}"}
+        finally:
+            self.pending.release()
+        await send({"id": request_id, **result})
+
+
+class AnalysisClient:
+    """Клиент сервера: запросы по одному соединению, ответы сопоставляются с запросами по id."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.waiting = {}  # id запроса -> future ответа
+        self.next_id = 0
+        self.receiver = asyncio.create_task(self.receive())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 8765, unix: Optional[str] = None):
+        if unix is not None:
+            reader, writer = await asyncio.open_unix_connection(unix, limit=REQUEST_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=REQUEST_LIMIT)
+        return cls(reader, writer)
+
+    async def receive(self) -> None:
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self.waiting.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed by server"))
+            self.waiting.clear()
+
+    async def send(self, request: dict) -> None:
+        self.writer.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        await self.writer.drain()
+
+    async def submit(self, source: str, all_errors: bool = False,
+                     timeout: Optional[float] = None) -> Tuple[int, asyncio.Future]:
+        """Отправляет запрос и возвращает его id и future ответа, не дожидаясь ответа."""
+        self.next_id += 1
+        request = {"id": self.next_id, "source": source, "all_errors": all_errors}
+        if timeout is not None:
+            request["timeout"] = timeout
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[self.next_id] = future
+        await self.send(request)
+        return self.next_id, future
+
+    async def analyze(self, source: str, all_errors: bool = False, timeout: Optional[float] = None) -> dict:
+        _, future = await self.submit(source, all_errors, timeout)
+        return await future
+
+    async def cancel(self, request_id: int) -> None:
+        await self.send({"cancel": request_id})
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        await asyncio.gather(self.receiver, return_exceptions=True)
+
+
+async def serve_forever(args) -> None:
+    server = AnalysisServer(args.jobs, args.max_pending, args.timeout, args.cache)
+    await server.start(args.host, args.port, args.unix)
+    print(json.dumps({"listening": server.address(), "jobs": server.jobs, "max_pending": server.max_pending}),
+          file=sys.stderr)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Сервер анализа программ")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="слушать Unix-сокет вместо TCP")
+    parser.add_argument("--jobs", type=int, default=0, help="число процессов (по умолчанию — по числу процессоров)")
+    parser.add_argument("--max-pending", type=int, default=0, help="наибольшее число запросов в пуле")
+    parser.add_argument("--timeout", type=float, default=10.0, help="время на запрос по умолчанию, секунд")
+    parser.add_argument("--cache", metavar="DIR", help="каталог кэша результатов анализа")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve_forever(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
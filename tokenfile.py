@@ -0,0 +1,242 @@
+"""
+Двоичный формат потока токенов: результат лексического анализа передаётся
+следующим этапам без повторного анализа.
+
+Запуск: python tokenfile.py SOURCE OUTPUT
+
+Файл состоит из заголовка HEADER (сигнатура, версия, хэш таблицы кодов
+LexType, число токенов, имён и чисел), таблицы записей токенов фиксированной
+длины и пулов строк. Запись — поля RECORD_FIELDS, каждое 32-битное
+беззнаковое целое: код LexType, ссылка (номер имени идентификатора или
+номер числа), смещение и длина лексемы в исходном тексте, строка и столбец.
+Пул строк — таблица смещений и байты UTF-8: отдельно имена идентификаторов
+и лексемы чисел. Порядок байтов — little-endian.
+
+load_tokens отображает файл в память, и BinaryTokenStore читает поля записей
+через memoryview без копирования; Parser принимает его как TokenStore.
+В объекты Python превращаются только пулы строк.
+"""
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+from typing import List, Tuple
+
+from Kr_kp_TFYA import (CODE_CATEGORIES, CODE_ID, CODE_LEXEMES, CODE_NUM, ERROR_NUMBER, KEYWORDS, OPERATORS,
+                        SEPARATORS, ByteTokenStore, Lexer, StoreStream, Token, TokenStore, classify_number)
+
+MAGIC = b"TFYT"
+FORMAT_VERSION = 1  # Увеличивается при изменении формата
+HEADER = struct.Struct("<4sHH32sIIII")  # Сигнатура, версия, полей в записи, хэш кодов, токенов, имён, чисел, резерв
+RECORD_FIELDS = ("codes", "refs", "starts", "lengths", "lines", "columns")
+RECORD_SIZE = 4 * len(RECORD_FIELDS)
+LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def codes_digest() -> bytes:
+    """Хэш соответствия лексем и кодов LexType: файл, записанный с другими кодами, не читается."""
+    return hashlib.sha256(repr(sorted(CODE_LEXEMES.items())).encode("utf-8")).digest()
+
+
+def little_endian(values: array) -> bytes:
+    if not LITTLE_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def token_columns(store: TokenStore) -> array:
+    """Столбцы всех токенов хранилища."""
+    if isinstance(store, ByteTokenStore) and store.wide_lines:
+        return array("I", map(store.column, range(len(store))))
+    line_starts = store.line_starts
+    return array("I", [start - line_starts[line - 1] + 1 for start, line in zip(store.starts, store.lines)])
+
+
+def number_lexemes(store: TokenStore) -> List[str]:
+    """Лексема каждого числа из пула хранилища: по первому токену, который на него ссылается."""
+    lexemes = [None] * len(store.numbers)
+    refs = store.refs
+    for index, code in enumerate(store.codes):
+        if code == CODE_NUM and lexemes[refs[index]] is None:
+            lexemes[refs[index]] = store.value(index)
+    return lexemes
+
+
+def pack_strings(strings: List[str]) -> bytes:
+    """Пул строк: смещения (на одно больше, чем строк) и байты UTF-8, дополненные до границы 4 байт."""
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = array("I", [0])
+    total = 0
+    for item in encoded:
+        total += len(item)
+        offsets.append(total)
+    data = little_endian(offsets) + b"".join(encoded)
+    return data + bytes(-len(data) % 4)
+
+
+def dump_tokens(store: TokenStore) -> bytes:
+    """Двоичное представление хранилища токенов."""
+    count = len(store)
+    fields = len(RECORD_FIELDS)
+    records = array("I", bytes(count * RECORD_SIZE))
+    records[0::fields] = array("I", store.codes)
+    records[1::fields] = array("I", store.refs)
+    records[2::fields] = array("I", store.starts)
+    records[3::fields] = array("I", [end - start for start, end in zip(store.starts, store.ends)])
+    records[4::fields] = array("I", store.lines)
+    records[5::fields] = token_columns(store)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, fields, codes_digest(), count, len(store.names), len(store.numbers), 0)
+    return b"".join((header, little_endian(records), pack_strings(store.names), pack_strings(number_lexemes(store))))
+
+
+def write_tokens(store: TokenStore, filename: str) -> int:
+    """Записывает хранилище в файл и возвращает размер файла в байтах."""
+    data = dump_tokens(store)
+    with open(filename, "wb") as file:
+        file.write(data)
+    return len(data)
+
+
+class BinaryStoreStream(StoreStream):
+    """Поток по BinaryTokenStore: строка и столбец берутся из записи токена."""
+
+    def position(self) -> Tuple[int, int]:
+        return self.store.lines[self.pos], self.store.columns[self.pos]
+
+
+class BinaryTokenStore(TokenStore):
+    """
+    Хранилище токенов над буфером двоичного формата (bytes или mmap). Поля
+    записей — memoryview буфера с шагом в длину записи, поэтому загрузка не
+    зависит от числа токенов; исходный текст не нужен: значение токена —
+    имя идентификатора, лексема числа или лексема слова языка по коду.
+    """
+
+    def __init__(self, buffer):
+        self.source = ""
+        self.line_starts = array("I")
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.table = None
+        try:
+            self.read()
+        except ValueError:
+            self.release()
+            raise
+
+    def read(self) -> None:
+        """Проверяет заголовок и получает поля записей и пулы строк."""
+        view = self.view
+        if len(view) < HEADER.size:
+            raise ValueError("Truncated token file")
+        magic, version, fields, digest, count, names, numbers, _ = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("Not a token file")
+        if version != FORMAT_VERSION or fields != len(RECORD_FIELDS):
+            raise ValueError(f"Unsupported token file version: {version}")
+        if digest != codes_digest():
+            raise ValueError("Token file was written with different LexType codes")
+        offset = HEADER.size + count * RECORD_SIZE
+        if len(view) < offset:
+            raise ValueError("Truncated token file")
+        if LITTLE_ENDIAN:
+            self.table = view[HEADER.size:offset].cast("I")
+        else:  # Без копирования читается только файл с родным порядком байтов
+            records = array("I")
+            records.frombytes(view[HEADER.size:offset])
+            records.byteswap()
+            self.table = memoryview(records)
+        for position, name in enumerate(RECORD_FIELDS):
+            setattr(self, name, self.table[position::len(RECORD_FIELDS)])
+        self.names, offset = self.unpack_strings(offset, names)
+        self.number_lexemes, offset = self.unpack_strings(offset, numbers)
+        self.numbers = [classify_number(lexeme) or ERROR_NUMBER for lexeme in self.number_lexemes]
+
+    def unpack_strings(self, offset: int, count: int) -> Tuple[List[str], int]:
+        """Пул строк со смещения offset и смещение следующего пула."""
+        bounds_end = offset + 4 * (count + 1)
+        if len(self.view) < bounds_end:
+            raise ValueError("Truncated token file")
+        bounds = array("I")
+        bounds.frombytes(self.view[offset:bounds_end])
+        if not LITTLE_ENDIAN:
+            bounds.byteswap()
+        end = bounds_end + bounds[-1]
+        if len(self.view) < end:
+            raise ValueError("Truncated token file")
+        data = self.view[bounds_end:end].tobytes()
+        strings = [data[start:stop].decode("utf-8") for start, stop in zip(bounds, bounds[1:])]
+        return strings, end + -(end - offset) % 4
+
+    @property
+    def ends(self) -> array:
+        return array("I", [start + length for start, length in zip(self.starts, self.lengths)])
+
+    def value(self, index: int) -> str:
+        code = self.codes[index]
+        if code == CODE_ID:
+            return self.names[self.refs[index]]
+        if code == CODE_NUM:
+            return self.number_lexemes[self.refs[index]]
+        return CODE_LEXEMES[code]
+
+    def column(self, index: int) -> int:
+        return self.columns[index]
+
+    def to_tokens(self) -> List[Token]:
+        numbers = self.numbers
+        return [
+            Token(CODE_CATEGORIES[code], self.value(index), column, line, code,
+                  ref if code == CODE_ID else None, numbers[ref] if code == CODE_NUM else None)
+            for index, (code, ref, line, column) in enumerate(zip(self.codes, self.refs, self.lines, self.columns))
+        ]
+
+    def cursor(self) -> StoreStream:
+        return BinaryStoreStream(self)
+
+    def release(self) -> None:
+        """Освобождает представления буфера: после этого буфер можно закрыть."""
+        if self.table is not None:
+            for name in RECORD_FIELDS:
+                getattr(self, name).release()
+            self.table.release()
+        self.view.release()
+
+    def close(self) -> None:
+        """Освобождает представления буфера и закрывает отображение файла в память."""
+        self.release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+def load_tokens(filename: str) -> BinaryTokenStore:
+    """Хранилище токенов из файла, отображённого в память; отображение закрывает close()."""
+    with open(filename, "rb") as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Пустой файл отобразить нельзя
+            raise ValueError("Truncated token file") from None
+    try:
+        return BinaryTokenStore(data)
+    except ValueError:
+        data.close()
+        raise
+
+
+def main(argv=None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) != 2:
+        print("Запуск: python tokenfile.py SOURCE OUTPUT", file=sys.stderr)
+        return 2
+    lexer = Lexer(keywords=KEYWORDS.keys(), separators=SEPARATORS.keys(), operators=OPERATORS.keys())
+    store = lexer.tokenize_file(args[0])
+    size = write_tokens(store, args[1])
+    store.close()
+    print(f"{len(store)} tokens, {size} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
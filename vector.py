@@ -0,0 +1,331 @@
+"""
+Выполнение одной программы сразу на многих наборах входных данных (NumPy).
+
+Каждая переменная dim ... as integer/real/boolean становится столбцом
+int64/float64/bool длиной в число дорожек (lanes); дорожка — один запуск
+программы со своей строкой входных данных. Выражения вычисляются
+поэлементно над столбцами, if выполняет ветви под масками дорожек, а while
+и for повторяют тело, пока в цикле остаётся хотя бы одна дорожка.
+Ошибка выполнения (деление на ноль, нехватка входных данных) завершает
+только свою дорожку: её строка и сообщение сохраняются, а остальные
+дорожки выполняются дальше.
+
+Отличия от VM: целые — int64, и переполнение не проверяется; значения для
+read — числа, для переменных boolean — 0 и 1 (или массив bool).
+NumPy нужен только для этого режима; без него модуль импортируется,
+а VectorExecutor вызывает ImportError.
+"""
+from typing import Dict, Iterator, List, Optional
+
+from ast_nodes import (Assign, Binary, Block, Boolean, CompoundExpr, Declare, For, If, Number, Read, Unary, Variable,
+                       While, Write)
+from Kr_kp_TFYA import OPERATORS
+from vm import ExecutionError, format_value
+
+try:
+    import numpy as np
+except ImportError:  # NumPy нужен только для векторного выполнения
+    np = None
+
+DTYPES = {"INT": "int64", "REAL": "float64", "BOOL": "bool"}
+
+CODE_PLUS = OPERATORS["plus"].value
+CODE_MIN = OPERATORS["min"].value
+CODE_MULT = OPERATORS["mult"].value
+CODE_DIV = OPERATORS["div"].value
+CODE_AND = OPERATORS["and"].value
+CODE_OR = OPERATORS["or"].value
+# Операции, которые вычисляются одной функцией NumPy без проверок
+ELEMENTWISE = {
+    CODE_PLUS: "add",
+    CODE_MIN: "subtract",
+    CODE_MULT: "multiply",
+    CODE_AND: "logical_and",
+    CODE_OR: "logical_or",
+    OPERATORS["EQ"].value: "equal",
+    OPERATORS["NE"].value: "not_equal",
+    OPERATORS["LT"].value: "less",
+    OPERATORS["LE"].value: "less_equal",
+    OPERATORS["GT"].value: "greater",
+    OPERATORS["GE"].value: "greater_equal",
+}
+
+
+class VectorRun:
+    """
+    Результат VectorExecutor.run: columns — итоговые значения переменных по
+    имени, writes — выводы write как пары (номера дорожек, столбцы значений),
+    error_lines — строка ошибки каждой дорожки (0 — дорожка завершилась без ошибки).
+    """
+
+    def __init__(self, lanes: int, columns: Dict[str, "np.ndarray"], writes: list, error_lines: "np.ndarray",
+                 error_codes: "np.ndarray", messages: List[Optional[str]]):
+        self.lanes = lanes
+        self.columns = columns
+        self.writes = writes
+        self.error_lines = error_lines
+        self.error_codes = error_codes
+        self.messages = messages
+
+    @property
+    def failed(self) -> "np.ndarray":
+        """Маска дорожек, завершившихся ошибкой."""
+        return self.error_codes != 0
+
+    def error(self, lane: int) -> Optional[str]:
+        """Сообщение об ошибке дорожки в том же виде, что str(ExecutionError) у VM, или None."""
+        code = self.error_codes[lane]
+        if not code:
+            return None
+        return str(ExecutionError(self.messages[code], int(self.error_lines[lane])))
+
+    def output(self, lane: int) -> List[str]:
+        """Строки вывода дорожки, как VM.run для её входных данных."""
+        lines = []
+        for rows, values in self.writes:
+            position = np.searchsorted(rows, lane)
+            if position < len(rows) and rows[position] == lane:
+                lines.append(" ".join(format_value(column[position].item()) for column in values))
+        return lines
+
+
+class VectorExecutor:
+    """Выполняет дерево Program над столбцами NumPy: один запуск на дорожку."""
+
+    def __init__(self, program):
+        if np is None:
+            raise ImportError("Vectorized execution requires NumPy")
+        self.program = program
+        self.statements = {
+            Declare: self.exec_declare,
+            Assign: self.exec_assign,
+            If: self.exec_if,
+            While: self.exec_while,
+            For: self.exec_for,
+            Read: self.exec_read,
+            Write: self.exec_write,
+            Block: self.exec_block,
+        }
+        self.functions = {code: getattr(np, name) for code, name in ELEMENTWISE.items()}
+
+    def run(self, inputs=None, lanes: Optional[int] = None) -> VectorRun:
+        """
+        inputs — двумерный массив: строка на дорожку, значения read по порядку;
+        одномерный массив — одно значение на дорожку. Без inputs число дорожек
+        задаёт lanes (по умолчанию 1).
+        """
+        if inputs is None:
+            self.inputs = np.zeros((lanes or 1, 0))
+        else:
+            self.inputs = np.asarray(inputs)
+            if self.inputs.ndim == 1:
+                self.inputs = self.inputs.reshape(-1, 1)
+        count = self.inputs.shape[0]
+        self.lanes = count
+        self.columns = {var: np.zeros(count, DTYPES[var.var_type]) for var in self.program.symbols}
+        self.cursor = np.zeros(count, "int64")  # Номер следующего значения read каждой дорожки
+        self.alive = np.ones(count, "bool")  # Дорожки без ошибок
+        self.error_lines = np.zeros(count, "int32")
+        self.error_codes = np.zeros(count, "int16")
+        self.messages = [None]
+        self.message_codes = {}
+        self.failures = 0
+        self.writes = []
+        self.line = 0
+        try:
+            with np.errstate(all="ignore"):  # Деление на ноль и NaN проверяются по дорожкам
+                self.exec_body(self.program.body, self.alive.copy())
+        except OverflowError:  # Целая константа вне диапазона int64
+            raise ExecutionError("Numeric overflow", self.line) from None
+        columns = {var.var_name: column for var, column in self.columns.items()}
+        return VectorRun(count, columns, self.writes, self.error_lines, self.error_codes, self.messages)
+
+    def fail(self, mask, message: str) -> None:
+        """Завершает ошибкой message дорожки mask, ещё не завершённые ошибкой."""
+        mask = mask & self.alive
+        if not mask.any():
+            return
+        code = self.message_codes.get(message)
+        if code is None:
+            code = self.message_codes[message] = len(self.messages)
+            self.messages.append(message)
+        self.error_lines[mask] = self.line
+        self.error_codes[mask] = code
+        self.alive &= ~mask
+        self.failures += 1
+
+    def live(self, active):
+        """active без дорожек, завершённых ошибкой; пока ошибок не было, маска не пересчитывается."""
+        return active & self.alive if self.failures else active
+
+    def exec_body(self, body, active) -> None:
+        """
+        Выполняет body на дорожках active без рекурсии по вложенности, как
+        vm.Compiler.compile_body: обработчики if, while, for и блоков —
+        генераторы, которые отдают вложенные тела (генераторы body_steps).
+        """
+        stack = [self.body_steps(body, active)]
+        while stack:
+            nested = next(stack[-1], None)
+            if nested is None:
+                stack.pop()
+            else:
+                stack.append(nested)
+
+    def body_steps(self, body, active) -> Iterator:
+        for statement in body:
+            active = self.live(active)
+            if not active.any():
+                return
+            self.line = statement.line
+            steps = self.statements[type(statement)](statement, active)
+            if steps is not None:
+                yield from steps
+
+    def exec_block(self, node, active) -> Iterator:
+        yield self.body_steps(node.body, active)
+
+    def exec_declare(self, node, active) -> None:
+        for var in node.vars:
+            column = self.columns[var]
+            np.copyto(column, column.dtype.type(0), where=active)
+
+    def store(self, var, value, value_type: str, active) -> None:
+        """Присваивание дорожкам active с приведением числового типа, как в VM."""
+        if var.var_type == "INT" and value_type == "REAL":
+            value = self.to_int(value, active)
+        np.copyto(self.columns[var], value, where=self.live(active), casting="unsafe")
+
+    def to_int(self, value, active):
+        """Отбрасывание дробной части; бесконечность, NaN и значения вне int64 завершают дорожку ошибкой."""
+        value = np.asarray(value, "float64")
+        self.fail(active & np.isnan(value), "cannot convert float NaN to integer")
+        in_range = (value >= -2.0 ** 63) & (value < 2.0 ** 63)
+        self.fail(active & ~in_range & ~np.isnan(value), "Numeric overflow")
+        return np.trunc(np.where(in_range, value, 0.0)).astype("int64")
+
+    def exec_assign(self, node, active) -> None:
+        self.store(node.var, self.eval(node.expr, active), node.expr.type, active)
+
+    def condition(self, cond, active):
+        """Маска дорожек active, на которых условие истинно."""
+        return self.live(active & self.eval(cond, active))
+
+    def exec_if(self, node, active) -> Iterator:
+        taken = self.condition(node.cond, active)
+        skipped = self.live(active) & ~taken
+        if node.then_body and taken.any():
+            yield self.body_steps(node.then_body, taken)
+        if node.else_body and skipped.any():
+            yield self.body_steps(node.else_body, skipped)
+
+    def exec_while(self, node, active) -> Iterator:
+        running = self.condition(node.cond, active)
+        while running.any():
+            yield self.body_steps(node.body, running)
+            self.line = node.line
+            running = self.condition(node.cond, running)
+
+    def exec_for(self, node, active) -> Iterator:
+        """Граница вычисляется один раз, как в VM (копия: тело может изменить переменные выражения)."""
+        self.store(node.var, self.eval(node.start, active), node.start.type, active)
+        stop = np.array(self.eval(node.stop, active))
+        counter = self.columns[node.var]
+        running = self.live(active) & (counter <= stop)
+        while running.any():
+            yield self.body_steps(node.body, running)
+            self.line = node.line
+            running = self.live(running)
+            np.add(counter, 1, out=counter, where=running)
+            running &= counter <= stop
+
+    def exec_read(self, node, active) -> None:
+        inputs = self.inputs
+        for var in node.vars:
+            active = self.live(active)
+            self.fail(active & (self.cursor >= inputs.shape[1]), "Input exhausted")
+            rows = np.flatnonzero(self.live(active))
+            if not len(rows):
+                return
+            values = inputs[rows, self.cursor[rows]]
+            self.cursor[rows] += 1
+            if var.var_type == "BOOL":
+                self.fail(self.lane_mask(rows[(values != 0) & (values != 1)]), "Invalid boolean input")
+                values = values.astype("bool")
+            elif var.var_type == "INT" and values.dtype.kind == "f":
+                scattered = np.zeros(self.lanes)
+                scattered[rows] = values
+                values = self.to_int(scattered, self.lane_mask(rows))[rows]
+            keep = self.alive[rows]  # Значение с ошибкой преобразования не присваивается
+            self.columns[var][rows[keep]] = values[keep]
+
+    def lane_mask(self, rows):
+        mask = np.zeros(self.lanes, "bool")
+        mask[rows] = True
+        return mask
+
+    def exec_write(self, node, active) -> None:
+        values = [self.eval(expr, active) for expr in node.exprs]
+        rows = np.flatnonzero(self.live(active))
+        if len(rows):
+            self.writes.append((rows, [np.broadcast_to(value, self.lanes)[rows] for value in values]))
+
+    def eval(self, expr, active):
+        """
+        Значение выражения для всех дорожек (массив или скаляр NumPy); ошибки
+        записываются для active. Дерево обходится без рекурсии: операнды
+        вычисляются раньше операций, их значения лежат в стеке values.
+        """
+        values = []
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            node_type = type(node)
+            if node_type is Variable:
+                values.append(self.columns[node.var])
+            elif node_type is Number:
+                values.append(np.int64(node.value) if node.type == "INT" else np.float64(node.value))
+            elif node_type is Boolean:
+                values.append(np.bool_(node.value))
+            elif not ready:
+                stack.append((node, True))
+                if node_type is Binary:
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+                elif node_type is Unary:
+                    stack.append((node.operand, False))
+                elif node_type is CompoundExpr:
+                    stack.extend((item, False) for item in reversed(node.items))
+                else:
+                    raise TypeError(f"Unknown expression node: {node!r}")
+            elif node_type is Binary:
+                right = values.pop()
+                left = values.pop()
+                if node.op == CODE_DIV:
+                    values.append(self.divide(left, right, node.type == "INT", active))
+                else:
+                    values.append(self.functions[node.op](left, right))
+            elif node_type is Unary:
+                values.append(np.logical_not(values.pop()))
+            else:
+                # Все элементы уже вычислены по порядку, значение — последний
+                last = values[-1]
+                del values[-len(node.items):]
+                values.append(last)
+        return values[0]
+
+    def divide(self, left, right, integer: bool, active):
+        """div: деление нацело с отбрасыванием дробной части для integer, иначе обычное."""
+        zero = right == 0
+        if zero.any():
+            self.fail(active & zero, "Division by zero")
+            right = np.where(zero, 1, right)
+        if not integer:
+            return np.true_divide(left, right)
+        quotient = np.abs(left) // np.abs(right)
+        return np.where((left < 0) != (right < 0), -quotient, quotient)
+
+
+def run_vectorized(program, inputs=None, lanes: Optional[int] = None) -> VectorRun:
+    """VectorExecutor(program).run(inputs, lanes)."""
+    return VectorExecutor(program).run(inputs, lanes)
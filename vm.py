@@ -0,0 +1,523 @@
+"""
+Компилятор дерева программы в байт-код и стековая виртуальная машина.
+
+Байт-код — плоский массив array("i") из пар (операция, аргумент); аргумент —
+номер константы, номер ячейки переменной или номер команды для перехода.
+Ячейки переменных назначаются при компиляции по объявлениям VarToken,
+поэтому во время выполнения имена переменных не ищутся.
+"""
+from array import array
+from typing import Iterable, Iterator, List, Tuple
+
+from ast_nodes import (Assign, Binary, Block, Boolean, CompoundExpr, Declare, For, If, Number, Read, Unary, Variable,
+                       While, Write)
+from Kr_kp_TFYA import OPERATORS, classify_number
+
+# Коды операций виртуальной машины
+(LOAD_CONST, LOAD_VAR, STORE_VAR, ADD, SUB, MUL, DIV_INT, DIV_REAL, AND, OR, NOT,
+ EQ, NE, LT, LE, GT, GE, TO_INT, TO_REAL, JUMP, JUMP_IF_FALSE, READ, WRITE, POP, HALT,
+ JUMP_IF_NOT_LT, JUMP_IF_NOT_LE, JUMP_IF_NOT_GT, JUMP_IF_NOT_GE, JUMP_IF_NOT_EQ, JUMP_IF_NOT_NE,
+ INC_VAR, ADD_CONST, SUB_CONST, MUL_CONST, ADD_VAR, SUB_VAR, MUL_VAR) = range(38)
+
+OPCODE_NAMES = [
+    "LOAD_CONST", "LOAD_VAR", "STORE_VAR", "ADD", "SUB", "MUL", "DIV_INT", "DIV_REAL", "AND", "OR", "NOT",
+    "EQ", "NE", "LT", "LE", "GT", "GE", "TO_INT", "TO_REAL", "JUMP", "JUMP_IF_FALSE", "READ", "WRITE", "POP", "HALT",
+    "JUMP_IF_NOT_LT", "JUMP_IF_NOT_LE", "JUMP_IF_NOT_GT", "JUMP_IF_NOT_GE", "JUMP_IF_NOT_EQ", "JUMP_IF_NOT_NE",
+    "INC_VAR", "ADD_CONST", "SUB_CONST", "MUL_CONST", "ADD_VAR", "SUB_VAR", "MUL_VAR",
+]
+
+# Коды операций VM для бинарных операций языка
+BINARY_OPCODES = {
+    OPERATORS["plus"].value: ADD,
+    OPERATORS["min"].value: SUB,
+    OPERATORS["mult"].value: MUL,
+    OPERATORS["and"].value: AND,
+    OPERATORS["or"].value: OR,
+    OPERATORS["EQ"].value: EQ,
+    OPERATORS["NE"].value: NE,
+    OPERATORS["LT"].value: LT,
+    OPERATORS["LE"].value: LE,
+    OPERATORS["GT"].value: GT,
+    OPERATORS["GE"].value: GE,
+}
+CODE_DIV = OPERATORS["div"].value
+
+# Сравнение, за которым следует JUMP_IF_FALSE, заменяется одной командой перехода
+COMPARE_JUMPS = {
+    LT: JUMP_IF_NOT_LT, LE: JUMP_IF_NOT_LE, GT: JUMP_IF_NOT_GT,
+    GE: JUMP_IF_NOT_GE, EQ: JUMP_IF_NOT_EQ, NE: JUMP_IF_NOT_NE,
+}
+
+# Арифметика, правый операнд которой — константа или переменная, выполняется одной командой
+CONST_OPERAND_OPCODES = {ADD: ADD_CONST, SUB: SUB_CONST, MUL: MUL_CONST}
+VAR_OPERAND_OPCODES = {ADD: ADD_VAR, SUB: SUB_VAR, MUL: MUL_VAR}
+
+DEFAULT_VALUES = {"INT": 0, "REAL": 0.0, "BOOL": False}
+
+
+class ExecutionError(RuntimeError):
+    """Ошибка времени выполнения: деление на ноль, нехватка или неверный формат входных данных."""
+
+    def __init__(self, message: str, line: int = 0):
+        super().__init__(f"{message} at line {line}" if line else message)
+        self.line = line
+
+
+def truncate_div(left: int, right: int) -> int:
+    """Деление нацело с отбрасыванием дробной части, как div в Pascal."""
+    quotient = abs(left) // abs(right)
+    return -quotient if (left < 0) != (right < 0) else quotient
+
+
+def format_value(value) -> str:
+    """Запись значения в выводе программы: true/false для boolean, иначе число."""
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    return str(value)
+
+
+def convert_input(var_type: str, value):
+    """
+    Приводит входное значение к типу переменной. Строки разбираются как
+    числовые литералы языка (101B, 0FFH, 1.5e3) или как true/false.
+    При неверном значении вызывает ValueError.
+    """
+    if isinstance(value, str):
+        text = value.strip()
+        if var_type == "BOOL":
+            if text in ("true", "false"):
+                return text == "true"
+            raise ValueError(f"Invalid boolean input: {value!r}")
+        number = classify_number(text)
+        if number is None:
+            raise ValueError(f"Invalid number input: {value!r}")
+        value = number[1]
+    elif var_type == "BOOL":
+        if isinstance(value, bool):
+            return value
+        raise ValueError(f"Invalid boolean input: {value!r}")
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid number input: {value!r}")
+    return int(value) if var_type == "INT" else float(value)
+
+
+class Bytecode:
+    """Результат компиляции: команды, пул констант и описание ячеек переменных."""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.code = array("i")  # Пары (операция, аргумент)
+        self.lines = array("I")  # Строка исходного текста для каждой команды
+        self.constants = []
+        self.constant_ids = {}
+        self.slot_names = []
+        self.slot_types = []
+
+    def __len__(self) -> int:
+        """Количество команд."""
+        return len(self.lines)
+
+    def constant(self, value) -> int:
+        # Тип входит в ключ, чтобы true не совпало с 1, а 1 — с 1.0
+        key = (type(value), value)
+        index = self.constant_ids.get(key)
+        if index is None:
+            index = self.constant_ids[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def slot(self, name: str, var_type: str) -> int:
+        self.slot_names.append(name)
+        self.slot_types.append(var_type)
+        return len(self.slot_names) - 1
+
+    def emit(self, op: int, arg: int = 0, line: int = 0) -> int:
+        """Добавляет команду и возвращает её номер."""
+        self.code.append(op)
+        self.code.append(arg)
+        self.lines.append(line)
+        return len(self.lines) - 1
+
+    def patch(self, address: int, target: int) -> None:
+        """Записывает номер команды перехода в ранее добавленную команду."""
+        self.code[2 * address + 1] = target
+
+    def instructions(self) -> List[Tuple[int, int]]:
+        """Команды парами (операция, аргумент)."""
+        code = self.code
+        return list(zip(code[::2], code[1::2]))
+
+    def disassemble(self) -> str:
+        rows = []
+        for address, (op, arg) in enumerate(self.instructions()):
+            if op in (LOAD_CONST, ADD_CONST, SUB_CONST, MUL_CONST):
+                detail = repr(self.constants[arg])
+            elif op in (LOAD_VAR, STORE_VAR, READ, INC_VAR, ADD_VAR, SUB_VAR, MUL_VAR):
+                detail = self.slot_names[arg]
+            else:
+                detail = str(arg)
+            rows.append(f"{address:5d} {OPCODE_NAMES[op]:<16} {detail}")
+        return "\n".join(rows)
+
+
+class Compiler:
+    """Переводит дерево Program в Bytecode."""
+
+    def __init__(self):
+        self.bytecode = None
+        self.slots = {}  # Объявление VarToken -> номер ячейки
+        self.line = 0
+        self.statements = {
+            Declare: self.compile_declare,
+            Assign: self.compile_assign,
+            If: self.compile_if,
+            While: self.compile_while,
+            For: self.compile_for,
+            Read: self.compile_read,
+            Write: self.compile_write,
+            Block: self.compile_body_node,
+        }
+
+    def compile(self, program) -> Bytecode:
+        self.bytecode = Bytecode(program.name)
+        self.slots = {var: self.bytecode.slot(var.var_name, var.var_type) for var in program.symbols}
+        self.compile_body(program.body)
+        self.emit(HALT)
+        return self.bytecode
+
+    def emit(self, op: int, arg: int = 0) -> int:
+        return self.bytecode.emit(op, arg, self.line)
+
+    def compile_body(self, body) -> None:
+        """
+        Команды операторов body без рекурсии по вложенности. Обработчики
+        составных операторов — генераторы: они отдают вложенное тело
+        (генератор body_steps) и продолжаются, когда оно скомпилировано.
+        """
+        stack = [self.body_steps(body)]
+        while stack:
+            nested = next(stack[-1], None)
+            if nested is None:
+                stack.pop()
+            else:
+                stack.append(nested)
+
+    def body_steps(self, body) -> Iterator:
+        """Компилирует простые операторы body; для составных отдаёт генераторы их вложенных тел."""
+        for statement in body:
+            self.line = statement.line
+            steps = self.statements[type(statement)](statement)
+            if steps is not None:
+                yield from steps
+
+    def compile_body_node(self, node) -> Iterator:
+        yield self.body_steps(node.body)
+
+    def compile_declare(self, node) -> None:
+        for var in node.vars:
+            self.emit(LOAD_CONST, self.bytecode.constant(DEFAULT_VALUES[var.var_type]))
+            self.emit(STORE_VAR, self.slots[var])
+
+    def compile_store(self, var, expr) -> None:
+        """Вычисляет expr и сохраняет в переменную с приведением числового типа."""
+        self.compile_expr(expr)
+        if var.var_type == "INT" and expr.type == "REAL":
+            self.emit(TO_INT)
+        elif var.var_type == "REAL" and expr.type == "INT":
+            self.emit(TO_REAL)
+        self.emit(STORE_VAR, self.slots[var])
+
+    def compile_assign(self, node) -> None:
+        self.compile_store(node.var, node.expr)
+
+    def compile_jump_if_false(self, cond) -> int:
+        """Условный переход по cond; возвращает адрес команды для последующего patch."""
+        if isinstance(cond, Binary) and BINARY_OPCODES.get(cond.op) in COMPARE_JUMPS:
+            self.compile_expr(cond.left)
+            self.compile_expr(cond.right)
+            return self.emit(COMPARE_JUMPS[BINARY_OPCODES[cond.op]])
+        self.compile_expr(cond)
+        return self.emit(JUMP_IF_FALSE)
+
+    def compile_if(self, node) -> Iterator:
+        bytecode = self.bytecode
+        jump_else = self.compile_jump_if_false(node.cond)
+        yield self.body_steps(node.then_body)
+        if node.else_body:
+            jump_end = self.emit(JUMP)
+            bytecode.patch(jump_else, len(bytecode))
+            yield self.body_steps(node.else_body)
+            bytecode.patch(jump_end, len(bytecode))
+        else:
+            bytecode.patch(jump_else, len(bytecode))
+
+    def compile_while(self, node) -> Iterator:
+        bytecode = self.bytecode
+        start = len(bytecode)
+        jump_end = self.compile_jump_if_false(node.cond)
+        yield self.body_steps(node.body)
+        self.line = node.line
+        self.emit(JUMP, start)
+        bytecode.patch(jump_end, len(bytecode))
+
+    def compile_for(self, node) -> Iterator:
+        """Граница цикла вычисляется один раз и хранится в скрытой ячейке."""
+        bytecode = self.bytecode
+        counter = self.slots[node.var]
+        stop = bytecode.slot(f"${node.var.var_name}_stop{len(bytecode.slot_names)}", node.stop.type)
+        self.compile_store(node.var, node.start)
+        self.compile_expr(node.stop)
+        self.emit(STORE_VAR, stop)
+        start = len(bytecode)
+        self.emit(LOAD_VAR, counter)
+        self.emit(LOAD_VAR, stop)
+        jump_end = self.emit(JUMP_IF_NOT_LE)
+        yield self.body_steps(node.body)
+        self.line = node.line
+        self.emit(INC_VAR, counter)
+        self.emit(JUMP, start)
+        bytecode.patch(jump_end, len(bytecode))
+
+    def compile_read(self, node) -> None:
+        for var in node.vars:
+            self.emit(READ, self.slots[var])
+
+    def compile_write(self, node) -> None:
+        for expr in node.exprs:
+            self.compile_expr(expr)
+        self.emit(WRITE, len(node.exprs))
+
+    def compile_expr(self, expr) -> None:
+        """
+        Команды вычисления expr. Дерево обходится без рекурсии: в стеке лежат
+        узлы и отложенные команды (операция, операнд), где операнд — None,
+        Number для команд *_CONST или Variable для команд *_VAR.
+        """
+        emit = self.emit
+        stack = [expr]
+        while stack:
+            node = stack.pop()
+            node_type = type(node)
+            if node_type is tuple:
+                op, operand = node
+                if operand is None:
+                    emit(op)
+                elif type(operand) is Number:
+                    emit(op, self.bytecode.constant(operand.value))
+                else:
+                    emit(op, self.slots[operand.var])
+            elif node_type is Binary:
+                right = node.right
+                if node.op == CODE_DIV:
+                    stack.append((DIV_INT if node.type == "INT" else DIV_REAL, None))
+                    stack.append(right)
+                else:
+                    op = BINARY_OPCODES[node.op]
+                    right_type = type(right)
+                    if op in CONST_OPERAND_OPCODES and right_type is Number:
+                        stack.append((CONST_OPERAND_OPCODES[op], right))
+                    elif op in VAR_OPERAND_OPCODES and right_type is Variable:
+                        stack.append((VAR_OPERAND_OPCODES[op], right))
+                    else:
+                        stack.append((op, None))
+                        stack.append(right)
+                stack.append(node.left)
+            elif node_type is Variable:
+                emit(LOAD_VAR, self.slots[node.var])
+            elif node_type is Number or node_type is Boolean:
+                emit(LOAD_CONST, self.bytecode.constant(node.value))
+            elif node_type is Unary:
+                stack.append((NOT, None))
+                stack.append(node.operand)
+            elif node_type is CompoundExpr:
+                items = node.items
+                stack.append(items[-1])
+                for item in reversed(items[:-1]):
+                    stack.append((POP, None))
+                    stack.append(item)
+            else:
+                raise TypeError(f"Unknown expression node: {node!r}")
+
+
+def compile_program(program) -> Bytecode:
+    return Compiler().compile(program)
+
+
+class CountingList(list):
+    """Список команд, считающий обращения: так VM считает выполненные команды без проверок в основном цикле."""
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.reads = 0
+
+    def __getitem__(self, index):
+        self.reads += 1
+        return list.__getitem__(self, index)
+
+
+class VM:
+    """
+    Стековая машина для Bytecode. Команды перед выполнением распаковываются
+    в список пар (операция, аргумент), а вершина стека хранится в локальной
+    переменной top: большинству команд хватает одной операции со списком стека.
+    """
+
+    def __init__(self, bytecode: Bytecode):
+        self.bytecode = bytecode
+        self.instructions = bytecode.instructions()
+        self.constants = list(bytecode.constants)
+        self.defaults = [DEFAULT_VALUES[var_type] for var_type in bytecode.slot_types]
+        self.slots = []
+        self.output = []
+        self.pc = 0
+        self.executed = 0  # Выполнено команд за последний запуск (только при count=True)
+
+    def run(self, inputs: Iterable = (), count: bool = False) -> List[str]:
+        """
+        Выполняет программу; read берёт значения из inputs, каждый write
+        добавляет строку в self.output. Возвращает self.output.
+        """
+        self.output = []
+        self.slots = list(self.defaults)
+        instructions = CountingList(self.instructions) if count else self.instructions
+        try:
+            self.execute(instructions, iter(inputs))
+        except ZeroDivisionError:
+            raise ExecutionError("Division by zero", self.current_line()) from None
+        except OverflowError:
+            raise ExecutionError("Numeric overflow", self.current_line()) from None
+        except ValueError as error:
+            raise ExecutionError(str(error), self.current_line()) from None
+        if count:
+            self.executed = instructions.reads
+        return self.output
+
+    def current_line(self) -> int:
+        """Строка исходного текста команды, на которой остановилось выполнение."""
+        lines = self.bytecode.lines
+        address = self.pc - 1
+        return lines[address] if 0 <= address < len(lines) else 0
+
+    def execute(self, instructions, inputs) -> None:
+        constants = self.constants
+        slots = self.slots
+        slot_types = self.bytecode.slot_types
+        write = self.output.append
+        stack = [None]  # Дно стека: top можно снимать без проверки на пустоту
+        push = stack.append
+        pop = stack.pop
+        top = None
+        pc = 0
+        # Ветви упорядочены по частоте команд в типичных циклах
+        while True:
+            op, arg = instructions[pc]
+            pc += 1
+            if op == LOAD_VAR:
+                push(top)
+                top = slots[arg]
+            elif op == LOAD_CONST:
+                push(top)
+                top = constants[arg]
+            elif op == STORE_VAR:
+                slots[arg] = top
+                top = pop()
+            elif op == ADD_CONST:
+                top = top + constants[arg]
+            elif op == JUMP:
+                pc = arg
+            elif op == ADD:
+                top = pop() + top
+            elif op == JUMP_IF_NOT_LE:
+                if not pop() <= top:
+                    pc = arg
+                top = pop()
+            elif op == JUMP_IF_NOT_LT:
+                if not pop() < top:
+                    pc = arg
+                top = pop()
+            elif op == JUMP_IF_NOT_GE:
+                if not pop() >= top:
+                    pc = arg
+                top = pop()
+            elif op == JUMP_IF_NOT_GT:
+                if not pop() > top:
+                    pc = arg
+                top = pop()
+            elif op == JUMP_IF_NOT_EQ:
+                if not pop() == top:
+                    pc = arg
+                top = pop()
+            elif op == JUMP_IF_NOT_NE:
+                if not pop() != top:
+                    pc = arg
+                top = pop()
+            elif op == ADD_VAR:
+                top = top + slots[arg]
+            elif op == MUL_CONST:
+                top = top * constants[arg]
+            elif op == MUL_VAR:
+                top = top * slots[arg]
+            elif op == MUL:
+                top = pop() * top
+            elif op == SUB_CONST:
+                top = top - constants[arg]
+            elif op == SUB_VAR:
+                top = top - slots[arg]
+            elif op == SUB:
+                top = pop() - top
+            elif op == INC_VAR:
+                slots[arg] += 1
+            elif op == JUMP_IF_FALSE:
+                if not top:
+                    pc = arg
+                top = pop()
+            elif op == DIV_REAL:
+                self.pc = pc
+                top = pop() / top
+            elif op == DIV_INT:
+                self.pc = pc
+                top = truncate_div(pop(), top)
+            elif op == LT:
+                top = pop() < top
+            elif op == LE:
+                top = pop() <= top
+            elif op == GT:
+                top = pop() > top
+            elif op == GE:
+                top = pop() >= top
+            elif op == EQ:
+                top = pop() == top
+            elif op == NE:
+                top = pop() != top
+            elif op == AND:
+                top = pop() and top
+            elif op == OR:
+                top = pop() or top
+            elif op == NOT:
+                top = not top
+            elif op == TO_INT:
+                self.pc = pc
+                top = int(top)
+            elif op == TO_REAL:
+                top = float(top)
+            elif op == POP:
+                top = pop()
+            elif op == READ:
+                self.pc = pc
+                value = next(inputs, None)
+                if value is None:
+                    raise ExecutionError("Input exhausted", self.current_line())
+                slots[arg] = convert_input(slot_types[arg], value)
+            elif op == WRITE:
+                start = len(stack) - arg + 1
+                values = stack[start:]
+                values.append(top)
+                del stack[start:]
+                write(" ".join(map(format_value, values)))
+                top = pop()
+            elif op == HALT:
+                return
+            else:
+                raise ExecutionError(f"Unknown opcode {op}")